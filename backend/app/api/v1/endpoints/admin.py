@@ -0,0 +1,39 @@
+"""管理者向けのエンドポイントを定義するモジュール"""
+
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.core.mongodb_core import db
+from app.core.security import require_auth, get_current_user
+from app.utils.export_utils import EXPORT_FORMATS, create_submission_query, stream_submissions
+from app.utils.log_utils import logging
+
+api_router = APIRouter()
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+@api_router.get("/export-submissions")
+@require_auth(roles=["admin"])
+async def export_submissions(
+    export_format: str = Query("ndjson", alias="format", description="ndjson または csv"),
+    created_from: Optional[datetime] = Query(None, alias="from", description="この日時以降に作成された提出物（ISO 8601）"),
+    created_to: Optional[datetime] = Query(None, alias="to", description="この日時より前に作成された提出物（ISO 8601）"),
+    challenge_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """提出物を分析用にストリーミングでエクスポートするエンドポイント"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported export format.")
+
+    query = create_submission_query(created_from, created_to, challenge_id)
+    logging("Submissions exported: ", current_user["sub"], export_format, query)
+
+    return StreamingResponse(
+        stream_submissions(db.iter_submissions(query), export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="submissions.{export_format}"'},
+    )
@@ -6,7 +6,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer
 import dotenv
 
-from app.core.security import create_access_token, create_refresh_token, verify_password, get_current_user
+from app.core.security import create_access_token, create_refresh_token, verify_password_async, get_current_user, get_user_roles
 from app.models.auth_models import Token, UserLogin
 from app.core.security import require_auth
 from app.utils.log_utils import logging
@@ -34,15 +34,16 @@ async def login(user_data: UserLogin) -> Any:
             detail="Incorrect id or password",
         )
 
-    if not verify_password(user_data.password, mock_users[user_data.id]["hashed_password"]):
+    if not await verify_password_async(user_data.password, mock_users[user_data.id]["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect id or password",
         )
 
+    claims = {"sub": user_data.id, "roles": get_user_roles(user_data.id)}
     return {
-        "access_token": create_access_token({"sub": user_data.id}),
-        "refresh_token": create_refresh_token({"sub": user_data.id}),
+        "access_token": create_access_token(claims),
+        "refresh_token": create_refresh_token(claims),
         "token_type": "bearer",
     }
 
@@ -50,9 +51,10 @@ async def login(user_data: UserLogin) -> Any:
 @api_router.post("/refresh", response_model=Token)
 @require_auth()
 async def refresh_token(current_user: dict = Depends(get_current_user)) -> Any:
+    claims = {"sub": current_user["sub"], "roles": get_user_roles(current_user["sub"])}
     return {
-        "access_token": create_access_token({"sub": current_user["sub"]}),
-        "refresh_token": create_refresh_token({"sub": current_user["sub"]}),
+        "access_token": create_access_token(claims),
+        "refresh_token": create_refresh_token(claims),
         "token_type": "bearer",
     }
 
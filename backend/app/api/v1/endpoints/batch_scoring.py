@@ -0,0 +1,26 @@
+"""多数の提出をまとめて採点するエンドポイント（難易度の調整・体験版のスコア倍率の調整用）"""
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.core.security import require_auth
+from app.models.pydantic_models import BatchTrialScoringRequest
+from app.services.batch_scoring_services import batch_scoring_service
+
+api_router = APIRouter()
+MAX_BATCH_SUBMISSIONS = 100000  # 1リクエストで採点できる提出の上限
+
+
+@api_router.post("/trial")
+@require_auth(roles=["admin"])
+async def score_trial_batch(request: BatchTrialScoringRequest):
+    """体験版の採点ロジックで、提出 × チャレンジ のスコアをNDJSONで順に返すエンドポイント"""
+    if len(request.submissions) > MAX_BATCH_SUBMISSIONS:
+        raise HTTPException(status_code=400, detail="Too many submissions.")
+
+    # チャレンジ一覧の読み込みに失敗した場合は、ストリームを始める前にエラー（503）を返す
+    matrix = await batch_scoring_service.get_matrix()
+    return StreamingResponse(
+        batch_scoring_service.stream_scores(matrix, request.submissions, request.challenge_ids),
+        media_type="application/x-ndjson",
+    )
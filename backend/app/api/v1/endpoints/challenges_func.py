@@ -3,39 +3,57 @@
 import os
 import base64
 import json
-import hashlib
+import time
 import uuid
-from collections import defaultdict
+from typing import Optional
 
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
 import requests
 
 from app.core.security import require_auth, get_current_user
-from app.core.mongodb_core import db
+from app.core.challenge_catalog import challenge_catalog
+from app.core.mongodb_core import db, remove_internal_keys
+from app.core.score_cache import score_cache
+from app.core.session_store import session_store
 from app.models.pydantic_models import ChallengeRequest, SubmitRequest, UserChallenges
-from app.services.groq_services import GroqClient
-from app.services.open_ai_services import ChatGPTClient, DallE3Client
-from app.services.segmind_services import create_image as create_image_by_segmind
+from app.services.image_job_services import image_job_queue, JOB_STATUS_DONE
+from app.services.scoring_services import PROVIDER_LOCAL, score_with_fallback
+from app.utils.http_utils import PRIVATE_REVALIDATE_CACHE_CONTROL, create_etag, is_etag_matched
 from app.utils.image_utils import encode_image
 from app.utils.log_utils import logging
+from app.utils.pagination_utils import decode_cursor, encode_cursor
 from app.utils.time_utils import get_jst_now
-from app.utils.challenge_utils import convert_challenge_to_json_item, submission_validation
+from app.utils.challenge_utils import calculate_trial_score, create_score_prompt, submission_validation, tokenize_for_trial
 
 load_dotenv()
 api_router = APIRouter()
-user_challenges = defaultdict(None)
 SUBMIT_INTERVAL_FOR_TRIAL = 5  # 提出の間隔（秒）
-SUBMIT_INTERVAL_FOR_LOGGED_IN = 60  # 提出の間隔（秒）
-SCORE_MAGNIFICATION_TRIAL = 300  # 体験版のスコア倍率
+SUBMIT_INTERVAL_FOR_LOGGED_IN = int(os.getenv("SUBMIT_INTERVAL_FOR_LOGGED_IN", "60"))  # 提出の間隔（秒）
+SUBMISSION_PAGE_SIZE = 50  # 提出履歴の1ページあたりの件数
+MAX_SUBMISSION_PAGE_SIZE = 100
+SUBMIT_STREAM_IMAGE_TIMEOUT = float(os.getenv("SUBMIT_STREAM_IMAGE_TIMEOUT", "120"))  # 画像生成を待つ最大時間（秒）
+SUBMIT_STREAM_KEEPALIVE_INTERVAL = 15  # 画像生成を待つ間にコメント行を送る間隔（秒）
+IMAGE_SCORE_THRESHOLDS = (50, 75, 90)  # スコアがこれらを超えたときに画像を生成する
 
 
 @api_router.get("/get-challenge-progress")
 @require_auth()
-async def get_challenge_progress(current_user: dict = Depends(get_current_user)):
+async def get_challenge_progress(response: Response, if_none_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """ユーザーのチャレンジ進捗を取得するエンドポイント"""
     user_id = current_user["sub"]
-    if user_id not in user_challenges:
+    challenge_progress = await session_store.get(user_id)
+
+    # 進捗はチャレンジごとのIDと、提出・画像生成のたびに増えるリビジョンで版を表す
+    etag = create_etag(user_id, "") if challenge_progress is None else create_etag(user_id, challenge_progress.session_id, challenge_progress.revision)
+    headers = {"ETag": etag, "Cache-Control": PRIVATE_REVALIDATE_CACHE_CONTROL}
+    # 条件付きGET：進捗が変わっていなければ本文を返さない（ポーリングでの提出履歴の再送を避ける）
+    if is_etag_matched(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    if challenge_progress is None:
         return {
             "in_progress": [
                 {
@@ -46,7 +64,6 @@ async def get_challenge_progress(current_user: dict = Depends(get_current_user))
             ],
         }
 
-    challenge_progress = user_challenges[user_id]
     return {
         "in_progress": [
             {
@@ -64,7 +81,7 @@ async def give_up_challenge(current_user: dict = Depends(get_current_user)):
     """ユーザーのチャレンジ進捗をリセットするエンドポイント"""
     user_id = current_user["sub"]
     logging("Challenge progress reset for user: ", user_id)
-    del user_challenges[user_id]
+    await session_store.delete(user_id)
 
     return {"message": "Challenge progress reset successfully."}
 
@@ -74,18 +91,23 @@ async def give_up_challenge(current_user: dict = Depends(get_current_user)):
 async def complete_challenge(current_user: dict = Depends(get_current_user)):
     """ユーザーのチャレンジを完了するエンドポイント"""
     user_id = current_user["sub"]
-    if user_id in user_challenges:
+    user_challenge = await session_store.get(user_id)
+    if user_challenge is not None:
         submission_id = str(uuid.uuid4())
         await db.insert_submission(
             _submission_id=submission_id,
             _user_id=user_id,
-            _challenge_id=user_challenges[user_id].now_challenge_id,
+            _challenge_id=user_challenge.now_challenge_id,
             _created_at=get_jst_now(),
-            _images=user_challenges[user_id].generated_image,
-            _submissions=user_challenges[user_id].submissions,
+            _images=user_challenge.generated_image,
+            _submissions=user_challenge.submissions,
         )
+        # 生成画像は内容のハッシュで共有されるため、どの提出が使っているかを記録する
+        for image_id in user_challenge.generated_image:
+            if image_id.startswith("gen_"):
+                await db.add_image_reference(image_id, {"submission_id": submission_id, "user_id": user_id, "challenge_id": user_challenge.now_challenge_id})
 
-        del user_challenges[user_id]
+        await session_store.delete(user_id)
 
         logging("Challenge completed for user: ", user_id)
         return {"submission_id": submission_id}
@@ -95,14 +117,39 @@ async def complete_challenge(current_user: dict = Depends(get_current_user)):
 
 @api_router.get("/get-all-submission")
 @require_auth()
-async def get_all_submission(current_user: dict = Depends(get_current_user)):
-    """ユーザーの全提出物を取得するエンドポイント"""
+async def get_all_submission(
+    response: Response,
+    limit: int = Query(SUBMISSION_PAGE_SIZE, ge=1, le=MAX_SUBMISSION_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    """ユーザーの提出物の概要を新しい順に取得するエンドポイント（続きは next_cursor を指定して取得する）"""
     user_id = current_user["sub"]
-    submissions = await db.get_all_submissions_by_user(user_id)
-
-    if not submissions:
-        return {"submissions": []}
-    return {"submissions": submissions}
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    # 提出物は追加されるだけなので、最新の提出物が同じなら一覧も変わっていない
+    latest_key = await db.get_latest_submission_key(user_id)
+    etag = create_etag(user_id, limit, cursor or "", *(latest_key or ()))
+    headers = {"ETag": etag, "Cache-Control": PRIVATE_REVALIDATE_CACHE_CONTROL}
+    # 条件付きGET：一覧が変わっていなければ集計もシリアライズもしない
+    if is_etag_matched(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    summaries = await db.get_submission_summaries_by_user(user_id, limit, after)
+
+    next_cursor = None
+    if len(summaries) == limit:
+        next_cursor = encode_cursor(summaries[-1]["created_at"], summaries[-1]["_id"])
+    return {
+        "submissions": [remove_internal_keys(summary) for summary in summaries],
+        "next_cursor": next_cursor,
+    }
 
 
 @api_router.get("/get-submission/{submission_id}")
@@ -130,18 +177,18 @@ async def start_challenge(request: ChallengeRequest, current_user: dict = Depend
     user_id = current_user["sub"]
     challenge_id = request.challenge_id
 
-    challenge_data = await db.get_challenge_by_id(challenge_id)
-    challenge = convert_challenge_to_json_item(challenge_data)
+    challenge = await challenge_catalog.get_item(challenge_id)
 
     if challenge is None or challenge is {}:
         # チャレンジが存在しない場合
         raise HTTPException(status_code=404, detail="Challenge not found.")
 
-    if user_id not in user_challenges:
-        user_challenges[user_id] = UserChallenges(now_challenge_id=challenge_id, now_challenge=challenge)
+    user_challenge = await session_store.get(user_id)
+    if user_challenge is None:
+        user_challenge = await session_store.create(user_id, UserChallenges(now_challenge_id=challenge_id, now_challenge=challenge))
 
     # debug用
-    # user_challenges[user_id].submissions = [
+    # user_challenge.submissions = [
     #     {
     #         "timestamp": get_jst_now().strftime("%Y-%m-%dT %H:%M:%S"),
     #         "content": "This is a sample submission text.",
@@ -153,144 +200,220 @@ async def start_challenge(request: ChallengeRequest, current_user: dict = Depend
     #         "score": 95,
     #     },
     # ]
-    # user_challenges[user_id].generated_image = [
+    # user_challenge.generated_image = [
     #     "/api/img/ch_f011aa5b7e209c2566cfcc49143b1ab713016351f0727938cbf93f7e155f5126",
     #     "/api/img/ch_f011aa5b7e209c2566cfcc49143b1ab713016351f0727938cbf93f7e155f5126",
     # ]
-    # user_challenges[user_id].last_submitted_text = "This is a sample submission text."
-    # user_challenges[user_id].last_submission_score = 95
+    # user_challenge.last_submitted_text = "This is a sample submission text."
+    # user_challenge.last_submission_score = 95
     # debug用
 
     logging("Challenge started: ", challenge_id, current_user)
     response = {}
 
     response["message"] = "Start the challenge!"
-    if user_challenges[user_id].submissions:
-        response["submissions"] = user_challenges[user_id].submissions
-    if user_challenges[user_id].generated_image:
-        response["generated_img_url"] = user_challenges[user_id].generated_image[0]
+    if user_challenge.submissions:
+        response["submissions"] = user_challenge.submissions
+    if user_challenge.generated_image:
+        response["generated_img_url"] = user_challenge.generated_image[0]
         if not response["generated_img_url"].startswith("/api/img/"):
-            response["generated_img_url"] = "/api/img/" + user_challenges[user_id].generated_image[0]
-    if user_challenges[user_id].last_submitted_text:
-        response["last_submitted_text"] = user_challenges[user_id].last_submitted_text
-    if user_challenges[user_id].last_submission_score:
-        response["last_submission_score"] = user_challenges[user_id].last_submission_score
+            response["generated_img_url"] = "/api/img/" + user_challenge.generated_image[0]
+    if user_challenge.last_submitted_text:
+        response["last_submitted_text"] = user_challenge.last_submitted_text
+    if user_challenge.last_submission_score:
+        response["last_submission_score"] = user_challenge.last_submission_score
     return response
 
 
-@api_router.post("/submit")
-@require_auth()
-async def submit_challenge(request: SubmitRequest, current_user: dict = Depends(get_current_user)):
-    submission = request.submission
-    challenge = user_challenges[current_user["sub"]].now_challenge
-    return_payload = {}
-    logging("Challenge submitted: ", request.submission, current_user["sub"], challenge)
+async def accept_submission(user_id: str, submission: str) -> UserChallenges:
+    """提出を受け付けられるか確認し、ユーザーのチャレンジ進捗を返す"""
+    user_challenge = await session_store.get(user_id)
+    if user_challenge is None:
+        raise HTTPException(status_code=404, detail="No challenge progress found for this user.")
+    logging("Challenge submitted: ", submission, user_id, user_challenge.now_challenge_id)
+
+    # 画像生成が混雑している間は、画像を生成する可能性のある提出を受け付ける前に503で断る（提出の間隔は消費しない）
+    if user_challenge.last_submission_score < max(IMAGE_SCORE_THRESHOLDS):
+        await image_job_queue.ensure_capacity()
 
-    # 提出の間隔をチェック
-    if user_challenges[current_user["sub"]].last_submitted_unix_time + SUBMIT_INTERVAL_FOR_LOGGED_IN > get_jst_now().timestamp():
+    # 提出の間隔をチェック（複数のワーカーから同時に提出されても1件だけ通るようにアトミックに更新する）
+    if not await session_store.try_mark_submitted(user_id, get_jst_now().timestamp(), SUBMIT_INTERVAL_FOR_LOGGED_IN):
         raise HTTPException(status_code=400, detail="Submission interval is too short.")
-    user_challenges[current_user["sub"]].last_submitted_unix_time = get_jst_now().timestamp()
 
     # 提出テキストのバリデーション
     if not submission_validation(submission):
         raise HTTPException(status_code=400, detail="Submission text is invalid.")
+    return user_challenge
+
+
+async def score_submission(user_challenge: UserChallenges, submission: str) -> int:
+    """提出を採点する"""
+    challenge_id = user_challenge.now_challenge_id
+    result_sample = user_challenge.now_challenge.get("result_sample", "")
+    cached_score = await score_cache.get(challenge_id, result_sample, submission)
+    if cached_score is not None:
+        # 同じ（ほぼ同じ）提出は過去の採点結果を使い、LLMを呼び出さない
+        return cached_score
+
+    # Azure OpenAI → Groq → 体験版の採点ロジック の順にフォールバックする
+    query_submission_to_score = create_score_prompt(result_sample, submission)
+    score, provider = await score_with_fallback(challenge_id, query_submission_to_score, submission)
+    if provider != PROVIDER_LOCAL:
+        # 簡易的な採点の結果はキャッシュせず、LLMが復旧したら採点し直す
+        await score_cache.set(challenge_id, result_sample, submission, score)
+    return score
+
+
+async def record_scored_submission(user_id: str, submission: str, score: int) -> UserChallenges:
+    """採点結果をユーザーのチャレンジ進捗に記録する"""
+    user_challenge = await session_store.record_submission(
+        user_id,
+        {
+            "timestamp": get_jst_now().strftime("%Y-%m-%dT %H:%M:%S"),
+            "content": submission,
+            "score": score,
+        },
+        submission,
+        score,
+    )
+    if user_challenge is None:
+        # 採点中にギブアップ・完了された場合
+        raise HTTPException(status_code=404, detail="No challenge progress found for this user.")
+    return user_challenge
+
+
+async def enqueue_image_job_if_needed(user_challenge: UserChallenges, user_id: str, submission: str, last_submission_score: int, new_submission_score: int) -> Optional[tuple[str, str]]:
+    """スコアが節目を超えた場合に画像生成ジョブを登録し、(ジョブID, 状態) を返す（混雑時は状態が deferred になる）"""
+    if not any(last_submission_score < threshold <= new_submission_score for threshold in IMAGE_SCORE_THRESHOLDS):
+        return None
 
+    prompt = f"Create an image that represents the following text: {submission}"
+    # 画像生成は時間がかかるため、ジョブとして登録してすぐに応答する（プロバイダーは実行時に選ぶ）
+    return await image_job_queue.enqueue(
+        user_id=user_id,
+        challenge_id=user_challenge.now_challenge_id,
+        session_id=user_challenge.session_id,
+        prompt=prompt,
+    )
+
+
+@api_router.post("/submit")
+@require_auth()
+async def submit_challenge(request: SubmitRequest, current_user: dict = Depends(get_current_user)):
+    submission = request.submission
     user_id = current_user["sub"]
+    user_challenge = await accept_submission(user_id, submission)
+    return_payload = {}
 
-    # groqによるチェック
-    score = user_challenges[user_id].last_submission_score
-    query_submission_to_score = f"""
-    As an AI evaluator, analyze the English text within the <Submission> tags and assess how comprehensively it covers the content provided in the <Result> tags. Output only a single integer score from 0 to 100, where:
+    last_submission_score = user_challenge.last_submission_score
+    score = await score_submission(user_challenge, submission)
+    user_challenge = await record_scored_submission(user_id, submission, score)
 
-    - 100 indicates the submission fully covers all key points and details from the result
-    - 75 indicates most key points are covered with some minor omissions
-    - 50 indicates roughly half of the important content is covered
-    - 25 indicates only basic or surface-level coverage
-    - 0 indicates no relevant content coverage
+    image_job = await enqueue_image_job_if_needed(user_challenge, user_id, submission, last_submission_score, score)
+    if image_job is not None:
+        return_payload["image_job_id"], return_payload["image_job_status"] = image_job
 
-    Do not provide any explanation or additional text - output only the integer score.
+    return_payload["message"] = "Submission successful!"
+    return_payload["submissions"] = user_challenge.submissions
+    return_payload["last_submitted_text"] = user_challenge.last_submitted_text
+    return_payload["last_submission_score"] = user_challenge.last_submission_score
+    return return_payload
 
-    <Result>
-    {challenge.get("result_sample", "")}
-    </Result>
 
-    <Submission>
-    {submission}
-    </Submission>
+def format_sse(event: str, data: dict) -> bytes:
+    """Server-Sent Eventsの1件のイベントに整形"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+@api_router.post("/submit-stream")
+@require_auth()
+async def submit_challenge_stream(request: SubmitRequest, current_user: dict = Depends(get_current_user)):
+    """提出を受け付け、採点と画像生成の進み具合をServer-Sent Eventsで順に返すエンドポイント
+    イベント：accepted → score → image_started → image_ready（失敗・時間切れの場合は image_failed）
     """
-    IS_USE_GROQ = False  # いったんFalseにしておく
-    if IS_USE_GROQ:
-        groq_client = GroqClient(api_key=os.getenv("GROQ_API_KEY", ""))
-        response = groq_client.chat(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": query_submission_to_score},
-                    ],
-                }
-            ]
+    submission = request.submission
+    user_id = current_user["sub"]
+    # 受け付けられない提出は、ストリームを始める前に通常のエラー応答を返す
+    user_challenge = await accept_submission(user_id, submission)
+
+    async def events():
+        challenge_id = user_challenge.now_challenge_id
+        yield format_sse("accepted", {"challenge_id": challenge_id})
+
+        last_submission_score = user_challenge.last_submission_score
+        score = await score_submission(user_challenge, submission)
+        try:
+            recorded_challenge = await record_scored_submission(user_id, submission, score)
+        except HTTPException as e:
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+        yield format_sse(
+            "score",
+            {
+                "message": "Submission successful!",
+                "submissions": recorded_challenge.submissions,
+                "last_submitted_text": recorded_challenge.last_submitted_text,
+                "last_submission_score": recorded_challenge.last_submission_score,
+            },
         )
-    else:
-        open_ai_client = ChatGPTClient()
-        response = open_ai_client.chat(query_submission_to_score)
-    try:
-        score = int(response)
-    except ValueError:
-        pass
-
-    user_challenges[user_id].submissions.append(
-        {
-            "timestamp": get_jst_now().strftime("%Y-%m-%dT %H:%M:%S"),
-            "content": submission,
-            "score": score,
-        }
-    )
 
-    last_submission_score = user_challenges[user_id].last_submission_score
-    new_submission_score = score
-    if (last_submission_score < 50 <= new_submission_score) or (last_submission_score < 75 <= new_submission_score) or (last_submission_score < 90 <= new_submission_score):
-        filename = "gen_" + hashlib.sha256(f"{user_id}_{get_jst_now().strftime('%Y%m%d%H%M%S')}".encode()).hexdigest()
-        prompt = f"Create an image that represents the following text: {submission}"
-        USE_DALLE3 = True
-        if USE_DALLE3:
-            open_ai_client = DallE3Client()
-            open_ai_client.generate(prompt, filename)
-            user_challenges[user_id].generated_image.append(filename)
-            return_payload["generated_img_url"] = "/api/img/" + filename
+        image_job = await enqueue_image_job_if_needed(recorded_challenge, user_id, submission, last_submission_score, score)
+        if image_job is None:
+            return
+        job_id, job_status = image_job
+        yield format_sse("image_started", {"image_job_id": job_id, "image_job_status": job_status})
+
+        # 画像生成を待つ間も定期的にコメント行を送り、プロキシのタイムアウトで切断されないようにする
+        deadline = time.monotonic() + SUBMIT_STREAM_IMAGE_TIMEOUT
+        job = None
+        while job is None and time.monotonic() < deadline:
+            try:
+                job = await image_job_queue.wait(job_id, min(SUBMIT_STREAM_KEEPALIVE_INTERVAL, deadline - time.monotonic()))
+            except Exception as e:
+                # ジョブの状態が分からなくても、ストリームは正常に終わらせる（クライアントは image-job で確認できる）
+                logging("submit_challenge_stream: ", job_id, e)
+                break
+            if job is None:
+                yield b": keep-alive\n\n"
+
+        if job is not None and job["status"] == JOB_STATUS_DONE:
+            yield format_sse("image_ready", {"image_job_id": job_id, "image_job_status": JOB_STATUS_DONE, "generated_img_url": "/api/img/" + job["filename"]})
         else:
-            _ = create_image_by_segmind(prompt, filename)
-            return_payload["generated_img_url"] = "/api/img/" + filename
+            yield format_sse("image_failed", {"image_job_id": job_id, "image_job_status": job["status"] if job is not None else job_status})
 
-    user_challenges[user_id].last_submitted_text = submission
-    user_challenges[user_id].last_submission_score = score
+    # nginxがイベントをまとめてバッファリングしないようにする
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    return_payload["message"] = "Submission successful!"
-    return_payload["submissions"] = user_challenges[user_id].submissions
-    return_payload["last_submitted_text"] = user_challenges[user_id].last_submitted_text
-    return_payload["last_submission_score"] = user_challenges[user_id].last_submission_score
-    return return_payload
+
+@api_router.get("/image-job/{job_id}")
+@require_auth()
+async def get_image_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """画像生成ジョブの状態を取得するエンドポイント"""
+    job = await db.get_image_job(job_id)
+
+    if not job or job["user_id"] != current_user["sub"]:
+        raise HTTPException(status_code=404, detail="Image job not found.")
+
+    response = {"job_id": job["job_id"], "status": job["status"]}
+    if job["status"] == JOB_STATUS_DONE:
+        response["generated_img_url"] = "/api/img/" + job["filename"]
+    return response
 
 
 @api_router.post("/submit-for-trial")
 async def submit_challenge_for_trial(request: SubmitRequest):
     submission = request.submission
     challenge_id = request.challenge_id
-    challenge_data = await db.get_challenge_by_id(challenge_id)
-    challenge = convert_challenge_to_json_item(challenge_data)
+    challenge = await challenge_catalog.get_item(challenge_id)
     return_payload = {}
 
     # 提出テキストのバリデーション
     if not submission_validation(submission):
         raise HTTPException(status_code=400, detail="Submission text is invalid.")
 
-    # 体験版のため、簡易的なスコア算出を行う
-    score = 0
-    word_list_submission = set([word.lower() for word in submission.split()])
-    word_list_result = set([word.lower() for word in challenge.get("result_sample", "").split()])
-    common_words = word_list_submission.intersection(word_list_result)
-    score = int(len(common_words) / len(word_list_result) * SCORE_MAGNIFICATION_TRIAL) if word_list_result else 0
-    score = min(max(score, 0), 100)
+    # 体験版のため、簡易的なスコア算出を行う（模範解答の単語の集合は読み込み時に作成済み）
+    result_tokens = await challenge_catalog.get_result_tokens(challenge_id)
+    score = calculate_trial_score(tokenize_for_trial(submission), result_tokens)
 
     if 50 <= score < 75:
         return_payload["generated_img_url"] = challenge["result_sample_image_paths"][0]
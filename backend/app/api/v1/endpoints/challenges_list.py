@@ -1,38 +1,32 @@
 """チャレンジに関するエンドポイントを記述するモジュール"""
 
-from fastapi import APIRouter
-from app.core.mongodb_core import db
+from typing import Optional
+from fastapi import APIRouter, Header, Response
+from app.core.challenge_catalog import challenge_catalog
 from app.core.security import require_auth
-from app.utils.log_utils import logging
-from app.utils.challenge_utils import convert_challenge_to_json_item
+from app.utils.http_utils import REVALIDATE_CACHE_CONTROL, is_etag_matched
 
 api_router = APIRouter()
 
 
 @api_router.get("/get-all")
-async def get_challenges():
+async def get_challenges(if_none_match: Optional[str] = Header(None)):
     """チャレンジ一覧を取得するエンドポイント"""
-    challenge_data = await db.get_all_challenges()
+    etag = await challenge_catalog.get_list_etag()
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    # 条件付きGET：一覧が変わっていなければ本文を返さない
+    if is_etag_matched(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
 
-    if challenge_data is None:
-        challenge_data = []
-    else:
-        challenge_data = [convert_challenge_to_json_item(challenge) for challenge in challenge_data]
-
-    response = {"problems": challenge_data}
-    return response
+    # 一覧はキャッシュ済みのシリアライズ結果をそのまま返す
+    return Response(content=await challenge_catalog.get_list_json(), media_type="application/json", headers=headers)
 
 
 @api_router.get("/get/{challenge_id}")
 @require_auth()
 async def get_challenge(challenge_id: str):
     """チャレンジ詳細を取得するエンドポイント"""
-    challenge_data = await db.get_challenge_by_id(challenge_id)
-
-    if challenge_data is None:
-        challenge_data = {}
-    else:
-        challenge_data = convert_challenge_to_json_item(challenge_data)
+    challenge_data = await challenge_catalog.get_item(challenge_id)
 
     response = {"problem": challenge_data}
     return response
@@ -1,75 +1,67 @@
 """画像ファイルをクライアントへ返すエンドポイント"""
 
-import re
-from pathlib import Path
-import traceback
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Path as FastAPIPath
+from fastapi import APIRouter, Header, HTTPException, Path as FastAPIPath, Query, Response
 from fastapi.responses import FileResponse
+from app.core.image_index import CONTENT_ADDRESSED_PATTERN, image_index
+from app.services.image_variant_services import VARIANT_MEDIA_TYPE, image_variant_store, select_variant_width
+from app.utils.http_utils import REVALIDATE_CACHE_CONTROL, is_etag_matched
 from app.utils.log_utils import logging
 
 api_router = APIRouter()
 
-# 画像ファイルの保存ディレクトリ（生成AIが作った画像・あらかじめ作っておいたチャレンジ用の画像）
-IMAGE_STORAGE_PATH = Path("app/data/images")
-
-
-class SecureImageHandler:
-    """セキュアな画像ファイルハンドラ"""
-
-    ALLOWED_EXTENSIONS = {".png", ".jpg", ".jpeg"}
-    IMAGE_ID_PATTERN = re.compile(r"^[a-zA-Z0-9][-_a-zA-Z0-9]{64,70}$")
-
-    def __init__(self, base_dir: Path):
-        self.base_dir = base_dir.resolve()
-        if not self.base_dir.exists():
-            raise RuntimeError(f"Base directory {self.base_dir} does not exist")
-
-    def validate_image_id(self, image_id: str) -> bool:
-        """
-        画像IDのバリデーション
-        - 先頭は英数字
-        - 2文字目以降は英数字、ハイフン、アンダースコア
-        - 長さは64-70文字（ファイル名が識別子とSHA256なので64文字以上に）
-        """
-        return bool(self.IMAGE_ID_PATTERN.match(image_id))
-
-    def get_secure_image_path(self, image_id: str) -> Optional[Path]:
-        """安全な画像パスの取得"""
-        if not self.validate_image_id(image_id):
-            return None
-
-        # 拡張子を試す
-        for ext in self.ALLOWED_EXTENSIONS:
-            image_path = (self.base_dir / f"{image_id}{ext}").resolve()
-
-            # パストラバーサル対策
-            try:
-                if image_path.is_file() and image_path.is_relative_to(self.base_dir):
-                    return image_path
-            except (RuntimeError, ValueError):
-                continue
-        return None
+# 内容のハッシュを名前にした画像（ch_ / gen_）は内容が変わらないため、長期間キャッシュさせる
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# それ以外の名前の画像は同じIDで置き換えられることがあるため、ETagで毎回確認させる
+MUTABLE_IMAGE_CACHE_CONTROL = f"public, {REVALIDATE_CACHE_CONTROL}"
 
 
 @api_router.get("/{image_id}")
 async def get_image(
     image_id: str = FastAPIPath(..., title="画像ID", description="取得する画像のID（英数字、ハイフン、アンダースコアのみ許可）"),
+    w: Optional[int] = Query(None, ge=1, le=4096, title="幅", description="指定した場合、この幅以上の縮小版（WebP）を返す"),
+    if_none_match: Optional[str] = Header(None),
 ):
     """画像ファイルを取得するエンドポイント"""
     try:
-        # セキュアなパス解決
-        image_security_handler = SecureImageHandler(IMAGE_STORAGE_PATH)
-        image_path = image_security_handler.get_secure_image_path(image_id)
-        if image_path is None:
-            raise HTTPException(status_code=404, detail="Image not found or invalid image ID format.")
+        # インデックスからの安全なパス解決
+        image_entry = image_index.get(image_id)
+    except Exception as exc:
+        logging("get_image: ", exc)
+        raise HTTPException(status_code=500, detail="Internal server error.") from exc
+
+    if image_entry is None:
+        raise HTTPException(status_code=404, detail="Image not found or invalid image ID format.")
+
+    variant_width = select_variant_width(w) if w is not None else None
+    etag = image_entry.etag if variant_width is None else f'{image_entry.etag[:-1]}-w{variant_width}"'
+    headers = {
+        "X-Content-Type-Options": "nosniff",
+        "Cache-Control": IMAGE_CACHE_CONTROL if CONTENT_ADDRESSED_PATTERN.match(image_id) else MUTABLE_IMAGE_CACHE_CONTROL,
+        "ETag": etag,
+    }
 
-        image_id += ".png"  # 現在のシステムではPNG画像のみを使う
+    # 条件付きGET：クライアントが同じ画像を持っていれば本文を返さない
+    if is_etag_matched(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if variant_width is not None:
+        try:
+            variant_path, variant_stat = await image_variant_store.get_variant(image_entry, image_id, variant_width)
+        except Exception as exc:
+            logging("get_image: ", exc)
+            raise HTTPException(status_code=500, detail="Internal server error.") from exc
 
-        # Content-Typeヘッダーを設定してファイルを返す
         return FileResponse(
-            str(image_path),
-            headers={"X-Content-Type-Options": "nosniff", "Cache-Control": "no-store, no-cache, must-revalidate"},
+            str(variant_path),
+            headers=headers,
+            media_type=VARIANT_MEDIA_TYPE,
+            stat_result=variant_stat,
         )
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail="Internal server error.") from exc
+
+    # Content-Typeヘッダーを設定してファイルを返す
+    return FileResponse(
+        str(image_entry.path),
+        headers=headers,
+        stat_result=image_entry.stat_result,
+    )
@@ -0,0 +1,125 @@
+"""チャレンジ一覧をプロセス内に保持するキャッシュ
+    起動時に読み込み、版数の更新または変更ストリームのイベントで読み込み直す
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from typing import Optional
+
+from pymongo.errors import OperationFailure
+
+from app.core.mongodb_core import db
+from app.models.mongodb_models import Challenge
+from app.utils.challenge_utils import convert_challenge_to_json_item, tokenize_for_trial
+from app.utils.http_utils import create_etag
+from app.utils.log_utils import logging
+
+
+class ChallengeCatalog:
+    """チャレンジ一覧のキャッシュ"""
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.challenges: dict[str, Challenge] = {}
+        self.items: dict[str, dict] = {}
+        self.result_tokens: dict[str, frozenset[str]] = {}
+        self.list_json: bytes = b""
+        self.list_etag = ""
+        self.watch_task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        """読み込み済みかどうか"""
+        return self.version is not None
+
+    async def load(self):
+        """MongoDBからチャレンジ一覧を読み込み、一覧APIの応答をシリアライズしておく"""
+        async with self.lock:
+            version = await db.get_catalog_version()
+            challenges = await db.get_all_challenges()
+
+            self.challenges = {challenge.id: challenge for challenge in challenges}
+            self.items = {challenge.id: convert_challenge_to_json_item(challenge) for challenge in challenges}
+            # 体験版の採点で使う模範解答の単語の集合は、読み込み時に1度だけ作る
+            self.result_tokens = {challenge.id: tokenize_for_trial(challenge.result_sample) for challenge in challenges}
+            self.list_json = json.dumps({"problems": list(self.items.values())}, ensure_ascii=False).encode("utf-8")
+            # 版数はデータベースを作り直すと同じ値に戻るため、内容のハッシュも含める
+            self.list_etag = create_etag(version, hashlib.sha256(self.list_json).hexdigest())
+            self.version = version
+            logging(f"ChallengeCatalog.load: {len(self.items)} challenges (version {version})")
+
+    async def ensure_loaded(self):
+        """未読み込みであれば読み込む"""
+        if not self.is_loaded:
+            await self.load()
+
+    async def start(self):
+        """読み込んで、変更の監視を始める"""
+        await self.load()
+        if self.watch_task is None:
+            self.watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        """変更の監視を止める"""
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            await asyncio.gather(self.watch_task, return_exceptions=True)
+            self.watch_task = None
+
+    async def get_list_json(self) -> bytes:
+        """一覧APIの応答（シリアライズ済み）を取得"""
+        await self.ensure_loaded()
+        return self.list_json
+
+    async def get_list_etag(self) -> str:
+        """一覧APIの応答のETagを取得（読み込み直すたびに変わる）"""
+        await self.ensure_loaded()
+        return self.list_etag
+
+    async def get_challenge(self, challenge_id: str) -> Challenge:
+        """IDによるチャレンジ取得（キャッシュに無ければMongoDBから取得）"""
+        await self.ensure_loaded()
+        if challenge_id in self.challenges:
+            return self.challenges[challenge_id]
+        return await db.get_challenge_by_id(challenge_id)
+
+    async def get_item(self, challenge_id: str) -> dict:
+        """IDによるチャレンジ取得（APIの応答の形式）"""
+        await self.ensure_loaded()
+        if challenge_id in self.items:
+            return self.items[challenge_id]
+        return convert_challenge_to_json_item(await db.get_challenge_by_id(challenge_id))
+
+    async def get_result_tokens(self, challenge_id: str) -> frozenset[str]:
+        """IDによる模範解答の単語の集合の取得"""
+        await self.ensure_loaded()
+        if challenge_id in self.result_tokens:
+            return self.result_tokens[challenge_id]
+        return tokenize_for_trial((await db.get_challenge_by_id(challenge_id)).result_sample)
+
+    async def _watch(self):
+        """変更ストリームを監視し、使えない環境では版数をポーリングする"""
+        try:
+            async with db.watch_challenges() as stream:
+                async for _ in stream:
+                    await self.load()
+        except OperationFailure:
+            logging("ChallengeCatalog._watch: change streams are not available, polling the catalog version")
+        except Exception as e:
+            logging("ChallengeCatalog._watch: ", e)
+
+        poll_interval = float(os.getenv("CHALLENGE_CATALOG_POLL_INTERVAL", "30"))
+        while True:
+            await asyncio.sleep(poll_interval)
+            try:
+                if await db.get_catalog_version() != self.version:
+                    await self.load()
+            except Exception as e:
+                logging("ChallengeCatalog._watch: ", e)
+
+
+# グローバルなチャレンジ一覧のキャッシュ
+challenge_catalog = ChallengeCatalog()
@@ -1,5 +1,7 @@
 """ カスタム例外を定義するモジュール """
 
+from typing import Optional
+
 from fastapi import HTTPException, status
 
 
@@ -47,8 +49,9 @@ class ValidationError(HTTPException):
 class ServiceUnavailableError(HTTPException):
     """サービス利用不可エラー"""
 
-    def __init__(self, detail: str = "サービスが利用できません"):
+    def __init__(self, detail: str = "サービスが利用できません", retry_after: Optional[int] = None):
         super().__init__(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=detail,
+            headers=None if retry_after is None else {"Retry-After": str(retry_after)},
         )
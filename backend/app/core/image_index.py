@@ -0,0 +1,124 @@
+"""画像ファイルのインデックス
+    起動時に画像ディレクトリを走査して画像IDとファイルの対応を保持し、リクエストごとのファイル探索を省く
+    ch_ / gen_ の画像はファイル名がSHA256で、内容が変わらないため、ファイル名からETagを作る
+"""
+
+import os
+import re
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from app.utils.log_utils import logging
+
+# 画像ファイルの保存ディレクトリ（生成AIが作った画像・あらかじめ作っておいたチャレンジ用の画像）
+IMAGE_STORAGE_PATH = Path(os.getenv("BASE_IMAGE_DIR", "app/data/images"))
+
+CONTENT_ADDRESSED_PATTERN = re.compile(r"^(?:ch|gen)_([0-9a-f]{64})$")
+
+
+class SecureImageHandler:
+    """セキュアな画像ファイルハンドラ"""
+
+    ALLOWED_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+    IMAGE_ID_PATTERN = re.compile(r"^[a-zA-Z0-9][-_a-zA-Z0-9]{64,70}$")
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = base_dir.resolve()
+        if not self.base_dir.exists():
+            raise RuntimeError(f"Base directory {self.base_dir} does not exist")
+
+    def validate_image_id(self, image_id: str) -> bool:
+        """
+        画像IDのバリデーション
+        - 先頭は英数字
+        - 2文字目以降は英数字、ハイフン、アンダースコア
+        - 長さは64-70文字（ファイル名が識別子とSHA256なので64文字以上に）
+        """
+        return bool(self.IMAGE_ID_PATTERN.match(image_id))
+
+    def get_secure_image_path(self, image_id: str) -> Optional[Path]:
+        """安全な画像パスの取得"""
+        if not self.validate_image_id(image_id):
+            return None
+
+        # 拡張子を試す
+        for ext in self.ALLOWED_EXTENSIONS:
+            image_path = (self.base_dir / f"{image_id}{ext}").resolve()
+
+            # パストラバーサル対策
+            try:
+                if image_path.is_file() and image_path.is_relative_to(self.base_dir):
+                    return image_path
+            except (RuntimeError, ValueError):
+                continue
+        return None
+
+
+class ImageEntry(NamedTuple):
+    """インデックスに登録された画像"""
+
+    path: Path
+    etag: str
+    stat_result: os.stat_result
+
+
+class ImageIndex:
+    """画像IDから画像ファイルを引くインデックス"""
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = base_dir
+        self.handler: Optional[SecureImageHandler] = None
+        self.entries: dict[str, ImageEntry] = {}
+
+    def build(self):
+        """画像ディレクトリを走査してインデックスを作る"""
+        self.handler = SecureImageHandler(self.base_dir)
+        entries = {}
+        for image_path in self.handler.base_dir.iterdir():
+            image_id, ext = os.path.splitext(image_path.name)
+            if ext in SecureImageHandler.ALLOWED_EXTENSIONS and self.handler.validate_image_id(image_id) and image_path.is_file():
+                entries[image_id] = self._create_entry(image_id, image_path)
+        self.entries = entries
+        logging(f"ImageIndex.build: {len(self.entries)} images indexed")
+
+    def add(self, image_id: str) -> Optional[ImageEntry]:
+        """新しく保存された画像をインデックスに追加する"""
+        if self.handler is None:
+            self.build()
+
+        image_path = self.handler.get_secure_image_path(image_id)
+        if image_path is None:
+            return None
+
+        entry = self._create_entry(image_id, image_path)
+        self.entries[image_id] = entry
+        return entry
+
+    def remove(self, image_id: str):
+        """削除された画像をインデックスから外す"""
+        self.entries.pop(image_id, None)
+
+    def get(self, image_id: str) -> Optional[ImageEntry]:
+        """画像IDから画像を取得（インデックスに無ければ、他のワーカーが保存した可能性があるのでディスクを確認する）"""
+        if self.handler is None:
+            self.build()
+
+        entry = self.entries.get(image_id)
+        if entry is not None:
+            return entry
+        return self.add(image_id)
+
+    @staticmethod
+    def _create_entry(image_id: str, image_path: Path) -> ImageEntry:
+        """ETagを計算してインデックスのエントリーを作る"""
+        stat_result = image_path.stat()
+        matched = CONTENT_ADDRESSED_PATTERN.match(image_id)
+        if matched:
+            etag = f'"{matched.group(1)}"'
+        else:
+            etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+        return ImageEntry(path=image_path, etag=etag, stat_result=stat_result)
+
+
+# グローバルな画像インデックス（起動時にbuildする）
+image_index = ImageIndex(IMAGE_STORAGE_PATH)
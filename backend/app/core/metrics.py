@@ -0,0 +1,174 @@
+"""Prometheusのメトリクスを定義するモジュール
+    prometheus/prometheus.yml から backend:5000/metrics として収集される
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# ルーターのプレフィックスとメトリクスのラベルの対応
+ROUTER_LABELS = {
+    "/api/challenges-list": "challenges-list",
+    "/api/challenges-func": "challenges-func",
+    "/api/batch-scoring": "batch-scoring",
+    "/api/img": "img",
+    "/api/auth": "auth",
+    "/api/admin": "admin",
+    "/api/users": "users",
+}
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests per router",
+    ["router", "method", "status"],
+)
+OUTBOUND_LATENCY = Histogram(
+    "outbound_request_duration_seconds",
+    "Latency of calls to external AI providers",
+    ["service", "operation"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+OUTBOUND_ERRORS = Counter(
+    "outbound_request_errors_total",
+    "Failed calls to external AI providers",
+    ["service", "operation"],
+)
+MONGODB_LATENCY = Histogram(
+    "mongodb_operation_duration_seconds",
+    "Latency of MongoDB operations",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+MONGODB_ERRORS = Counter(
+    "mongodb_operation_errors_total",
+    "Failed MongoDB operations",
+    ["operation"],
+)
+ACTIVE_SESSIONS = Gauge(
+    "active_challenge_sessions",
+    "Number of users with a challenge in progress",
+)
+QUEUED_IMAGE_JOBS = Gauge(
+    "image_jobs_queued",
+    "Number of image generation jobs waiting for a worker",
+)
+IMAGE_JOB_WAIT = Histogram(
+    "image_job_wait_seconds",
+    "Time image generation jobs wait in the queue before a worker starts them",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+DEFERRED_IMAGE_JOBS = Counter(
+    "image_jobs_deferred_total",
+    "Image generation jobs deferred because the in-process queue was full",
+)
+REJECTED_SUBMISSIONS = Counter(
+    "submissions_rejected_total",
+    "Submissions rejected with 503 because the deferred image job backlog was full",
+)
+SCORE_CACHE_LOOKUPS = Counter(
+    "score_cache_lookups_total",
+    "Score cache lookups by result (memory_hit / db_hit / miss)",
+    ["result"],
+)
+PASSWORD_VERIFICATION_LATENCY = Histogram(
+    "password_verification_duration_seconds",
+    "Time spent waiting for a bcrypt worker and verifying the password",
+    ["phase"],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2.5, 5),
+)
+PASSWORD_VERIFICATIONS_PENDING = Gauge(
+    "password_verifications_pending",
+    "Number of password verifications running or waiting for a bcrypt worker",
+)
+PASSWORD_VERIFICATIONS_REJECTED = Counter(
+    "password_verifications_rejected_total",
+    "Password verifications rejected because too many were pending",
+)
+TOKEN_CACHE_LOOKUPS = Counter(
+    "token_cache_lookups_total",
+    "Decoded JWT cache lookups by result (hit / miss / expired)",
+    ["result"],
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state per external service (0 closed / 1 half open / 2 open)",
+    ["service"],
+)
+PROVIDER_ROLLING_LATENCY = Gauge(
+    "provider_rolling_latency_seconds",
+    "Mean latency of calls to each provider over the rolling window used for routing",
+    ["kind", "provider"],
+)
+PROVIDER_ROLLING_ERROR_RATE = Gauge(
+    "provider_rolling_error_rate",
+    "Error rate of calls to each provider over the rolling window used for routing",
+    ["kind", "provider"],
+)
+SCORING_RESULTS = Counter(
+    "scoring_results_total",
+    "Submissions scored per provider of the fallback chain",
+    ["provider"],
+)
+IMAGE_GENERATION_CACHE_LOOKUPS = Counter(
+    "image_generation_cache_lookups_total",
+    "Image generation cache lookups by result (hit / miss)",
+    ["result"],
+)
+GENERATED_IMAGES_BYTES = Gauge(
+    "generated_images_bytes",
+    "Disk space used by generated images and their variants",
+)
+EVICTED_GENERATED_IMAGES = Counter(
+    "generated_images_evicted_total",
+    "Generated images deleted to keep the disk usage under the limit",
+)
+
+
+def get_router_label(path: str) -> str:
+    """リクエストのパスからルーターのラベルを取得"""
+    for prefix, label in ROUTER_LABELS.items():
+        if path.startswith(prefix):
+            return label
+    return "others"
+
+
+@contextmanager
+def observe_outbound(service: str, operation: str):
+    """外部APIの呼び出し時間を計測し、例外が発生した場合はエラーとして数える"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        OUTBOUND_ERRORS.labels(service, operation).inc()
+        raise
+    finally:
+        OUTBOUND_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+
+
+def record_outbound_error(service: str, operation: str):
+    """例外にならない外部APIのエラー（ステータスコードなど）を数える"""
+    OUTBOUND_ERRORS.labels(service, operation).inc()
+
+
+def track_mongodb_operation(func):
+    """MongoDBを操作する非同期メソッドの実行時間を計測するデコレータ"""
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            MONGODB_ERRORS.labels(func.__name__).inc()
+            raise
+        finally:
+            MONGODB_LATENCY.labels(func.__name__).observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Prometheusのテキスト形式でメトリクスを出力"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,16 +1,21 @@
 """MongoDBを操作するクラス"""
 
 from datetime import datetime
-from typing import List
+from typing import AsyncIterator, List, Optional, Tuple
+import hashlib
 import json
 import os
+import time
 
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, ReturnDocument
 
 from app.models.mongodb_models import Challenge
 from app.core.exceptions import ServiceUnavailableError
+from app.core.metrics import track_mongodb_operation
 from app.utils.log_utils import logging
+from app.utils.time_utils import get_jst_now
 
 
 load_dotenv()
@@ -44,11 +49,29 @@ class MongoDB:
             logging(f"Failed to connect to MongoDB: {e}")
             raise
 
+    async def ensure_indexes(self):
+        """起動時に必要なインデックスを作成"""
+        if self.db is None:
+            return
+
+        score_cache_ttl_seconds = int(os.getenv("SCORE_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+        await self.db.score_cache.create_index("created_at", expireAfterSeconds=score_cache_ttl_seconds)
+        # 提出履歴のページネーション（ユーザーごとに新しい順）用
+        await self.db.submissions.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+        # 生成画像を使っているユーザー・チャレンジの検索用
+        await self.db.image_references.create_index("references.user_id")
+        # 容量の上限を超えたときに、最後に使われた日時が古い生成画像から削除する用
+        await self.db.image_references.create_index("last_referenced_at")
+        await self.db.image_generation_cache.create_index("image_id")
+        # 保留中の画像生成ジョブを古い順に取り出す用
+        await self.db.image_jobs.create_index([("status", 1), ("created_at", 1)])
+
     async def close(self):
         """MongoDB接続を閉じる"""
         if self.client:
             self.client.close()
 
+    @track_mongodb_operation
     async def init_challenges(self):
         """初期チャレンジデータの読み込みと保存"""
         if self.db is None or self.db.challenges is None:
@@ -58,17 +81,34 @@ class MongoDB:
         #     return
 
         try:
+            start = time.perf_counter()
             with open("app/data/initial_challenges.json", "r", encoding="utf-8") as f:
                 challenges = json.load(f)
 
+            # 保存済みの内容のハッシュと比較し、変更されたチャレンジだけを書き込む
+            stored_hashes = {stored["_id"]: stored.get("content_hash") async for stored in self.db.challenges.find({}, {"content_hash": 1})}
+            operations = []
+            updated_ids = []
             for challenge in challenges:
+                content_hash = hashlib.sha256(json.dumps(challenge, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+                if stored_hashes.get(challenge["_id"]) == content_hash:
+                    continue
+                challenge["content_hash"] = content_hash
                 challenge["created_at"] = datetime.utcnow()
-                logging(challenge)
-                await self.db.challenges.delete_one({"_id": challenge["_id"]})
-                await self.db.challenges.insert_one(challenge)
+                operations.append(ReplaceOne({"_id": challenge["_id"]}, challenge, upsert=True))
+                updated_ids.append(challenge["_id"])
+
+            if operations:
+                await self.db.challenges.bulk_write(operations, ordered=False)
+                # チャレンジのキャッシュを持つワーカーに変更を知らせる
+                await self.bump_catalog_version()
+
+            elapsed = time.perf_counter() - start
+            logging(f"Initial challenges loaded: {len(operations)} of {len(challenges)} updated in {elapsed:.3f}s", updated_ids)
         except Exception as e:
             logging(f"Error loading initial challenges: {e}")
 
+    @track_mongodb_operation
     async def get_all_challenges(self) -> List[Challenge]:
         """全チャレンジを取得"""
         if self.db is None or self.db.challenges is None:
@@ -78,6 +118,7 @@ class MongoDB:
         challenges = await cursor.to_list(length=None)
         return [Challenge(**challenge) for challenge in challenges]
 
+    @track_mongodb_operation
     async def get_challenge_by_id(self, challenge_id: str) -> Challenge:
         """IDによるチャレンジ取得"""
         if self.db is None or self.db.challenges is None:
@@ -89,6 +130,37 @@ class MongoDB:
 
         return Challenge(**challenge)
 
+    @track_mongodb_operation
+    async def get_catalog_version(self) -> int:
+        """チャレンジ一覧の版数を取得"""
+        if self.db is None or self.db.meta is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        meta = await self.db.meta.find_one({"_id": "challenge_catalog"})
+        return meta["version"] if meta else 0
+
+    @track_mongodb_operation
+    async def bump_catalog_version(self) -> int:
+        """チャレンジ一覧の版数を上げる"""
+        if self.db is None or self.db.meta is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        meta = await self.db.meta.find_one_and_update(
+            {"_id": "challenge_catalog"},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return meta["version"]
+
+    def watch_challenges(self):
+        """チャレンジの変更ストリームを取得（レプリカセットでのみ利用可能）"""
+        if self.db is None or self.db.challenges is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        return self.db.challenges.watch()
+
+    @track_mongodb_operation
     async def insert_submission(
         self,
         _submission_id: str,
@@ -118,30 +190,302 @@ class MongoDB:
             logging(f"Error inserting submission: {e}")
             raise ServiceUnavailableError("Could not insert submission") from e
 
+    @track_mongodb_operation
     async def get_submissions_by_submission_id(self, submission_id: str) -> dict:
         """提出物IDによる提出物取得"""
         if self.db is None or self.db.submissions is None:
             raise ServiceUnavailableError("Could not connect to the service")
 
-        cursor = self.db.submissions.find({"submission_id": submission_id})
-        submissions = await cursor.to_list(length=None)
-        submissions = [remove_internal_keys(submission) for submission in submissions]
-
-        if not submissions or len(submissions) == 0:
+        submission = await self.db.submissions.find_one({"_id": submission_id})
+        if not submission:
             raise ServiceUnavailableError("Could not find the submission")
 
-        return submissions[0]
+        return remove_internal_keys(submission)
 
-    async def get_all_submissions_by_user(self, user_id: str) -> List[dict]:
-        """ユーザーIDによる全提出物取得"""
+    async def iter_submissions(self, query: dict, batch_size: int = 500) -> AsyncIterator[dict]:
+        """条件に合う提出物をカーソルで順に取得（全件をメモリに載せない）"""
+        if self.db is None or self.db.submissions is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        cursor = self.db.submissions.find(query).batch_size(batch_size)
+        async for submission in cursor:
+            yield remove_internal_keys(submission)
+
+    @track_mongodb_operation
+    async def get_submission_summaries_by_user(
+        self,
+        user_id: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None,
+    ) -> List[dict]:
+        """ユーザーIDによる提出物の概要の取得（新しい順、after より後のものを最大 limit 件）"""
         if self.db is None or self.db.submissions is None:
             raise ServiceUnavailableError("Could not connect to the service")
 
-        cursor = self.db.submissions.find({"user_id": user_id})
-        submissions = await cursor.to_list(length=None)
-        submissions = [remove_internal_keys(submission) for submission in submissions]
+        match = {"user_id": user_id}
+        if after is not None:
+            after_created_at, after_id = after
+            match["$or"] = [
+                {"created_at": {"$lt": after_created_at}},
+                {"created_at": after_created_at, "_id": {"$lt": after_id}},
+            ]
+
+        cursor = self.db.submissions.aggregate(
+            [
+                {"$match": match},
+                {"$sort": {"created_at": -1, "_id": -1}},
+                {"$limit": limit},
+                {
+                    "$project": {
+                        "submission_id": 1,
+                        "challenge_id": 1,
+                        "created_at": 1,
+                        "thumbnail_image": {"$arrayElemAt": ["$images", -1]},
+                        "best_score": {"$max": "$submissions.score"},
+                        "submission_count": {"$size": {"$ifNull": ["$submissions", []]}},
+                    }
+                },
+            ]
+        )
+        return await cursor.to_list(length=limit)
+
+    @track_mongodb_operation
+    async def get_latest_submission_key(self, user_id: str) -> Optional[Tuple[datetime, str]]:
+        """ユーザーの最新の提出物の (created_at, _id) を取得（無ければNone）
+        提出物は追加されるだけなので、一覧の変更の検出に使う（インデックスだけで済む）
+        """
+        if self.db is None or self.db.submissions is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        latest = await self.db.submissions.find_one(
+            {"user_id": user_id},
+            projection={"_id": 1, "created_at": 1},
+            sort=[("created_at", -1), ("_id", -1)],
+        )
+        if latest is None:
+            return None
+        return latest["created_at"], latest["_id"]
+
+    @track_mongodb_operation
+    async def insert_image_job(self, job: dict):
+        """画像生成ジョブをMongoDBに保存"""
+        if self.db is None or self.db.image_jobs is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        await self.db.image_jobs.insert_one({"_id": job["job_id"], **job})
+
+    @track_mongodb_operation
+    async def update_image_job(self, job_id: str, fields: dict):
+        """画像生成ジョブの状態を更新"""
+        if self.db is None or self.db.image_jobs is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        await self.db.image_jobs.update_one({"_id": job_id}, {"$set": fields})
+
+    @track_mongodb_operation
+    async def claim_image_job(self, from_status: str, to_status: str) -> Optional[dict]:
+        """指定した状態の最も古い画像生成ジョブを取り出し、状態を更新する（複数のワーカーで同じジョブを取り出さない）"""
+        if self.db is None or self.db.image_jobs is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        job = await self.db.image_jobs.find_one_and_update(
+            {"status": from_status},
+            {"$set": {"status": to_status, "updated_at": get_jst_now()}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if not job:
+            return None
+
+        return remove_internal_keys(job)
+
+    @track_mongodb_operation
+    async def count_image_jobs(self, status: str, limit: int) -> int:
+        """指定した状態の画像生成ジョブの数を取得（limit 件で数えるのをやめる）"""
+        if self.db is None or self.db.image_jobs is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        return await self.db.image_jobs.count_documents({"status": status}, limit=limit)
+
+    @track_mongodb_operation
+    async def requeue_stale_image_jobs(self, statuses: List[str], updated_before: datetime, to_status: str) -> int:
+        """指定した状態のまま一定時間更新されていない画像生成ジョブの状態を戻し、戻した件数を返す"""
+        if self.db is None or self.db.image_jobs is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        result = await self.db.image_jobs.update_many(
+            {"status": {"$in": statuses}, "updated_at": {"$lt": updated_before}},
+            {"$set": {"status": to_status, "updated_at": get_jst_now()}},
+        )
+        return result.modified_count
+
+    @track_mongodb_operation
+    async def get_image_job(self, job_id: str) -> Optional[dict]:
+        """IDによる画像生成ジョブ取得"""
+        if self.db is None or self.db.image_jobs is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        job = await self.db.image_jobs.find_one({"_id": job_id})
+        if not job:
+            return None
+
+        return remove_internal_keys(job)
+
+    @track_mongodb_operation
+    async def add_image_reference(self, image_id: str, reference: dict):
+        """生成画像（内容のハッシュで命名）と、それを使う提出の対応を記録"""
+        if self.db is None or self.db.image_references is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        await self.db.image_references.update_one(
+            {"_id": image_id},
+            {
+                "$setOnInsert": {"sha256": image_id.split("_", 1)[1], "created_at": get_jst_now()},
+                "$set": {"last_referenced_at": get_jst_now()},
+                "$addToSet": {"references": reference},
+            },
+            upsert=True,
+        )
+
+    @track_mongodb_operation
+    async def get_evictable_images(self, referenced_before: datetime, limit: int) -> List[str]:
+        """どの提出にも使われておらず、最後に使われた日時が古い生成画像のIDを古い順に取得"""
+        if self.db is None or self.db.image_references is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        cursor = (
+            self.db.image_references.find(
+                {"references.submission_id": {"$exists": False}, "last_referenced_at": {"$lt": referenced_before}},
+                {"_id": 1},
+            )
+            .sort("last_referenced_at", 1)
+            .limit(limit)
+        )
+        return [image["_id"] async for image in cursor]
+
+    @track_mongodb_operation
+    async def delete_generated_images(self, image_ids: List[str]):
+        """削除した生成画像の参照と、それを指す生成結果のキャッシュを削除"""
+        if self.db is None or self.db.image_references is None or self.db.image_generation_cache is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        await self.db.image_references.delete_many({"_id": {"$in": image_ids}})
+        await self.db.image_generation_cache.delete_many({"image_id": {"$in": image_ids}})
+
+    @track_mongodb_operation
+    async def get_generated_image_id(self, cache_key: str) -> Optional[str]:
+        """生成条件のキーから、生成済みの画像IDを取得"""
+        if self.db is None or self.db.image_generation_cache is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        cached = await self.db.image_generation_cache.find_one({"_id": cache_key}, {"image_id": 1})
+        if not cached:
+            return None
+
+        return cached["image_id"]
+
+    @track_mongodb_operation
+    async def set_generated_image_id(self, cache_key: str, image_id: str, provider: str, model: str):
+        """生成条件のキーと、生成した画像IDの対応を保存"""
+        if self.db is None or self.db.image_generation_cache is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        await self.db.image_generation_cache.update_one(
+            {"_id": cache_key},
+            {"$set": {"image_id": image_id, "provider": provider, "model": model, "created_at": get_jst_now()}},
+            upsert=True,
+        )
+
+    @track_mongodb_operation
+    async def delete_generated_image_id(self, cache_key: str):
+        """生成条件のキーと、画像IDの対応を削除"""
+        if self.db is None or self.db.image_generation_cache is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        await self.db.image_generation_cache.delete_one({"_id": cache_key})
+
+    @track_mongodb_operation
+    async def get_cached_score(self, cache_key: str) -> Optional[int]:
+        """キャッシュされたスコアを取得"""
+        if self.db is None or self.db.score_cache is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        cached = await self.db.score_cache.find_one({"_id": cache_key}, {"score": 1})
+        if not cached:
+            return None
+
+        return cached["score"]
+
+    @track_mongodb_operation
+    async def set_cached_score(self, cache_key: str, challenge_id: str, score: int):
+        """スコアをキャッシュに保存（TTLインデックスにより期限切れで自動削除される）"""
+        if self.db is None or self.db.score_cache is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        await self.db.score_cache.update_one(
+            {"_id": cache_key},
+            {"$set": {"challenge_id": challenge_id, "score": score, "created_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+    @track_mongodb_operation
+    async def get_user_challenge(self, user_id: str) -> Optional[dict]:
+        """ユーザーの進行中のチャレンジを取得"""
+        if self.db is None or self.db.user_challenges is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        user_challenge = await self.db.user_challenges.find_one({"_id": user_id})
+        if not user_challenge:
+            return None
+
+        return remove_internal_keys(user_challenge)
+
+    @track_mongodb_operation
+    async def insert_user_challenge_if_absent(self, user_id: str, user_challenge: dict) -> dict:
+        """進行中のチャレンジが無ければ保存し、保存されているものを返す"""
+        if self.db is None or self.db.user_challenges is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        saved = await self.db.user_challenges.find_one_and_update(
+            {"_id": user_id},
+            {"$setOnInsert": user_challenge},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return remove_internal_keys(saved)
+
+    @track_mongodb_operation
+    async def update_user_challenge(self, user_id: str, update: dict, condition: Optional[dict] = None) -> Optional[dict]:
+        """進行中のチャレンジをアトミックに更新し、更新後のものを返す（条件に合わなければNone）"""
+        if self.db is None or self.db.user_challenges is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        updated = await self.db.user_challenges.find_one_and_update(
+            {"_id": user_id, **(condition or {})},
+            update,
+            return_document=ReturnDocument.AFTER,
+        )
+        if not updated:
+            return None
+
+        return remove_internal_keys(updated)
+
+    @track_mongodb_operation
+    async def delete_user_challenge(self, user_id: str) -> bool:
+        """進行中のチャレンジを削除"""
+        if self.db is None or self.db.user_challenges is None:
+            raise ServiceUnavailableError("Could not connect to the service")
+
+        result = await self.db.user_challenges.delete_one({"_id": user_id})
+        return result.deleted_count > 0
+
+    @track_mongodb_operation
+    async def count_user_challenges(self) -> int:
+        """進行中のチャレンジの数を取得"""
+        if self.db is None or self.db.user_challenges is None:
+            raise ServiceUnavailableError("Could not connect to the service")
 
-        return submissions
+        return await self.db.user_challenges.estimated_document_count()
 
 
 def remove_internal_keys(data: dict) -> dict:
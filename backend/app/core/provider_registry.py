@@ -0,0 +1,153 @@
+"""外部AIプロバイダーの共通インターフェースとレジストリ
+    使うプロバイダーとその順序は設定（SCORING_PROVIDERS / IMAGE_PROVIDERS）で決め、
+    呼び出しのたびに直近の一定時間（PROVIDER_STATS_WINDOW_SECONDS）のレイテンシとエラー率から最も速く成功しそうなプロバイダーを選ぶ
+"""
+
+from abc import ABC, abstractmethod
+from collections import deque
+from functools import partial
+import os
+import time
+from typing import Generic, Optional, TypeVar
+
+from app.core.metrics import PROVIDER_ROLLING_ERROR_RATE, PROVIDER_ROLLING_LATENCY
+from app.core.resilience import CircuitBreaker, CircuitOpenError, call_with_resilience
+from app.utils.log_utils import logging
+
+T = TypeVar("T")
+
+PROVIDER_STATS_WINDOW_SECONDS = float(os.getenv("PROVIDER_STATS_WINDOW_SECONDS", "300"))
+# 記録がこの件数に満たないプロバイダーは、状態を確かめるために優先して呼び出す
+PROVIDER_MIN_SAMPLES = int(os.getenv("PROVIDER_MIN_SAMPLES", "5"))
+PROVIDER_MAX_SAMPLES = 1000
+
+
+class ProviderError(Exception):
+    """プロバイダーが失敗を返したことを表す例外（例外を投げないクライアントの失敗を、ブレーカーや記録に反映するために使う）"""
+
+
+class NoProviderAvailableError(Exception):
+    """すべてのプロバイダーの呼び出しに失敗したことを表す例外"""
+
+
+class RollingStats:
+    """直近の一定時間の呼び出しのレイテンシと成否"""
+
+    def __init__(self, window_seconds: float = PROVIDER_STATS_WINDOW_SECONDS, max_samples: int = PROVIDER_MAX_SAMPLES):
+        self.window_seconds = window_seconds
+        self.samples: deque[tuple[float, float, bool]] = deque(maxlen=max_samples)  # (記録した時刻, レイテンシ（秒）, 成功したかどうか)
+
+    def record(self, latency: float, is_success: bool):
+        """1回の呼び出しの結果を記録"""
+        self.samples.append((time.monotonic(), latency, is_success))
+
+    def _trim(self):
+        """期間外の記録を捨てる"""
+        expires_before = time.monotonic() - self.window_seconds
+        while self.samples and self.samples[0][0] < expires_before:
+            self.samples.popleft()
+
+    def summary(self) -> tuple[int, float, float]:
+        """(件数, 平均レイテンシ（秒）, エラー率)"""
+        self._trim()
+        if not self.samples:
+            return 0, 0.0, 0.0
+        count = len(self.samples)
+        mean_latency = sum(latency for _, latency, _ in self.samples) / count
+        error_rate = sum(1 for _, _, is_success in self.samples if not is_success) / count
+        return count, mean_latency, error_rate
+
+
+class Provider(ABC, Generic[T]):
+    """外部AIプロバイダーの共通インターフェース（プロンプトを受け取り、結果を返す）"""
+
+    name = ""
+
+    def __init__(self):
+        # ブレーカーの名前はメトリクスの service ラベルとそろえる
+        self.breaker = CircuitBreaker(self.name)
+        self.stats = RollingStats()
+
+    async def connect(self):
+        """クライアントを初期化"""
+
+    async def close(self):
+        """コネクションプールを閉じる"""
+
+    @abstractmethod
+    async def invoke(self, prompt: str) -> T:
+        """プロバイダーを呼び出す（失敗した場合は例外を投げる）"""
+
+    def expected_latency(self) -> Optional[float]:
+        """成功するまでにかかると見込まれる時間（秒）（記録が足りない場合はNone）"""
+        count, mean_latency, error_rate = self.stats.summary()
+        if count < PROVIDER_MIN_SAMPLES:
+            return None
+        # 失敗すると別のプロバイダーでやり直すため、エラー率が高いほど遅いとみなす
+        return mean_latency / max(1 - error_rate, 0.01)
+
+
+class ProviderRegistry(Generic[T]):
+    """同じ種類（採点・画像生成）のプロバイダーを登録し、呼び出し先を選ぶ"""
+
+    def __init__(self, kind: str, providers: list[Provider[T]], enabled_names: str = ""):
+        self.kind = kind
+        self.providers = {provider.name: provider for provider in providers}
+        self.enabled: list[Provider[T]] = []
+        self.configure(enabled_names)
+
+    def configure(self, enabled_names: str):
+        """使うプロバイダーをカンマ区切りの名前で指定する（先頭ほど優先、空の場合は登録したすべて）"""
+        names = [name.strip() for name in enabled_names.split(",") if name.strip()] or list(self.providers)
+        unknown_names = [name for name in names if name not in self.providers]
+        if unknown_names:
+            logging(f"ProviderRegistry.configure: unknown {self.kind} providers are ignored: {unknown_names}")
+        self.enabled = [self.providers[name] for name in names if name in self.providers]
+        logging(f"ProviderRegistry.configure: {self.kind} providers: {[provider.name for provider in self.enabled]}")
+
+    def ranked(self) -> list[Provider[T]]:
+        """呼び出す順に並べたプロバイダー（記録の足りないもの → 見込みの時間が短いもの、同じなら設定の順）"""
+
+        def sort_key(item: tuple[int, Provider[T]]) -> tuple[float, int]:
+            priority, provider = item
+            expected_latency = provider.expected_latency()
+            return (-1.0 if expected_latency is None else expected_latency), priority
+
+        return [provider for _, provider in sorted(enumerate(self.enabled), key=sort_key)]
+
+    async def call(self, prompt: str, deadline: float, max_retries: int) -> tuple[T, str]:
+        """順にプロバイダーを呼び出し、(結果, 呼び出したプロバイダーの名前) を返す"""
+        last_error: Optional[Exception] = None
+        for provider in self.ranked():
+            start = time.perf_counter()
+            try:
+                result = await call_with_resilience(provider.breaker, partial(provider.invoke, prompt), deadline, max_retries)
+            except CircuitOpenError as e:
+                # 呼び出していないので記録しない
+                last_error = e
+                continue
+            except Exception as e:
+                self._record(provider, time.perf_counter() - start, False)
+                logging(f"ProviderRegistry.call: {self.kind}/{provider.name} ", e)
+                last_error = e
+                continue
+            self._record(provider, time.perf_counter() - start, True)
+            return result, provider.name
+        raise NoProviderAvailableError(f"No {self.kind} provider is available: {last_error}")
+
+    def _record(self, provider: Provider[T], latency: float, is_success: bool):
+        """呼び出しの結果を記録し、メトリクスを更新する"""
+        provider.stats.record(latency, is_success)
+        _, mean_latency, error_rate = provider.stats.summary()
+        PROVIDER_ROLLING_LATENCY.labels(self.kind, provider.name).set(mean_latency)
+        PROVIDER_ROLLING_ERROR_RATE.labels(self.kind, provider.name).set(error_rate)
+
+    async def connect(self):
+        """使うプロバイダーのクライアントを初期化"""
+        for provider in self.enabled:
+            await provider.connect()
+
+    async def close(self):
+        """登録したプロバイダーのコネクションプールを閉じる"""
+        for provider in self.providers.values():
+            await provider.close()
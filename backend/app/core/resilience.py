@@ -0,0 +1,130 @@
+"""外部APIの呼び出しを劣化から守るための仕組み（サーキットブレーカー、ジッター付きリトライ、呼び出しの期限）"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import groq
+import httpx
+import openai
+
+from app.core.metrics import CIRCUIT_BREAKER_STATE, record_outbound_error
+
+T = TypeVar("T")
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+CIRCUIT_STATE_VALUES = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1, CIRCUIT_OPEN: 2}
+
+# リトライすれば成功する可能性があるステータスコード（タイムアウト・レート制限・サーバーエラー）
+RETRYABLE_STATUS_CODES = frozenset({408, 429}) | frozenset(range(500, 600))
+# 接続やタイムアウトのエラー（SDKのタイムアウトの例外は接続エラーのサブクラス）
+RETRYABLE_ERROR_TYPES = (asyncio.TimeoutError, ConnectionError, httpx.TransportError, openai.APIConnectionError, groq.APIConnectionError)
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いているため呼び出さなかったことを表す例外"""
+
+
+class DeadlineExceededError(Exception):
+    """呼び出しの期限を過ぎたことを表す例外"""
+
+
+class CircuitBreaker:
+    """連続した失敗が閾値を超えたら一定時間呼び出しを止め、その後1件だけ試して復旧を確認する"""
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+        self.reset_timeout = reset_timeout or float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_in_flight = False
+        CIRCUIT_BREAKER_STATE.labels(name).set(CIRCUIT_STATE_VALUES[self.state])
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_BREAKER_STATE.labels(self.name).set(CIRCUIT_STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """呼び出してよいかどうか（半開状態では1件だけ通す）"""
+        if self.state == CIRCUIT_OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._set_state(CIRCUIT_HALF_OPEN)
+        if self.state == CIRCUIT_HALF_OPEN:
+            if self.half_open_in_flight:
+                return False
+            self.half_open_in_flight = True
+        return True
+
+    def record_success(self):
+        """呼び出しの成功を記録"""
+        self.consecutive_failures = 0
+        self.half_open_in_flight = False
+        if self.state != CIRCUIT_CLOSED:
+            self._set_state(CIRCUIT_CLOSED)
+
+    def record_failure(self):
+        """呼び出しの失敗を記録"""
+        self.consecutive_failures += 1
+        self.half_open_in_flight = False
+        if self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(CIRCUIT_OPEN)
+
+
+def is_retryable(error: Exception) -> bool:
+    """リトライすれば成功する可能性がある例外かどうか
+    接続・タイムアウトのエラーと、ステータスコードが408・429・5xxのエラーのみ（OpenAI・GroqのSDKの例外はstatus_codeを持つ）
+    不正な応答（ValueErrorなど）は、リトライしても同じ応答が返る可能性が高いためリトライしない
+    """
+    if isinstance(error, RETRYABLE_ERROR_TYPES):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None and isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+async def call_with_resilience(
+    breaker: CircuitBreaker,
+    func: Callable[[], Awaitable[T]],
+    deadline: float,
+    max_retries: int = 2,
+    base_delay: float = 0.2,
+) -> T:
+    """サーキットブレーカーを通し、期限（秒）内でジッター付きの指数バックオフでリトライしながら呼び出す"""
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit breaker for {breaker.name} is open")
+
+    expires_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        remaining = expires_at - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise DeadlineExceededError(f"Deadline exceeded for {breaker.name}")
+            result = await asyncio.wait_for(func(), remaining)
+        except asyncio.CancelledError:
+            breaker.half_open_in_flight = False
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                # 期限切れはSDKの例外にならないため、ここでエラーとして数える
+                record_outbound_error(breaker.name, "deadline")
+            # full jitter：0〜(base_delay × 2^attempt) の間でランダムに待つ
+            delay = random.uniform(0, base_delay * (2**attempt))
+            if attempt >= max_retries or not is_retryable(e) or time.monotonic() + delay >= expires_at:
+                breaker.record_failure()
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+
+        breaker.record_success()
+        return result
@@ -0,0 +1,90 @@
+"""採点結果のキャッシュ
+    (チャレンジID, 模範解答, 正規化した提出テキスト, プロンプトの版数) をキーにして、
+    プロセス内のLRUとMongoDB（TTL付き、ワーカー間で共有）の2段で保持する
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+from typing import Optional
+
+from app.core.metrics import SCORE_CACHE_LOOKUPS
+from app.core.mongodb_core import db
+from app.utils.challenge_utils import SCORE_PROMPT_VERSION, normalize_submission
+from app.utils.log_utils import logging
+
+
+class ScoreCache:
+    """採点結果のキャッシュ"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def create_key(challenge_id: str, result_sample: str, submission: str) -> str:
+        """キャッシュキーを作成（チャレンジの模範解答が変わったら、以前の採点結果は使わない）"""
+        result_sample_hash = hashlib.sha256(result_sample.encode()).hexdigest()
+        raw_key = f"{SCORE_PROMPT_VERSION}\0{challenge_id}\0{result_sample_hash}\0{normalize_submission(submission)}"
+        return hashlib.sha256(raw_key.encode()).hexdigest()
+
+    async def get(self, challenge_id: str, result_sample: str, submission: str) -> Optional[int]:
+        """キャッシュされたスコアを取得（存在しない場合はNone）"""
+        key = self.create_key(challenge_id, result_sample, submission)
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.memory_hits += 1
+            SCORE_CACHE_LOOKUPS.labels("memory_hit").inc()
+            return self.entries[key]
+
+        try:
+            score = await db.get_cached_score(key)
+        except Exception as e:
+            logging("ScoreCache.get: ", e)
+            score = None
+
+        if score is None:
+            self.misses += 1
+            SCORE_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        self.db_hits += 1
+        SCORE_CACHE_LOOKUPS.labels("db_hit").inc()
+        self._put(key, score)
+        return score
+
+    async def set(self, challenge_id: str, result_sample: str, submission: str, score: int):
+        """スコアをキャッシュに保存"""
+        key = self.create_key(challenge_id, result_sample, submission)
+        self._put(key, score)
+
+        try:
+            await db.set_cached_score(key, challenge_id, score)
+        except Exception as e:
+            logging("ScoreCache.set: ", e)
+
+    def _put(self, key: str, score: int):
+        """プロセス内のLRUに保存し、上限を超えたら古いものから捨てる"""
+        self.entries[key] = score
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """ヒット・ミスの回数を返す"""
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
+
+
+# グローバルな採点キャッシュのインスタンス
+score_cache = ScoreCache(max_entries=int(os.getenv("SCORE_CACHE_MAX_ENTRIES", "1024")))
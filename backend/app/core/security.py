@@ -1,19 +1,44 @@
 """Security module for authentication and authorization"""
 
 from typing import Optional, Dict, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+import asyncio
+import hashlib
+import inspect
 import os
+import time
 from datetime import datetime, timedelta, timezone
 import bcrypt
 import jwt
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+from app.core.exceptions import ServiceUnavailableError
+from app.core.metrics import PASSWORD_VERIFICATION_LATENCY, PASSWORD_VERIFICATIONS_PENDING, PASSWORD_VERIFICATIONS_REJECTED, TOKEN_CACHE_LOOKUPS
+
 security = HTTPBearer()
 SECRET_KEY: str = os.getenv("SECRET_KEY", os.urandom(32).hex())
 ALGORITHM: str = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
 REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+PASSWORD_VERIFY_WORKERS: int = int(os.getenv("PASSWORD_VERIFY_WORKERS", "2"))
+PASSWORD_VERIFY_MAX_PENDING: int = int(os.getenv("PASSWORD_VERIFY_MAX_PENDING", "32"))
+
+# bcrypt takes ~200ms of CPU per check, so it runs on dedicated threads instead of the event loop
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_VERIFY_WORKERS, thread_name_prefix="password-verify")
+pending_password_verifications: int = 0
+
+# Decoded claims keyed by the token's digest, so repeated requests with the same bearer token skip the HS256 verification
+TOKEN_CACHE_MAX_ENTRIES: int = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+decoded_token_cache: OrderedDict[bytes, dict] = OrderedDict()
+
+
+def get_user_roles(user_id: str) -> list:
+    """Return the roles to embed in the user's tokens (admins are listed in ADMIN_USER_ID)"""
+    admin_user_ids = os.getenv("ADMIN_USER_ID", "").split(",")
+    return ["admin"] if user_id in admin_user_ids else []
 
 
 def create_access_token(data: dict) -> str:
@@ -34,11 +59,52 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
 
+def _timed_verify_password(plain_password: str, hashed_password: str, submitted_at: float) -> bool:
+    started_at = time.perf_counter()
+    PASSWORD_VERIFICATION_LATENCY.labels("wait").observe(started_at - submitted_at)
+    try:
+        return verify_password(plain_password, hashed_password)
+    finally:
+        PASSWORD_VERIFICATION_LATENCY.labels("verify").observe(time.perf_counter() - started_at)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify the password on the bounded executor, rejecting with 503 when too many checks are pending"""
+    global pending_password_verifications
+    if pending_password_verifications >= PASSWORD_VERIFY_MAX_PENDING:
+        PASSWORD_VERIFICATIONS_REJECTED.inc()
+        raise ServiceUnavailableError("Too many login attempts. Please retry later.")
+
+    pending_password_verifications += 1
+    PASSWORD_VERIFICATIONS_PENDING.set(pending_password_verifications)
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, _timed_verify_password, plain_password, hashed_password, time.perf_counter())
+    finally:
+        pending_password_verifications -= 1
+        PASSWORD_VERIFICATIONS_PENDING.set(pending_password_verifications)
+
+
 def decode_token(token: str) -> dict:
+    token_digest = hashlib.sha256(token.encode()).digest()
+    cached_token = decoded_token_cache.get(token_digest)
+    if cached_token is not None:
+        if cached_token["exp"] >= datetime.now(timezone.utc).timestamp():
+            TOKEN_CACHE_LOOKUPS.labels("hit").inc()
+            decoded_token_cache.move_to_end(token_digest)
+            return dict(cached_token)
+        TOKEN_CACHE_LOOKUPS.labels("expired").inc()
+        decoded_token_cache.pop(token_digest, None)
+        raise HTTPException(status_code=401, detail="Token expired")
+
+    TOKEN_CACHE_LOOKUPS.labels("miss").inc()
     try:
         decoded_token = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         if decoded_token["exp"] >= datetime.now(timezone.utc).timestamp():
-            return decoded_token
+            decoded_token_cache[token_digest] = decoded_token
+            if len(decoded_token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+                decoded_token_cache.popitem(last=False)
+            return dict(decoded_token)
         else:
             raise ValueError("Token expired")
     except jwt.ExpiredSignatureError:
@@ -54,6 +120,9 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(
     return token
 
 
+REQUIRE_AUTH_TOKEN_PARAMETER = "require_auth_token"
+
+
 def require_auth(roles: Optional[list] = None):
     """
     Decorator for protecting routes with JWT authentication and optional role-based access
@@ -63,7 +132,8 @@ def require_auth(roles: Optional[list] = None):
 
     def decorator(func):
         @wraps(func)
-        async def wrapper(*args, token: Dict[str, Any] = Security(get_current_user), **kwargs):
+        async def wrapper(*args, **kwargs):
+            token = kwargs.pop(REQUIRE_AUTH_TOKEN_PARAMETER)
             # Check roles if specified
             if roles:
                 user_roles = token.get("roles", [])
@@ -72,6 +142,11 @@ def require_auth(roles: Optional[list] = None):
 
             return await func(*args, **kwargs)
 
+        # FastAPI resolves dependencies from the endpoint's signature, so the token is added to it here
+        # instead of requiring every endpoint to declare a `current_user` parameter (the decoded token is cached per request)
+        signature = inspect.signature(func)
+        token_parameter = inspect.Parameter(REQUIRE_AUTH_TOKEN_PARAMETER, inspect.Parameter.KEYWORD_ONLY, default=Security(get_current_user), annotation=Dict[str, Any])
+        wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(), token_parameter])
         return wrapper
 
     return decorator
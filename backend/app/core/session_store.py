@@ -0,0 +1,177 @@
+"""ユーザーが取り組んでいるチャレンジ（UserChallenges）を保持するセッションストア
+    SESSION_STORE=mongodb の場合はMongoDBに保存し、複数のワーカー・レプリカで共有できる
+"""
+
+from abc import ABC, abstractmethod
+import os
+import time
+from typing import Optional
+
+from app.core.mongodb_core import db
+from app.models.pydantic_models import UserChallenges
+
+
+class SessionStore(ABC):
+    """セッションストアのインターフェース"""
+
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[UserChallenges]:
+        """進行中のチャレンジを取得（無ければNone）"""
+
+    @abstractmethod
+    async def create(self, user_id: str, user_challenge: UserChallenges) -> UserChallenges:
+        """進行中のチャレンジが無ければ保存し、保存されているものを返す"""
+
+    @abstractmethod
+    async def delete(self, user_id: str) -> bool:
+        """進行中のチャレンジを削除"""
+
+    @abstractmethod
+    async def try_mark_submitted(self, user_id: str, now: float, interval: float) -> bool:
+        """前回の提出から interval 秒以上経っていれば提出時刻を更新してTrueを返す"""
+
+    @abstractmethod
+    async def record_submission(self, user_id: str, submission: dict, text: str, score: int) -> Optional[UserChallenges]:
+        """提出を追加し、最新の提出テキストとスコアを更新する（revisionを1つ進める）"""
+
+    @abstractmethod
+    async def append_generated_image(self, user_id: str, session_id: str, filename: str) -> Optional[UserChallenges]:
+        """画像生成を依頼したときと同じセッションの場合のみ、生成された画像を追加する（revisionを1つ進める）
+        同じチャレンジをやり直した場合もセッションは変わるため、前のセッションの画像は追加しない
+        """
+
+    @abstractmethod
+    async def count(self) -> int:
+        """進行中のチャレンジの数を取得"""
+
+
+class InMemorySessionStore(SessionStore):
+    """プロセス内の辞書に保持するセッションストア（単一ワーカー向け）"""
+
+    def __init__(self):
+        self.user_challenges: dict[str, UserChallenges] = {}
+
+    async def get(self, user_id: str) -> Optional[UserChallenges]:
+        return self.user_challenges.get(user_id)
+
+    async def create(self, user_id: str, user_challenge: UserChallenges) -> UserChallenges:
+        return self.user_challenges.setdefault(user_id, user_challenge)
+
+    async def delete(self, user_id: str) -> bool:
+        return self.user_challenges.pop(user_id, None) is not None
+
+    async def try_mark_submitted(self, user_id: str, now: float, interval: float) -> bool:
+        user_challenge = self.user_challenges.get(user_id)
+        if user_challenge is None or user_challenge.last_submitted_unix_time + interval > now:
+            return False
+        user_challenge.last_submitted_unix_time = now
+        return True
+
+    async def record_submission(self, user_id: str, submission: dict, text: str, score: int) -> Optional[UserChallenges]:
+        user_challenge = self.user_challenges.get(user_id)
+        if user_challenge is None:
+            return None
+        user_challenge.submissions.append(submission)
+        user_challenge.last_submitted_text = text
+        user_challenge.last_submission_score = score
+        user_challenge.revision += 1
+        return user_challenge
+
+    async def append_generated_image(self, user_id: str, session_id: str, filename: str) -> Optional[UserChallenges]:
+        user_challenge = self.user_challenges.get(user_id)
+        if user_challenge is None or user_challenge.session_id != session_id:
+            return None
+        user_challenge.generated_image.append(filename)
+        user_challenge.revision += 1
+        return user_challenge
+
+    async def count(self) -> int:
+        return len(self.user_challenges)
+
+
+class MongoSessionStore(SessionStore):
+    """MongoDBに保持するセッションストア
+    更新は $push / $set によるアトミックな操作で行い、読み込みは短時間だけプロセス内にキャッシュする
+    """
+
+    def __init__(self, cache_ttl_seconds: float = 1.0, cache_max_entries: int = 1024):
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.cache_max_entries = cache_max_entries
+        self.cache: dict[str, tuple[float, UserChallenges]] = {}
+
+    def _cache_put(self, user_id: str, user_challenge: Optional[dict]) -> Optional[UserChallenges]:
+        """MongoDBから読み込んだ（更新した）値をキャッシュに反映"""
+        if user_challenge is None:
+            self.cache.pop(user_id, None)
+            return None
+
+        if len(self.cache) >= self.cache_max_entries:
+            now = time.monotonic()
+            self.cache = {key: value for key, value in self.cache.items() if value[0] > now}
+            if len(self.cache) >= self.cache_max_entries:
+                self.cache.clear()
+
+        restored = UserChallenges.from_dict(user_challenge)
+        self.cache[user_id] = (time.monotonic() + self.cache_ttl_seconds, restored)
+        return restored
+
+    async def get(self, user_id: str) -> Optional[UserChallenges]:
+        cached = self.cache.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        return self._cache_put(user_id, await db.get_user_challenge(user_id))
+
+    async def create(self, user_id: str, user_challenge: UserChallenges) -> UserChallenges:
+        saved = await db.insert_user_challenge_if_absent(user_id, user_challenge.to_dict())
+        return self._cache_put(user_id, saved)
+
+    async def delete(self, user_id: str) -> bool:
+        self.cache.pop(user_id, None)
+        return await db.delete_user_challenge(user_id)
+
+    async def try_mark_submitted(self, user_id: str, now: float, interval: float) -> bool:
+        updated = await db.update_user_challenge(
+            user_id,
+            {"$set": {"last_submitted_unix_time": now}},
+            condition={"last_submitted_unix_time": {"$lte": now - interval}},
+        )
+        if updated is None:
+            return False
+        self._cache_put(user_id, updated)
+        return True
+
+    async def record_submission(self, user_id: str, submission: dict, text: str, score: int) -> Optional[UserChallenges]:
+        updated = await db.update_user_challenge(
+            user_id,
+            {
+                "$push": {"submissions": submission},
+                "$set": {"last_submitted_text": text, "last_submission_score": score},
+                "$inc": {"revision": 1},
+            },
+        )
+        return self._cache_put(user_id, updated)
+
+    async def append_generated_image(self, user_id: str, session_id: str, filename: str) -> Optional[UserChallenges]:
+        updated = await db.update_user_challenge(
+            user_id,
+            {"$push": {"generated_image": filename}, "$inc": {"revision": 1}},
+            condition={"session_id": session_id},
+        )
+        if updated is None:
+            return None
+        return self._cache_put(user_id, updated)
+
+    async def count(self) -> int:
+        return await db.count_user_challenges()
+
+
+def create_session_store() -> SessionStore:
+    """環境変数 SESSION_STORE に応じてセッションストアを生成"""
+    if os.getenv("SESSION_STORE", "memory") == "mongodb":
+        return MongoSessionStore(cache_ttl_seconds=float(os.getenv("SESSION_CACHE_TTL_SECONDS", "1.0")))
+    return InMemorySessionStore()
+
+
+# グローバルなセッションストアのインスタンス
+session_store = create_session_store()
@@ -1,6 +1,7 @@
 """ Pydanticモデルを定義するモジュール """
 
-from typing import List
+from typing import List, Optional
+import uuid
 
 from pydantic import BaseModel
 
@@ -31,6 +32,13 @@ class SubmitRequest(BaseModel):
     challenge_id: str
 
 
+class BatchTrialScoringRequest(BaseModel):
+    """体験版の採点ロジックによる一括採点のリクエスト"""
+
+    submissions: List[str]
+    challenge_ids: Optional[List[str]] = None  # 指定しない場合は全チャレンジ
+
+
 class UserChallenges:
     """ユーザーが取り組んでいるチャレンジを管理するクラス"""
 
@@ -42,3 +50,32 @@ class UserChallenges:
         self.last_submitted_text = ""
         self.last_submission_score = 0
         self.generated_image = []  # [{"timestamp": "2021-09-01T00:00:00", "base64": "base64image"}, ...]
+        self.session_id = uuid.uuid4().hex  # チャレンジを開始するたびに変わる
+        self.revision = 0  # 進捗（提出・生成画像）が変わるたびに増える（ETagに使う）
+
+    def to_dict(self) -> dict:
+        """セッションストアに保存するための辞書に変換"""
+        return {
+            "now_challenge_id": self.now_challenge_id,
+            "now_challenge": self.now_challenge,
+            "submissions": self.submissions,
+            "last_submitted_unix_time": self.last_submitted_unix_time,
+            "last_submitted_text": self.last_submitted_text,
+            "last_submission_score": self.last_submission_score,
+            "generated_image": self.generated_image,
+            "session_id": self.session_id,
+            "revision": self.revision,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserChallenges":
+        """セッションストアから読み込んだ辞書から復元"""
+        user_challenge = cls(now_challenge_id=data["now_challenge_id"], now_challenge=data["now_challenge"])
+        user_challenge.submissions = data.get("submissions", [])
+        user_challenge.last_submitted_unix_time = data.get("last_submitted_unix_time", 0)
+        user_challenge.last_submitted_text = data.get("last_submitted_text", "")
+        user_challenge.last_submission_score = data.get("last_submission_score", 0)
+        user_challenge.generated_image = data.get("generated_image", [])
+        user_challenge.session_id = data.get("session_id", "")
+        user_challenge.revision = data.get("revision", 0)
+        return user_challenge
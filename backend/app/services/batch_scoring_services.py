@@ -0,0 +1,90 @@
+""" 体験版の採点ロジックで、多数の提出を全チャレンジに対してまとめて採点するサービスモジュール
+    提出と模範解答を単語の行列に変換し、行列積で N件の提出 × M件のチャレンジ を一度に採点する
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, List, Optional
+
+import numpy as np
+
+from app.core.challenge_catalog import challenge_catalog
+from app.utils.challenge_utils import SCORE_MAGNIFICATION_TRIAL, submission_validation, tokenize_for_trial
+
+BATCH_CHUNK_SIZE = 256  # 1度に行列に変換する提出の数
+
+
+class TrialScoringMatrix:
+    """模範解答の単語の行列（チャレンジ × 語彙）"""
+
+    def __init__(self, challenge_ids: List[str], result_tokens: List[frozenset[str]]):
+        self.challenge_ids = challenge_ids
+        # 模範解答に無い単語はスコアに影響しないため、語彙は模範解答の単語だけでよい
+        self.vocabulary = {token: index for index, token in enumerate(sorted(frozenset().union(*result_tokens)))}
+
+        self.result_matrix = np.zeros((len(challenge_ids), len(self.vocabulary)), dtype=np.float32)
+        for row, tokens in enumerate(result_tokens):
+            self.result_matrix[row, [self.vocabulary[token] for token in tokens]] = 1.0
+        self.result_sizes = self.result_matrix.sum(axis=1, dtype=np.float64)
+
+    def encode(self, submissions: List[str]) -> np.ndarray:
+        """提出を単語の行列（提出 × 語彙）に変換"""
+        submission_matrix = np.zeros((len(submissions), len(self.vocabulary)), dtype=np.float32)
+        for row, submission in enumerate(submissions):
+            columns = [self.vocabulary[token] for token in tokenize_for_trial(submission) if token in self.vocabulary]
+            submission_matrix[row, columns] = 1.0
+        return submission_matrix
+
+    def score(self, submissions: List[str]) -> np.ndarray:
+        """提出 × チャレンジ のスコアの行列を計算（calculate_trial_score と同じ結果になる）"""
+        common_counts = (self.encode(submissions) @ self.result_matrix.T).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.trunc(common_counts / self.result_sizes * SCORE_MAGNIFICATION_TRIAL)
+        scores[:, self.result_sizes == 0] = 0
+        return np.clip(scores, 0, 100).astype(np.int64)
+
+
+class BatchScoringService:
+    """チャレンジ一覧を読み込み直すたびに行列を作り直して使い回すサービス"""
+
+    def __init__(self):
+        self.matrix: Optional[TrialScoringMatrix] = None
+        self.matrix_result_tokens: Optional[dict[str, frozenset[str]]] = None
+
+    async def get_matrix(self) -> TrialScoringMatrix:
+        """現在のチャレンジ一覧に対応する行列を取得"""
+        await challenge_catalog.ensure_loaded()
+        # 変更ストリームによる読み込み直しでは版数が変わらないことがあるため、読み込みのたびに作られる模範解答の辞書そのもので判定する
+        result_tokens = challenge_catalog.result_tokens
+        if self.matrix is None or self.matrix_result_tokens is not result_tokens:
+            challenge_ids = list(result_tokens)
+            self.matrix = TrialScoringMatrix(challenge_ids, [result_tokens[challenge_id] for challenge_id in challenge_ids])
+            self.matrix_result_tokens = result_tokens
+        return self.matrix
+
+    @staticmethod
+    async def stream_scores(matrix: TrialScoringMatrix, submissions: List[str], challenge_ids: Optional[List[str]] = None) -> AsyncIterator[bytes]:
+        """提出ごとのスコアをNDJSONの行として順に返す（行列は応答を始める前に get_matrix で取得しておく）"""
+        columns = list(range(len(matrix.challenge_ids)))
+        if challenge_ids is not None:
+            selected_ids = set(challenge_ids)
+            columns = [column for column, challenge_id in enumerate(matrix.challenge_ids) if challenge_id in selected_ids]
+
+        for start in range(0, len(submissions), BATCH_CHUNK_SIZE):
+            chunk = submissions[start : start + BATCH_CHUNK_SIZE]
+            # 行列の計算はCPUを使うため、スレッドに逃がしてイベントループを止めない
+            scores = await asyncio.to_thread(matrix.score, chunk)
+
+            lines = []
+            for offset, submission in enumerate(chunk):
+                line = {"index": start + offset}
+                if submission_validation(submission):
+                    line["scores"] = {matrix.challenge_ids[column]: int(scores[offset, column]) for column in columns}
+                else:
+                    line["error"] = "Submission text is invalid."
+                lines.append(json.dumps(line, ensure_ascii=False))
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# グローバルな一括採点サービスのインスタンス
+batch_scoring_service = BatchScoringService()
@@ -1,9 +1,13 @@
 """ GroqのAPIクライアントを提供するサービスモジュール """
 
-from typing import List
-from groq import Groq
+import os
+from typing import List, Optional
+from groq import Groq, AsyncGroq
 from groq.types.chat import ChatCompletionMessageParam
 
+from app.core.metrics import observe_outbound
+from app.utils.http_utils import create_pooled_async_client
+
 
 class GroqClient:
     """GroqのAPIクライアントを提供するサービスクラス"""
@@ -21,3 +25,48 @@ class GroqClient:
             temperature=temperature,  # 温度パラメータ（応答のランダム性）
         )
         return completion.choices[0].message.content or ""
+
+
+class AsyncGroqClient:
+    """GroqのAPIの非同期クライアント
+    起動時に1度だけ初期化し、keep-aliveのコネクションプールを使い回す
+    """
+
+    def __init__(self):
+        self.client: Optional[AsyncGroq] = None
+
+    async def connect(self):
+        """クライアントを初期化"""
+        if self.client is not None:
+            return
+
+        self.client = AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY", ""),
+            base_url=os.getenv("GROQ_BASE_URL") or None,
+            http_client=create_pooled_async_client(),
+            max_retries=0,  # リトライは app.core.resilience で期限内に収まるように行う
+        )
+
+    async def close(self):
+        """コネクションプールを閉じる"""
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def chat(self, messages: List[ChatCompletionMessageParam], max_tokens: int = 8192, temperature: float = 0.2) -> str:
+        """イベントループをブロックせずにGroqのチャットの応答を取得"""
+        if self.client is None:
+            await self.connect()
+
+        with observe_outbound("groq", "chat"):
+            completion = await self.client.chat.completions.create(
+                model="llama-3.2-90b-vision-preview",  # 使用するモデル
+                messages=messages,  # メッセージのリスト
+                max_tokens=max_tokens,  # 最大トークン数
+                temperature=temperature,  # 温度パラメータ（応答のランダム性）
+            )
+        return completion.choices[0].message.content or ""
+
+
+# グローバルな非同期クライアントのインスタンス（起動時にconnectする）
+groq_client = AsyncGroqClient()
@@ -0,0 +1,122 @@
+""" 画像生成の結果をキャッシュするサービスモジュール
+    (プロバイダー, モデル, 正規化したプロンプト, 生成パラメータ) をキーにして生成済みの画像IDをMongoDBに保持し、
+    同じ条件の生成ではプロバイダーを呼び出さない
+    生成画像の合計サイズが上限（IMAGE_STORAGE_MAX_BYTES）を超えたら、どの提出にも使われていない画像を古い順に削除する
+"""
+
+import asyncio
+from datetime import timedelta
+import hashlib
+import json
+import os
+from typing import Optional
+
+from app.core.image_index import image_index
+from app.core.metrics import EVICTED_GENERATED_IMAGES, GENERATED_IMAGES_BYTES, IMAGE_GENERATION_CACHE_LOOKUPS
+from app.core.mongodb_core import db
+from app.services.image_variant_services import image_variant_store
+from app.utils.challenge_utils import normalize_submission
+from app.utils.log_utils import logging
+from app.utils.time_utils import get_jst_now
+
+IMAGE_STORAGE_MAX_BYTES = int(os.getenv("IMAGE_STORAGE_MAX_BYTES", str(5 * 1024**3)))
+# 進行中のチャレンジで表示されている画像を消さないよう、最後に使われてからこの時間が経つまでは削除しない
+IMAGE_EVICTION_GRACE_SECONDS = int(os.getenv("IMAGE_EVICTION_GRACE_SECONDS", str(24 * 60 * 60)))
+IMAGE_EVICTION_BATCH_SIZE = 100
+
+
+def get_generated_images_bytes() -> int:
+    """生成画像（縮小版を含む）の合計サイズ"""
+    with os.scandir(image_index.base_dir) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.name.startswith("gen_") and entry.is_file())
+
+
+class ImageGenerationCache:
+    """画像生成の結果のキャッシュ"""
+
+    def __init__(self):
+        self.eviction_lock = asyncio.Lock()
+
+    @staticmethod
+    def create_key(provider: str, model: str, prompt: str, params: dict) -> str:
+        """キャッシュキーを作成"""
+        raw_key = json.dumps([provider, model, normalize_submission(prompt), params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw_key.encode()).hexdigest()
+
+    async def get(self, provider: str, model: str, prompt: str, params: dict) -> Optional[str]:
+        """生成済みの画像IDを取得（存在しない場合や、画像が削除されている場合はNone）"""
+        cache_key = self.create_key(provider, model, prompt, params)
+        try:
+            image_id = await db.get_generated_image_id(cache_key)
+        except Exception as e:
+            logging("ImageGenerationCache.get: ", e)
+            image_id = None
+
+        if image_id is None:
+            IMAGE_GENERATION_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        # インデックスに残っていても、他のワーカーや手作業でファイルが消されている場合があるのでディスクを確認する
+        entry = image_index.get(image_id)
+        if entry is None or not entry.path.is_file():
+            IMAGE_GENERATION_CACHE_LOOKUPS.labels("miss").inc()
+            image_index.remove(image_id)
+            try:
+                await db.delete_generated_image_id(cache_key)
+            except Exception as e:
+                logging("ImageGenerationCache.get: ", e)
+            return None
+
+        IMAGE_GENERATION_CACHE_LOOKUPS.labels("hit").inc()
+        return image_id
+
+    async def set(self, provider: str, model: str, prompt: str, params: dict, image_id: str):
+        """生成した画像IDをキャッシュに保存"""
+        try:
+            await db.set_generated_image_id(self.create_key(provider, model, prompt, params), image_id, provider, model)
+        except Exception as e:
+            logging("ImageGenerationCache.set: ", e)
+
+    async def evict_if_needed(self):
+        """生成画像の合計サイズが上限を超えていれば、使われていない画像を古い順に削除する"""
+        async with self.eviction_lock:
+            total_bytes = await asyncio.to_thread(get_generated_images_bytes)
+            GENERATED_IMAGES_BYTES.set(total_bytes)
+            if total_bytes <= IMAGE_STORAGE_MAX_BYTES:
+                return
+
+            referenced_before = get_jst_now() - timedelta(seconds=IMAGE_EVICTION_GRACE_SECONDS)
+            evicted_count = 0
+            while total_bytes > IMAGE_STORAGE_MAX_BYTES:
+                image_ids = await db.get_evictable_images(referenced_before, IMAGE_EVICTION_BATCH_SIZE)
+                if not image_ids:
+                    break
+                evicted_ids = []
+                for image_id in image_ids:
+                    if total_bytes <= IMAGE_STORAGE_MAX_BYTES:
+                        break
+                    total_bytes -= await asyncio.to_thread(self._remove_image, image_id)
+                    evicted_ids.append(image_id)
+                await db.delete_generated_images(evicted_ids)
+                evicted_count += len(evicted_ids)
+
+            EVICTED_GENERATED_IMAGES.inc(evicted_count)
+            GENERATED_IMAGES_BYTES.set(total_bytes)
+            logging(f"ImageGenerationCache.evict_if_needed: {evicted_count} images evicted, {total_bytes} bytes used")
+
+    @staticmethod
+    def _remove_image(image_id: str) -> int:
+        """画像と縮小版を削除し、削除したバイト数を返す"""
+        image_index.remove(image_id)
+        removed_bytes = image_variant_store.remove_variants_for(image_id)
+        image_path = image_index.base_dir / f"{image_id}.png"
+        try:
+            removed_bytes += image_path.stat().st_size
+            image_path.unlink()
+        except FileNotFoundError:
+            pass
+        return removed_bytes
+
+
+# グローバルな画像生成キャッシュのインスタンス
+image_generation_cache = ImageGenerationCache()
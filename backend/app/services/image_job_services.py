@@ -0,0 +1,356 @@
+""" 画像生成をバックグラウンドのジョブとして処理するサービスモジュール
+    ジョブの状態はMongoDBに保存し、提出APIは採点が終わった時点でジョブIDを返す
+    同時に実行する画像生成はワーカーの数（IMAGE_JOB_WORKERS）、待機できるジョブはキューの長さ（IMAGE_JOB_MAX_QUEUED）までに制限し、
+    あふれたジョブは保留（deferred）としてMongoDBに残して、キューが空いたら古い順に取り出す
+    保留中のジョブが上限（IMAGE_JOB_MAX_DEFERRED）に達している間は、新しい提出を503で断る
+    停止時や異常終了で処理されなかったジョブは保留に戻し、次に起動したワーカーが取り出す
+"""
+
+import asyncio
+from datetime import timedelta
+import os
+import time
+import uuid
+from typing import List, Optional
+
+from app.core.exceptions import ServiceUnavailableError
+from app.core.image_index import image_index
+from app.core.metrics import DEFERRED_IMAGE_JOBS, IMAGE_JOB_WAIT, QUEUED_IMAGE_JOBS, REJECTED_SUBMISSIONS
+from app.core.mongodb_core import db
+from app.core.provider_registry import NoProviderAvailableError, Provider, ProviderError, ProviderRegistry
+from app.core.session_store import session_store
+from app.services.image_cache_services import image_generation_cache
+from app.services.image_variant_services import image_variant_store
+from app.services.open_ai_services import dalle3_client
+from app.services.segmind_services import segmind_client
+from app.utils.log_utils import logging
+from app.utils.time_utils import get_jst_now
+
+JOB_STATUS_DEFERRED = "deferred"
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_FAILED = "failed"
+
+PROVIDER_DALLE3 = "dalle3"
+PROVIDER_SEGMIND = "segmind"
+
+IMAGE_JOB_POLL_INTERVAL = 1.0  # 他のワーカーで処理されるジョブの完了を待つときに、状態を確認する間隔（秒）
+IMAGE_PROVIDER_DEADLINE = float(os.getenv("IMAGE_PROVIDER_DEADLINE", "180"))  # プロバイダーごとの期限（ダウンロードを含む、秒）
+IMAGE_MAX_RETRIES = int(os.getenv("IMAGE_MAX_RETRIES", "0"))  # 画像生成は高価なため、既定ではリトライせずに次のプロバイダーを試す
+# 起動時に、この時間より長く queued / running のままのジョブは、異常終了したワーカーのものとみなして保留に戻す（秒）
+IMAGE_JOB_LEASE_SECONDS = float(os.getenv("IMAGE_JOB_LEASE_SECONDS", "1800"))
+IMAGE_JOB_SHUTDOWN_TIMEOUT = float(os.getenv("IMAGE_JOB_SHUTDOWN_TIMEOUT", "20"))  # 停止時に実行中のジョブが終わるのを待つ最大時間（秒）
+IMAGE_JOB_MAX_DEFERRED = int(os.getenv("IMAGE_JOB_MAX_DEFERRED", "200"))  # 保留できるジョブの上限（全ワーカーの合計）
+IMAGE_JOB_RETRY_AFTER_SECONDS = int(os.getenv("IMAGE_JOB_RETRY_AFTER_SECONDS", "30"))  # 断った提出に Retry-After で伝える待ち時間（秒）
+
+
+class DallE3ImageProvider(Provider[str]):
+    """DALL-E3による画像生成"""
+
+    name = PROVIDER_DALLE3
+
+    @property
+    def model(self) -> str:
+        """生成に使うデプロイ名（キャッシュキーに含める）"""
+        return dalle3_client.model
+
+    @property
+    def params(self) -> dict:
+        """生成結果に影響するパラメータ（キャッシュキーに含める）"""
+        return dalle3_client.params
+
+    async def connect(self):
+        await dalle3_client.connect()
+
+    async def close(self):
+        await dalle3_client.close()
+
+    async def invoke(self, prompt: str) -> str:
+        image_id = await dalle3_client.generate(prompt)
+        if not image_id:
+            raise ProviderError("DALL-E3 failed to generate an image")
+        return image_id
+
+
+class SegmindImageProvider(Provider[str]):
+    """Segmindによる画像生成"""
+
+    name = PROVIDER_SEGMIND
+
+    @property
+    def model(self) -> str:
+        """生成に使うモデル名（キャッシュキーに含める）"""
+        return segmind_client.model
+
+    @property
+    def params(self) -> dict:
+        """生成結果に影響するパラメータ（キャッシュキーに含める）"""
+        return segmind_client.params
+
+    async def connect(self):
+        await segmind_client.connect()
+
+    async def close(self):
+        await segmind_client.close()
+
+    async def invoke(self, prompt: str) -> str:
+        image_id = await segmind_client.create_image(prompt)
+        if not image_id:
+            raise ProviderError("Segmind failed to generate an image")
+        return image_id
+
+
+# グローバルな画像生成プロバイダーのレジストリ（起動時にconnectする）
+image_provider_registry = ProviderRegistry(
+    "image",
+    [DallE3ImageProvider(), SegmindImageProvider()],
+    os.getenv("IMAGE_PROVIDERS", f"{PROVIDER_DALLE3},{PROVIDER_SEGMIND}"),
+)
+
+
+class ImageJobQueue:
+    """画像生成ジョブのキューと、それを処理する非同期ワーカーのプール"""
+
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        # 同じプロセスで完了を待つ処理のための最適化（状態はMongoDBのジョブが正）
+        self.completions: dict[str, asyncio.Future] = {}
+        self.running_jobs: dict[str, dict] = {}
+        self.has_deferred_jobs = False
+        self.is_stopping = False
+        self.eviction_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """ワーカーを起動"""
+        if self.workers:
+            return
+
+        num_workers = int(os.getenv("IMAGE_JOB_WORKERS", "2"))
+        max_queued = int(os.getenv("IMAGE_JOB_MAX_QUEUED", "20"))
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.is_stopping = False
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(num_workers)]
+        logging(f"ImageJobQueue.start: {num_workers} workers started (queue size {max_queued})")
+
+        try:
+            # 異常終了したワーカーのジョブは状態が更新されないまま残るため、保留に戻して取り出し直す
+            requeued_count = await db.requeue_stale_image_jobs(
+                [JOB_STATUS_QUEUED, JOB_STATUS_RUNNING],
+                get_jst_now() - timedelta(seconds=IMAGE_JOB_LEASE_SECONDS),
+                JOB_STATUS_DEFERRED,
+            )
+            if requeued_count:
+                logging(f"ImageJobQueue.start: {requeued_count} stale jobs requeued")
+            # 前回の起動時に保留されたままのジョブがあれば取り出す
+            self.has_deferred_jobs = True
+            await self._fill_from_deferred()
+        except Exception as e:
+            logging("ImageJobQueue.start: ", e)
+
+    async def stop(self):
+        """ワーカーを停止（実行中のジョブは一定時間だけ終わるのを待ち、処理できなかったジョブは保留に戻す）"""
+        if not self.workers:
+            return
+
+        self.is_stopping = True
+        interrupted_jobs = []
+        while not self.queue.empty():
+            interrupted_jobs.append(self.queue.get_nowait())
+            self.queue.task_done()
+        QUEUED_IMAGE_JOBS.set(0)
+
+        deadline = time.monotonic() + IMAGE_JOB_SHUTDOWN_TIMEOUT
+        while self.running_jobs and time.monotonic() < deadline:
+            await asyncio.sleep(min(0.1, max(deadline - time.monotonic(), 0)))
+        interrupted_jobs.extend(self.running_jobs.values())
+
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        # 次に起動したワーカー（他のレプリカを含む）が取り出せるようにする
+        for job in interrupted_jobs:
+            try:
+                await db.update_image_job(job["job_id"], {"status": JOB_STATUS_DEFERRED, "updated_at": get_jst_now()})
+            except Exception as e:
+                logging("ImageJobQueue.stop: ", job["job_id"], e)
+        if interrupted_jobs:
+            logging(f"ImageJobQueue.stop: {len(interrupted_jobs)} jobs returned to deferred")
+
+    async def ensure_capacity(self):
+        """保留中のジョブが上限に達していれば、ServiceUnavailableError（Retry-After付き）を投げる"""
+        try:
+            deferred_count = await db.count_image_jobs(JOB_STATUS_DEFERRED, IMAGE_JOB_MAX_DEFERRED)
+        except Exception as e:
+            # 数えられない場合は断らない（採点は画像生成と関係なく行える）
+            logging("ImageJobQueue.ensure_capacity: ", e)
+            return
+        if deferred_count >= IMAGE_JOB_MAX_DEFERRED:
+            REJECTED_SUBMISSIONS.inc()
+            raise ServiceUnavailableError("Too many image generation jobs are waiting. Please retry later.", retry_after=IMAGE_JOB_RETRY_AFTER_SECONDS)
+
+    async def enqueue(self, user_id: str, challenge_id: str, session_id: str, prompt: str) -> tuple[str, str]:
+        """ジョブを登録して (ジョブID, 状態) を返す（キューが一杯の場合や、先に保留されたジョブがある場合は保留として登録する）"""
+        if self.queue is None:
+            await self.start()
+
+        # 保留中のジョブを追い越さないよう、保留があれば新しいジョブも保留にして古い順に取り出す
+        is_deferred = self.queue.full() or self.is_stopping or self.has_deferred_jobs
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "challenge_id": challenge_id,
+            "session_id": session_id,  # 画像は依頼したセッションにのみ追加する
+            "provider": None,  # 実行時にレジストリが選ぶ
+            "prompt": prompt,
+            "filename": None,  # 生成した画像の内容のハッシュから決まる
+            "status": JOB_STATUS_DEFERRED if is_deferred else JOB_STATUS_QUEUED,
+            "created_at": get_jst_now(),
+            "updated_at": get_jst_now(),
+        }
+        await db.insert_image_job(job)
+
+        if is_deferred or not self._put(job):
+            # 画像生成の混雑時は、プロバイダーへの呼び出しを増やさずに後で処理する
+            DEFERRED_IMAGE_JOBS.inc()
+            self.has_deferred_jobs = True
+            if not is_deferred:
+                await db.update_image_job(job["job_id"], {"status": JOB_STATUS_DEFERRED, "updated_at": get_jst_now()})
+            try:
+                await self._fill_from_deferred()
+            except Exception as e:
+                logging("ImageJobQueue.enqueue: ", e)
+            return job["job_id"], JOB_STATUS_DEFERRED
+
+        # このワーカーで実行されるジョブのみ、完了をメモリ上で待てるようにする（保留したジョブは別のワーカーが取り出すことがある）
+        self.completions[job["job_id"]] = asyncio.get_running_loop().create_future()
+        return job["job_id"], JOB_STATUS_QUEUED
+
+    def _put(self, job: dict) -> bool:
+        """キューにジョブを入れる（一杯の場合はFalse）"""
+        try:
+            job["queued_at"] = time.monotonic()
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        QUEUED_IMAGE_JOBS.set(self.queue.qsize())
+        return True
+
+    async def _fill_from_deferred(self):
+        """キューに空きがあれば、保留中のジョブを古い順に取り出して入れる"""
+        while self.has_deferred_jobs and not self.is_stopping and not self.queue.full():
+            job = await db.claim_image_job(JOB_STATUS_DEFERRED, JOB_STATUS_QUEUED)
+            if job is None:
+                self.has_deferred_jobs = False
+                return
+            if not self._put(job):
+                await db.update_image_job(job["job_id"], {"status": JOB_STATUS_DEFERRED, "updated_at": get_jst_now()})
+                return
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """ジョブの完了（成功または失敗）を待ち、完了したジョブを返す（時間切れの場合はNone）"""
+        completion = self.completions.get(job_id)
+        if completion is None:
+            # 別のワーカーで処理されるジョブや、すでに完了したジョブはMongoDBの状態を一定間隔で確認する
+            deadline = time.monotonic() + timeout
+            while True:
+                job = await db.get_image_job(job_id)
+                if job is not None and job["status"] in (JOB_STATUS_DONE, JOB_STATUS_FAILED):
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                await asyncio.sleep(min(IMAGE_JOB_POLL_INTERVAL, remaining))
+        try:
+            # 待っている側がキャンセルされても、他の待機者のためにFutureは残す
+            return await asyncio.wait_for(asyncio.shield(completion), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    @staticmethod
+    async def _find_generated_image(prompt: str) -> tuple[Optional[str], Optional[str]]:
+        """使うプロバイダーのいずれかで生成済みの画像を探し、(画像ID, プロバイダーの名前) を返す"""
+        for provider in image_provider_registry.enabled:
+            image_id = await image_generation_cache.get(provider.name, provider.model, prompt, provider.params)
+            if image_id is not None:
+                return image_id, provider.name
+        return None, None
+
+    @staticmethod
+    async def _evict_generated_images():
+        """生成画像の容量を確認し、上限を超えていれば古いものを削除する"""
+        try:
+            await image_generation_cache.evict_if_needed()
+        except Exception as e:
+            logging("ImageJobQueue._evict_generated_images: ", e)
+
+    def _complete(self, job: dict):
+        """ジョブの完了を待っている処理に知らせる"""
+        completion = self.completions.pop(job["job_id"], None)
+        if completion is not None and not completion.done():
+            completion.set_result(job)
+
+    async def _worker(self):
+        """キューからジョブを取り出して順に処理する"""
+        while True:
+            job = await self.queue.get()
+            QUEUED_IMAGE_JOBS.set(self.queue.qsize())
+            IMAGE_JOB_WAIT.observe(time.monotonic() - job.pop("queued_at", time.monotonic()))
+            try:
+                await self._fill_from_deferred()
+            except Exception as e:
+                logging("ImageJobQueue._fill_from_deferred: ", e)
+            self.running_jobs[job["job_id"]] = job
+            try:
+                await self._run_job(job)
+            except Exception as e:
+                logging("ImageJobQueue._worker: ", job["job_id"], e)
+                job["status"] = JOB_STATUS_FAILED
+                # 実行中のまま残ると、クライアントが状態の確認を続けてしまう
+                try:
+                    await db.update_image_job(job["job_id"], {"status": JOB_STATUS_FAILED, "updated_at": get_jst_now()})
+                except Exception as update_error:
+                    logging("ImageJobQueue._worker: ", job["job_id"], update_error)
+            finally:
+                self.running_jobs.pop(job["job_id"], None)
+                self._complete(job)
+                self.queue.task_done()
+
+    async def _run_job(self, job: dict):
+        """1件のジョブを実行して状態を更新する"""
+        job_id = job["job_id"]
+        await db.update_image_job(job_id, {"status": JOB_STATUS_RUNNING, "updated_at": get_jst_now()})
+
+        # 同じ条件で生成済みの画像があれば、プロバイダーを呼び出さずに使い回す
+        image_id, provider_name = await self._find_generated_image(job["prompt"])
+        if image_id is None:
+            try:
+                image_id, provider_name = await image_provider_registry.call(job["prompt"], IMAGE_PROVIDER_DEADLINE, IMAGE_MAX_RETRIES)
+            except NoProviderAvailableError as e:
+                logging("ImageJobQueue._run_job: ", job_id, e)
+            else:
+                provider = image_provider_registry.providers[provider_name]
+                await image_generation_cache.set(provider_name, provider.model, job["prompt"], provider.params, image_id)
+                if self.eviction_task is None or self.eviction_task.done():
+                    self.eviction_task = asyncio.create_task(self._evict_generated_images())
+
+        status = JOB_STATUS_DONE if image_id else JOB_STATUS_FAILED
+        if image_id:
+            # 同じ内容の画像は同じIDになるため、インデックスや縮小版は既存のものがそのまま使われる
+            job["filename"] = image_id
+            image_index.add(image_id)
+            await image_variant_store.create_variants_for(image_id)
+            await db.add_image_reference(image_id, {"job_id": job_id, "user_id": job["user_id"], "challenge_id": job["challenge_id"]})
+            # 進捗への反映もジョブの一部として行う（保留から取り出したジョブは、登録したワーカーとは別のワーカーで実行されることがある）
+            await session_store.append_generated_image(job["user_id"], job["session_id"], image_id)
+        job["status"] = status
+        job["provider"] = provider_name
+        await db.update_image_job(job_id, {"status": status, "provider": provider_name, "filename": job["filename"], "updated_at": get_jst_now()})
+        logging("ImageJobQueue._run_job: ", job_id, status)
+
+
+# グローバルな画像生成ジョブキューのインスタンス（起動時にstartする）
+image_job_queue = ImageJobQueue()
@@ -0,0 +1,105 @@
+""" 画像の縮小版（WebP）を作成・管理するサービスモジュール
+    縮小版は元画像と同じディレクトリに {画像ID}_w{幅}.webp として保存する
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from app.core.image_index import ImageEntry, image_index
+from app.utils.log_utils import logging
+
+VARIANT_WIDTHS = tuple(sorted(int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "256,512").split(",")))
+VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+VARIANT_MEDIA_TYPE = "image/webp"
+
+
+def select_variant_width(requested_width: int) -> Optional[int]:
+    """要求された幅以上で最小の縮小版の幅を選ぶ（元画像を返すべき場合はNone）"""
+    for width in VARIANT_WIDTHS:
+        if requested_width <= width:
+            return width
+    return None
+
+
+def get_variant_path(image_path: Path, image_id: str, width: int) -> Path:
+    """縮小版の保存先のパス"""
+    return image_path.parent / f"{image_id}_w{width}.webp"
+
+
+def create_variant(image_path: Path, image_id: str, width: int) -> Path:
+    """縮小版を作成して保存する（一時ファイルに書いてから置き換えるので、読み込み中の不完全なファイルは見えない）"""
+    variant_path = get_variant_path(image_path, image_id, width)
+    temp_path = variant_path.with_name(f".{variant_path.name}.tmp")
+
+    with Image.open(image_path) as image:
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        image.save(temp_path, format="WEBP", quality=VARIANT_QUALITY, method=4)
+
+    os.replace(temp_path, variant_path)
+    return variant_path
+
+
+class ImageVariantStore:
+    """縮小版の作成を重複させずに行うためのストア"""
+
+    def __init__(self):
+        self.locks: dict[tuple[str, int], asyncio.Lock] = {}
+        self.variants: dict[tuple[str, int], tuple[Path, os.stat_result]] = {}
+
+    async def get_variant(self, image_entry: ImageEntry, image_id: str, width: int) -> tuple[Path, os.stat_result]:
+        """縮小版を取得し、無ければ作成する"""
+        key = (image_id, width)
+        if key in self.variants:
+            return self.variants[key]
+
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if key not in self.variants:
+                variant_path = get_variant_path(image_entry.path, image_id, width)
+                if not variant_path.is_file():
+                    # 画像の変換はCPUを使うため、スレッドに逃がしてイベントループを止めない
+                    variant_path = await asyncio.to_thread(create_variant, image_entry.path, image_id, width)
+                self.variants[key] = (variant_path, variant_path.stat())
+        self.locks.pop(key, None)
+        return self.variants[key]
+
+    async def create_variants_for(self, image_id: str):
+        """生成された画像の縮小版をまとめて作成する"""
+        image_entry = image_index.get(image_id)
+        if image_entry is None:
+            return
+        for width in VARIANT_WIDTHS:
+            try:
+                await self.get_variant(image_entry, image_id, width)
+            except Exception as e:
+                logging("ImageVariantStore.create_variants_for: ", image_id, width, e)
+
+    def remove_variants_for(self, image_id: str) -> int:
+        """画像の縮小版を削除し、削除したバイト数を返す"""
+        removed_bytes = 0
+        for width in VARIANT_WIDTHS:
+            self.variants.pop((image_id, width), None)
+            variant_path = get_variant_path(image_index.base_dir / image_id, image_id, width)
+            try:
+                removed_bytes += variant_path.stat().st_size
+                variant_path.unlink()
+            except FileNotFoundError:
+                pass
+        return removed_bytes
+
+    async def create_missing_challenge_variants(self):
+        """既存のチャレンジ画像（ch_）で縮小版が無いものを作成する"""
+        image_ids = [image_id for image_id in list(image_index.entries) if image_id.startswith("ch_")]
+        for image_id in image_ids:
+            await self.create_variants_for(image_id)
+        logging(f"ImageVariantStore.create_missing_challenge_variants: {len(image_ids)} images checked")
+
+
+# グローバルな縮小版ストアのインスタンス
+image_variant_store = ImageVariantStore()
@@ -2,10 +2,13 @@
 """
 
 import os
-import json
-import requests
-from openai import AzureOpenAI
+from typing import Optional
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from dotenv import load_dotenv
+from app.core.metrics import observe_outbound
+from app.utils.http_utils import create_pooled_async_client
+from app.utils.image_utils import IMAGE_DOWNLOAD_CHUNK_SIZE, save_stream_content_addressed
 from app.utils.log_utils import logging
 
 load_dotenv()
@@ -32,57 +35,144 @@ class ChatGPTClient:
     def chat(self, message: str) -> str:
         OPEN_AI_DEPLOYMENT_NAME = os.getenv("OPEN_AI_CHATGPT_DEPLOYMENT_NAME", "")
         try:
-            response = self.client.chat.completions.create(
+            with observe_outbound("azure_openai", "chat"):
+                response = self.client.chat.completions.create(
+                    model=OPEN_AI_DEPLOYMENT_NAME or "gpt-3.5-turbo",
+                    messages=[
+                        {"role": "user", "content": message},
+                    ],
+                )
+            return response.choices[0].message.content or ""
+        except Exception as e:
+            logging("ChatGPTClient.chat: ", e)
+            return ""
+
+
+class AsyncChatGPTClient:
+    """OpenAI APIの非同期クライアント
+    起動時に1度だけ初期化し、keep-aliveのコネクションプールを使い回す
+    """
+
+    def __init__(self):
+        self.client: Optional[AsyncAzureOpenAI] = None
+
+    async def connect(self):
+        """クライアントを初期化"""
+        if self.client is not None:
+            return
+
+        OPEN_AI_API_KEY = os.getenv("OPEN_AI_CHATGPT_API_KEY", "")
+        OPEN_AI_API_VERSION = os.getenv("OPEN_AI_CHATGPT_API_VERSION", "")
+        OPEN_AI_AZURE_ENDPOINT = os.getenv("OPEN_AI_CHATGPT_AZURE_ENDPOINT", "")
+
+        if "" in [OPEN_AI_API_KEY, OPEN_AI_API_VERSION, OPEN_AI_AZURE_ENDPOINT]:
+            logging("AsyncChatGPTClient.connect: ", "API Key or Version or Endpoint is not set.")
+
+        self.client = AsyncAzureOpenAI(
+            api_version=OPEN_AI_API_VERSION,
+            api_key=OPEN_AI_API_KEY,
+            azure_endpoint=os.getenv("OPEN_AI_CHATGPT_BASE_URL") or f"https://{OPEN_AI_AZURE_ENDPOINT}.openai.azure.com/",
+            http_client=create_pooled_async_client(),
+            max_retries=0,  # リトライは app.core.resilience で期限内に収まるように行う
+        )
+
+    async def close(self):
+        """コネクションプールを閉じる"""
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def chat(self, message: str) -> str:
+        """イベントループをブロックせずにチャットの応答を取得"""
+        if self.client is None:
+            await self.connect()
+
+        # 失敗は呼び出し元（app.services.scoring_services）でリトライ・フォールバックするため、例外をそのまま投げる
+        OPEN_AI_DEPLOYMENT_NAME = os.getenv("OPEN_AI_CHATGPT_DEPLOYMENT_NAME", "")
+        with observe_outbound("azure_openai", "chat"):
+            response = await self.client.chat.completions.create(
                 model=OPEN_AI_DEPLOYMENT_NAME or "gpt-3.5-turbo",
                 messages=[
                     {"role": "user", "content": message},
                 ],
             )
-            return response.choices[0].message.content or ""
-        except Exception as e:
-            logging("ChatGPTClient.chat: ", e)
-            return ""
+        return response.choices[0].message.content or ""
 
 
 class DallE3Client:
-    """OpenAI DALL-E2 APIクライアント"""
+    """OpenAI DALL-E3 APIの非同期クライアント
+    起動時に1度だけ初期化し、生成した画像のダウンロードにもkeep-aliveのコネクションプールを使い回す
+    """
+
+    params = {"n": 1}  # 生成数
 
     def __init__(self):
+        self.client: Optional[AsyncAzureOpenAI] = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def model(self) -> str:
+        """画像生成に使うデプロイ名"""
+        return os.getenv("OPEN_AI_DALLE3_DEPLOYMENT_NAME", "")
+
+    async def connect(self):
+        """クライアントを初期化"""
+        if self.client is not None:
+            return
+
         OPEN_AI_API_KEY = os.getenv("OPEN_AI_DALLE3_API_KEY", "")
         OPEN_AI_API_VERSION = os.getenv("OPEN_AI_DALLE3_API_VERSION", "")
         OPEN_AI_AZURE_ENDPOINT = os.getenv("OPEN_AI_DALLE3_AZURE_ENDPOINT", "")
         OPEN_AI_DEPLOYMENT_NAME = os.getenv("OPEN_AI_DALLE3_DEPLOYMENT_NAME", "")
 
         if "" in [OPEN_AI_API_KEY, OPEN_AI_API_VERSION, OPEN_AI_AZURE_ENDPOINT, OPEN_AI_DEPLOYMENT_NAME]:
-            logging("DallE3Client.__init__: ", "API Key or Version or Endpoint is not set.")
+            logging("DallE3Client.connect: ", "API Key or Version or Endpoint is not set.")
 
-        self.client = AzureOpenAI(
+        self.client = AsyncAzureOpenAI(
             api_version=OPEN_AI_API_VERSION,
             api_key=OPEN_AI_API_KEY,
-            azure_endpoint=f"https://{OPEN_AI_AZURE_ENDPOINT}.openai.azure.com/",
+            azure_endpoint=os.getenv("OPEN_AI_DALLE3_BASE_URL") or f"https://{OPEN_AI_AZURE_ENDPOINT}.openai.azure.com/",
+            http_client=create_pooled_async_client(timeout=120.0),
         )
+        self.http_client = create_pooled_async_client()
+
+    async def close(self):
+        """コネクションプールを閉じる"""
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    async def generate(self, prompt: str) -> str:
+        """画像を生成して保存し、画像ID（gen_ + 内容のSHA256）を返す（失敗した場合は空文字）"""
+        if self.client is None:
+            await self.connect()
 
-    def generate(self, prompt: str, filename: str) -> str:
         try:
-            OPEN_AI_DEPLOYMENT_NAME = os.getenv("OPEN_AI_DALLE3_DEPLOYMENT_NAME", "")
             BASE_IMAGE_DIR = os.getenv("BASE_IMAGE_DIR", "app/data/images")
-            result = self.client.images.generate(
-                model=OPEN_AI_DEPLOYMENT_NAME,
-                prompt=prompt,
-                n=1,  # 生成数
-            )
-
-            json_response = json.loads(result.model_dump_json())
-            image_path = os.path.join(BASE_IMAGE_DIR, f"{filename}.png")
-            image_url = json_response["data"][0]["url"]
-            generated_image = requests.get(image_url, timeout=30).content
-
-            with open(image_path, "wb") as image_file:
-                image_file.write(generated_image)
-
-            logging("DallE3Client.generate: ", image_path)
-
-            return image_path
+            with observe_outbound("azure_openai", "images.generate"):
+                result = await self.client.images.generate(
+                    model=self.model,
+                    prompt=prompt,
+                    **self.params,
+                )
+
+            image_url = result.data[0].url
+            with observe_outbound("azure_openai", "images.download"):
+                async with self.http_client.stream("GET", image_url) as response:
+                    response.raise_for_status()
+                    image_id = await save_stream_content_addressed(response.aiter_bytes(IMAGE_DOWNLOAD_CHUNK_SIZE), BASE_IMAGE_DIR)
+
+            logging("DallE3Client.generate: ", image_id)
+
+            return image_id
         except Exception as e:
             logging("DallE3Client.generate", e)
             return ""
+
+
+# グローバルな非同期クライアントのインスタンス（起動時にconnectする）
+chatgpt_client = AsyncChatGPTClient()
+dalle3_client = DallE3Client()
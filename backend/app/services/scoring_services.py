@@ -0,0 +1,79 @@
+""" 提出を採点するサービスモジュール
+    設定（SCORING_PROVIDERS）で有効にしたLLMのうち、直近のレイテンシとエラー率から選んだものから順に試し、
+    劣化しているプロバイダーはサーキットブレーカーで飛ばす（すべて失敗した場合は体験版の採点ロジックで採点する）
+"""
+
+import os
+
+from app.core.challenge_catalog import challenge_catalog
+from app.core.metrics import SCORING_RESULTS
+from app.core.provider_registry import Provider, ProviderRegistry
+from app.services.groq_services import groq_client
+from app.services.open_ai_services import chatgpt_client
+from app.utils.challenge_utils import calculate_trial_score, tokenize_for_trial
+from app.utils.log_utils import logging
+
+SCORING_PROVIDER_DEADLINE = float(os.getenv("SCORING_PROVIDER_DEADLINE", "8"))  # プロバイダーごとの期限（リトライを含む、秒）
+SCORING_MAX_RETRIES = int(os.getenv("SCORING_MAX_RETRIES", "2"))
+
+PROVIDER_AZURE_OPENAI = "azure_openai"
+PROVIDER_GROQ = "groq"
+PROVIDER_LOCAL = "local"
+
+
+def parse_score(response: str) -> int:
+    """LLMの応答をスコアに変換（数値でなければ失敗として扱う）"""
+    return min(max(int(response.strip()), 0), 100)
+
+
+class AzureOpenAIScoringProvider(Provider[int]):
+    """Azure OpenAIのチャットによる採点"""
+
+    name = PROVIDER_AZURE_OPENAI
+
+    async def connect(self):
+        await chatgpt_client.connect()
+
+    async def close(self):
+        await chatgpt_client.close()
+
+    async def invoke(self, prompt: str) -> int:
+        return parse_score(await chatgpt_client.chat(prompt))
+
+
+class GroqScoringProvider(Provider[int]):
+    """Groqのチャットによる採点"""
+
+    name = PROVIDER_GROQ
+
+    async def connect(self):
+        await groq_client.connect()
+
+    async def close(self):
+        await groq_client.close()
+
+    async def invoke(self, prompt: str) -> int:
+        return parse_score(await groq_client.chat(messages=[{"role": "user", "content": [{"type": "text", "text": prompt}]}]))
+
+
+# グローバルな採点プロバイダーのレジストリ（起動時にconnectする）
+scoring_provider_registry = ProviderRegistry(
+    "scoring",
+    [AzureOpenAIScoringProvider(), GroqScoringProvider()],
+    os.getenv("SCORING_PROVIDERS", f"{PROVIDER_AZURE_OPENAI},{PROVIDER_GROQ}"),
+)
+
+
+async def score_with_fallback(challenge_id: str, prompt: str, submission: str) -> tuple[int, str]:
+    """提出を採点し、(スコア, 採点したプロバイダー) を返す"""
+    try:
+        score, provider = await scoring_provider_registry.call(prompt, SCORING_PROVIDER_DEADLINE, SCORING_MAX_RETRIES)
+        SCORING_RESULTS.labels(provider).inc()
+        return score, provider
+    except Exception as e:
+        logging("score_with_fallback: ", e)
+
+    # すべてのLLMが使えない場合は、体験版の採点ロジックで採点する
+    result_tokens = await challenge_catalog.get_result_tokens(challenge_id)
+    SCORING_RESULTS.labels(PROVIDER_LOCAL).inc()
+    return calculate_trial_score(tokenize_for_trial(submission), result_tokens), PROVIDER_LOCAL
@@ -2,23 +2,26 @@
 """
 
 import os
-import base64
-import requests
+from typing import Optional
 
+import httpx
 from dotenv import load_dotenv
+from app.core.metrics import observe_outbound, record_outbound_error
+from app.utils.http_utils import create_pooled_async_client
+from app.utils.image_utils import IMAGE_DOWNLOAD_CHUNK_SIZE, save_stream_content_addressed
 from app.utils.log_utils import logging
 
 load_dotenv()
 
 
-def create_image(prompt: str, filename: str) -> str:
-    """画像生成のためのAPIキーとURL"""
-    BASE_IMAGE_DIR = os.getenv("BASE_IMAGE_DIR", "app/data/images")
+class SegmindClient:
+    """Segmind APIの非同期クライアント
+    起動時に1度だけ初期化し、keep-aliveのコネクションプールを使い回す
+    """
 
-    api_key = os.getenv("SEGMIND_KEY")
-    url = "https://api.segmind.com/v1/sdxl1.0-newreality-lightning"
-    payload = {
-        "prompt": prompt,  # 画像生成のプロンプト
+    model = "sdxl1.0-newreality-lightning"
+    # シードを固定しているため、同じプロンプトからは同じ画像が生成される
+    params = {
         "negative_prompt": "((close up)),(octane render, render, drawing, bad photo, bad photography:1.3)",  # ネガティブプロンプト
         "samples": 1,  # 生成する画像の数
         "scheduler": "DPM++ SDE",  # スケジューラー設定
@@ -30,19 +33,49 @@ def create_image(prompt: str, filename: str) -> str:
         "base64": False,  # Base64で返すかどうか
     }
 
-    logging("Segmind_services.create_image: ", prompt)
-    response = requests.post(
-        url,
-        json=payload,
-        headers={"x-api-key": api_key},
-        timeout=30,
-    )
-    if response.ok:
-        image_path = os.path.join(BASE_IMAGE_DIR, f"{filename}.png")
-        with open(image_path, "wb") as image_file:
-            image_file.write(response.content)
-        logging("Segmind_services.create_image: ", image_path)
-        return image_path
-    else:
-        logging("Segmind_services.create_image: ", response.text, response.status_code)
-        return ""
+    def __init__(self):
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+    async def connect(self):
+        """クライアントを初期化"""
+        if self.http_client is None:
+            self.http_client = create_pooled_async_client()
+
+    async def close(self):
+        """コネクションプールを閉じる"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    async def create_image(self, prompt: str) -> str:
+        """画像を生成して保存し、画像ID（gen_ + 内容のSHA256）を返す（失敗した場合は空文字）"""
+        if self.http_client is None:
+            await self.connect()
+
+        BASE_IMAGE_DIR = os.getenv("BASE_IMAGE_DIR", "app/data/images")
+
+        api_key = os.getenv("SEGMIND_KEY")
+        url = f"{os.getenv('SEGMIND_BASE_URL') or 'https://api.segmind.com/v1'}/{self.model}"
+        payload = {"prompt": prompt, **self.params}  # prompt: 画像生成のプロンプト
+
+        logging("Segmind_services.create_image: ", prompt)
+        try:
+            with observe_outbound("segmind", "create_image"):
+                # 応答の本文が画像そのものなので、メモリに溜めずに一時ファイルへ流し込む
+                async with self.http_client.stream("POST", url, json=payload, headers={"x-api-key": api_key or ""}) as response:
+                    if response.is_success:
+                        image_id = await save_stream_content_addressed(response.aiter_bytes(IMAGE_DOWNLOAD_CHUNK_SIZE), BASE_IMAGE_DIR)
+                        logging("Segmind_services.create_image: ", image_id)
+                        return image_id
+
+                    await response.aread()
+            record_outbound_error("segmind", "create_image")
+            logging("Segmind_services.create_image: ", response.text, response.status_code)
+            return ""
+        except Exception as e:
+            logging("Segmind_services.create_image: ", e)
+            return ""
+
+
+# グローバルな非同期クライアントのインスタンス（起動時にconnectする）
+segmind_client = SegmindClient()
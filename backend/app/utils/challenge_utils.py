@@ -3,6 +3,11 @@
 
 import re
 
+SCORE_MAGNIFICATION_TRIAL = 300  # 体験版のスコア倍率
+
+# 採点プロンプトの版数（プロンプトを変更したら上げること。スコアのキャッシュキーに含まれる）
+SCORE_PROMPT_VERSION = "v1"
+
 
 def convert_challenge_to_json_item(challenge) -> dict:
     """ChallengeモデルをJSONに変換する"""
@@ -24,3 +29,45 @@ def submission_validation(submission: str) -> bool:
     if IS_TOO_LONG or IS_CONTAIN_INVALID_CHARS:
         return False
     return True
+
+
+def normalize_submission(submission: str) -> str:
+    """提出テキストを正規化する（大文字小文字・連続する空白の違いを吸収する）"""
+    return " ".join(submission.replace("　", " ").lower().split())
+
+
+def create_score_prompt(result_sample: str, submission: str) -> str:
+    """LLMに採点させるためのプロンプトを作成する"""
+    return f"""
+    As an AI evaluator, analyze the English text within the <Submission> tags and assess how comprehensively it covers the content provided in the <Result> tags. Output only a single integer score from 0 to 100, where:
+
+    - 100 indicates the submission fully covers all key points and details from the result
+    - 75 indicates most key points are covered with some minor omissions
+    - 50 indicates roughly half of the important content is covered
+    - 25 indicates only basic or surface-level coverage
+    - 0 indicates no relevant content coverage
+
+    Do not provide any explanation or additional text - output only the integer score.
+
+    <Result>
+    {result_sample}
+    </Result>
+
+    <Submission>
+    {submission}
+    </Submission>
+    """
+
+
+def tokenize_for_trial(text: str) -> frozenset[str]:
+    """体験版の採点に使う単語の集合を作る"""
+    return frozenset(word.lower() for word in text.split())
+
+
+def calculate_trial_score(submission_tokens: frozenset[str], result_tokens: frozenset[str]) -> int:
+    """体験版のため、模範解答の単語をどれだけ含むかで簡易的なスコア算出を行う"""
+    if not result_tokens:
+        return 0
+    common_words = submission_tokens & result_tokens
+    score = int(len(common_words) / len(result_tokens) * SCORE_MAGNIFICATION_TRIAL)
+    return min(max(score, 0), 100)
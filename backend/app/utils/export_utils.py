@@ -0,0 +1,79 @@
+""" 提出物のエクスポート（NDJSON / CSV）に関するユーティリティ関数を提供するモジュール """
+
+import csv
+from datetime import datetime
+import io
+import json
+from typing import AsyncIterator, Optional
+
+EXPORT_FORMATS = ("ndjson", "csv")
+CSV_COLUMNS = ["submission_id", "user_id", "challenge_id", "created_at", "attempt", "timestamp", "score", "content"]
+EXPORT_CHUNK_SIZE = 100  # まとめて書き出す提出物の数
+
+
+def create_submission_query(created_from: Optional[datetime] = None, created_to: Optional[datetime] = None, challenge_id: Optional[str] = None) -> dict:
+    """エクスポートの条件からMongoDBのクエリを作成する"""
+    query = {}
+    if created_from is not None or created_to is not None:
+        query["created_at"] = {}
+        if created_from is not None:
+            query["created_at"]["$gte"] = created_from
+        if created_to is not None:
+            query["created_at"]["$lt"] = created_to
+    if challenge_id:
+        query["challenge_id"] = challenge_id
+    return query
+
+
+def _to_json_value(value):
+    """JSONに変換できない値（日時）を文字列にする"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def submission_to_ndjson(submission: dict) -> str:
+    """提出物をNDJSONの1行にする"""
+    return json.dumps(submission, ensure_ascii=False, default=_to_json_value) + "\n"
+
+
+def submission_to_csv_rows(submission: dict) -> list:
+    """提出物を、提出（採点）1回につき1行のCSVの行にする"""
+    created_at = submission.get("created_at")
+    return [
+        [
+            submission.get("submission_id", ""),
+            submission.get("user_id", ""),
+            submission.get("challenge_id", ""),
+            created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+            attempt,
+            entry.get("timestamp", ""),
+            entry.get("score", ""),
+            entry.get("content", ""),
+        ]
+        for attempt, entry in enumerate(submission.get("submissions", []), start=1)
+    ]
+
+
+async def stream_submissions(submissions: AsyncIterator[dict], export_format: str) -> AsyncIterator[str]:
+    """提出物を指定の形式の文字列に変換し、一定件数ごとにまとめて返す"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        writer.writerow(CSV_COLUMNS)
+
+    count = 0
+    async for submission in submissions:
+        if export_format == "csv":
+            writer.writerows(submission_to_csv_rows(submission))
+        else:
+            buffer.write(submission_to_ndjson(submission))
+
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell() > 0:
+        yield buffer.getvalue()
@@ -0,0 +1,45 @@
+""" 外部APIとの通信に使うHTTPクライアントと、HTTPの条件付きリクエストの処理を提供するモジュール """
+
+import hashlib
+import os
+from typing import Optional
+
+import httpx
+
+# ポーリングされるAPIの応答は保存させてよいが、使う前に必ずETagで再検証させる
+REVALIDATE_CACHE_CONTROL = "no-cache"
+PRIVATE_REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def create_pooled_async_client(timeout: float = 30.0) -> httpx.AsyncClient:
+    """
+    keep-aliveのコネクションプールを持つ非同期HTTPクライアントを生成する
+    起動時に1度だけ生成し、アプリケーション終了まで使い回すことを想定している
+    """
+    max_connections = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+    max_keepalive_connections = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    keepalive_expiry = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(timeout, connect=5.0),
+    )
+
+
+def create_etag(*parts) -> str:
+    """応答の版を表す値（リビジョンやバージョンなど）からETagを作成"""
+    return '"' + hashlib.sha256("\0".join(str(part) for part in parts).encode()).hexdigest()[:32] + '"'
+
+
+def is_etag_matched(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-MatchヘッダーがETagに一致するかどうか"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return etag in candidates
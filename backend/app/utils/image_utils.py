@@ -1,10 +1,17 @@
 """ 画像処理に関するユーティリティ関数を提供するモジュール """
 
+import asyncio
 import base64
 import hashlib
+import os
+from pathlib import Path
+from typing import AsyncIterator, Iterable, Union
+import uuid
 
 from fastapi import UploadFile
 
+IMAGE_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
 
 def encode_image(file: UploadFile) -> str:
     """
@@ -14,9 +21,42 @@ def encode_image(file: UploadFile) -> str:
     return base64.b64encode(file.file.read()).decode("utf-8")
 
 
-def image_bytes_to_sha256(image: bytes) -> str:
+def image_bytes_to_sha256(image: Union[bytes, Iterable[bytes]]) -> str:
     """
     画像のハッシュ値を取得するユーティリティ関数
-    画像のBase64エンコード文字列を受け取り、ハッシュ値を返す
+    画像のバイト列、またはバイト列のチャンクのイテラブル（ファイルを少しずつ読む場合など）を受け取り、ハッシュ値を返す
     """
-    return hashlib.sha256(image).hexdigest()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(image).hexdigest()
+
+    image_hash = hashlib.sha256()
+    for chunk in image:
+        image_hash.update(chunk)
+    return image_hash.hexdigest()
+
+
+async def save_stream_content_addressed(chunks: AsyncIterator[bytes], image_dir: str, prefix: str = "gen_", ext: str = ".png") -> str:
+    """
+    受信したチャンクを順に一時ファイルへ書き込み、内容のハッシュ値をファイル名にして置き換えるユーティリティ関数
+    画像全体をメモリに持たず、読み込み中のリクエストから書きかけのファイルが見えることもない
+    同じ内容の画像が既にある場合は書き込まずに、その画像IDを返す
+    """
+    temp_path = Path(image_dir) / f".{uuid.uuid4().hex}{ext}.tmp"
+    image_hash = hashlib.sha256()
+    try:
+        with open(temp_path, "wb") as image_file:
+            async for chunk in chunks:
+                # 書き込みながらハッシュ値を計算し、書き終えたファイルを読み直さない
+                image_hash.update(chunk)
+                await asyncio.to_thread(image_file.write, chunk)
+
+        image_id = prefix + image_hash.hexdigest()
+        image_path = Path(image_dir) / f"{image_id}{ext}"
+        if image_path.is_file():
+            temp_path.unlink()
+        else:
+            await asyncio.to_thread(os.replace, temp_path, image_path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return image_id
@@ -1,12 +1,185 @@
 """ ログ出力関連のユーティリティ関数を提供するモジュール
-    TODO: いったん仮で作成したもので、後で変更する可能性がある
+    ログはキューを経由してバックグラウンドのスレッドでJSON Lines形式で標準出力に書き出す（promtailが収集する）
+    リクエストの処理中はレコードをキューに積むだけで、メッセージの整形は書き出し時に行う
 """
 
-from typing import Any
-from app.utils.time_utils import get_jst_now
+import atexit
+import copy
+from datetime import datetime
+import json
+import logging as std_logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+import random
+import sys
+from typing import Any, Optional
 
+from app.utils.time_utils import JST
 
-def logging(*args: Any) -> None:
-    """ログを出力する"""
-    print(get_jst_now().isoformat(), end=": ")
-    print(*args)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_ARG_LENGTH = int(os.getenv("LOG_MAX_ARG_LENGTH", "1000"))  # logging() の引数1つあたりの最大文字数
+LOG_MAX_MESSAGE_LENGTH = int(os.getenv("LOG_MAX_MESSAGE_LENGTH", "8000"))
+APP_LOGGER_NAME = "app"
+
+
+def parse_sample_rates(value: str) -> dict[str, float]:
+    """ロガーごとのサンプリング率の設定（例："app.api.v1.endpoints.challenges_func=0.1,app.core=0.5"）を読み込む"""
+    sample_rates = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        sample_rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return sample_rates
+
+
+def truncate(text: str, max_length: int) -> str:
+    """長すぎる文字列を切り詰める"""
+    if len(text) <= max_length:
+        return text
+    return f"{text[:max_length]}...(truncated {len(text) - max_length} chars)"
+
+
+# 書き出しまでに変更されないため、そのまま保持して書き出し時に文字列に変換する型
+IMMUTABLE_ARG_TYPES = (str, int, float, bool, bytes, tuple, frozenset, type(None))
+# 書き出しまでに呼び出し元が変更し得るため、積む時点でコピーする型（中身はコピーしない）
+COPIED_ARG_TYPES = (dict, list, set, bytearray)
+
+
+def snapshot_arg(arg: Any) -> Any:
+    """logging() の引数を、キューに積んだ時点の状態で固定する"""
+    if isinstance(arg, IMMUTABLE_ARG_TYPES):
+        return arg
+    if isinstance(arg, COPIED_ARG_TYPES):
+        return copy.copy(arg)
+    # その他のオブジェクトは状態が変わり得るため、その場で文字列に変換する
+    return truncate(str(arg), LOG_MAX_ARG_LENGTH)
+
+
+class LazyMessage:
+    """logging() の引数を保持し、書き出し時に初めて文字列に変換するメッセージ
+    変更可能な引数は積んだ時点の状態を保持し、別スレッドでの変換中に呼び出し元が変更しても影響を受けない
+    """
+
+    __slots__ = ("args",)
+
+    def __init__(self, args: tuple):
+        self.args = tuple(snapshot_arg(arg) for arg in args)
+
+    def __str__(self) -> str:
+        return " ".join(truncate(str(arg), LOG_MAX_ARG_LENGTH) for arg in self.args)
+
+
+class SamplingFilter(std_logging.Filter):
+    """ロガーごとのサンプリング率に従ってレコードを間引くフィルター（WARNING以上は間引かない）"""
+
+    def __init__(self, sample_rates: dict[str, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.resolved_rates: dict[str, float] = {}
+
+    def get_rate(self, logger_name: str) -> float:
+        """ロガー名に最も長く一致する設定のサンプリング率"""
+        if logger_name not in self.resolved_rates:
+            rate = 1.0
+            matched_length = -1
+            for name, sample_rate in self.sample_rates.items():
+                if (logger_name == name or logger_name.startswith(f"{name}.")) and len(name) > matched_length:
+                    rate = sample_rate
+                    matched_length = len(name)
+            self.resolved_rates[logger_name] = rate
+        return self.resolved_rates[logger_name]
+
+    def filter(self, record: std_logging.LogRecord) -> bool:
+        if record.levelno >= std_logging.WARNING:
+            return True
+        rate = self.get_rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(std_logging.Formatter):
+    """レコードを1行のJSONに整形するフォーマッター"""
+
+    def format(self, record: std_logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, JST).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": truncate(record.getMessage(), LOG_MAX_MESSAGE_LENGTH),
+        }
+        if record.exc_info:
+            entry["exception"] = truncate(self.formatException(record.exc_info), LOG_MAX_MESSAGE_LENGTH)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """レコードを整形せずにキューに積むハンドラー（キューが一杯の場合は捨てる）"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped_records = 0
+
+    def prepare(self, record: std_logging.LogRecord) -> std_logging.LogRecord:
+        # 同じプロセス内のスレッドに渡すだけなので、整形は書き出し側のスレッドに任せる
+        return record
+
+    def enqueue(self, record: std_logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging():
+    """ログの出力先を設定し、書き出し用のスレッドを起動する（2回目以降の呼び出しは何もしない）"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = std_logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = LazyQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))))
+
+    # 外部ライブラリのログはWARNING以上のみ、アプリケーションのログは LOG_LEVEL 以上を出力する
+    root_logger = std_logging.getLogger()
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(std_logging.WARNING)
+    std_logging.getLogger(APP_LOGGER_NAME).setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """キューに残っているログを書き出してスレッドを止める"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> std_logging.Logger:
+    """アプリケーションのロガーを取得（名前は "app" 配下にそろえる）"""
+    setup_logging()
+    if name != APP_LOGGER_NAME and not name.startswith(f"{APP_LOGGER_NAME}."):
+        name = f"{APP_LOGGER_NAME}.{name}"
+    return std_logging.getLogger(name)
+
+
+def logging(*args: Any, level: Optional[int] = None) -> None:
+    """ログを出力する
+    ロガーは呼び出し元のモジュール名で決まり、levelを省略した場合は例外を含むときERROR、それ以外はINFOになる
+    """
+    logger = get_logger(sys._getframe(1).f_globals.get("__name__", APP_LOGGER_NAME))
+    if level is None:
+        level = std_logging.ERROR if any(isinstance(arg, BaseException) for arg in args) else std_logging.INFO
+    if logger.isEnabledFor(level):
+        logger.log(level, LazyMessage(args), stacklevel=2)
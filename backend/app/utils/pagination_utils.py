@@ -0,0 +1,21 @@
+""" カーソル方式のページネーションに関するユーティリティ関数を提供するモジュール """
+
+import base64
+from datetime import datetime
+import json
+from typing import Optional, Tuple
+
+
+def encode_cursor(created_at: datetime, document_id: str) -> str:
+    """最後に返したドキュメントの位置をカーソル文字列にする"""
+    raw_cursor = json.dumps({"created_at": created_at.isoformat(), "id": document_id})
+    return base64.urlsafe_b64encode(raw_cursor.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, str]]:
+    """カーソル文字列を (created_at, ドキュメントID) に戻す（不正な場合はNone）"""
+    try:
+        raw_cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return datetime.fromisoformat(raw_cursor["created_at"]), str(raw_cursor["id"])
+    except (ValueError, KeyError, TypeError):
+        return None
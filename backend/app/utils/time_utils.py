@@ -4,13 +4,17 @@
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+# ZoneInfoの生成は呼び出しのたびに行わず、使い回す
+UTC = ZoneInfo("UTC")
+JST = ZoneInfo("Asia/Tokyo")
+
 
 def get_utc_now():
-    return datetime.now(ZoneInfo("UTC"))
+    return datetime.now(UTC)
 
 
 def get_jst_now():
-    return datetime.now(ZoneInfo("Asia/Tokyo"))
+    return datetime.now(JST)
 
 
 def parse_str_as_jst(dt_str, dt_format, dt_timezone="Asia/Tokyo"):
@@ -0,0 +1,105 @@
+"""
+負荷試験用に Azure OpenAI（チャット・DALL-E3）・Groq・Segmind の代わりに応答するローカルのHTTPサーバー
+応答までの時間とエラー率は環境変数で指定する
+
+使用例（単体で起動する場合）：
+    cd backend
+    FAKE_CHAT_LATENCY_MS=800 FAKE_ERROR_RATE=0.05 python -m uvicorn benchmarks.fake_providers:app --port 9100
+バックエンドからは次の環境変数で接続先を切り替える：
+    OPEN_AI_CHATGPT_BASE_URL=http://127.0.0.1:9100
+    OPEN_AI_DALLE3_BASE_URL=http://127.0.0.1:9100
+    GROQ_BASE_URL=http://127.0.0.1:9100
+    SEGMIND_BASE_URL=http://127.0.0.1:9100/v1
+"""
+
+import asyncio
+from functools import lru_cache
+import hashlib
+import io
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+import numpy as np
+from PIL import Image
+
+CHAT_LATENCY_MS = float(os.getenv("FAKE_CHAT_LATENCY_MS", "500"))
+IMAGE_LATENCY_MS = float(os.getenv("FAKE_IMAGE_LATENCY_MS", "5000"))
+DOWNLOAD_LATENCY_MS = float(os.getenv("FAKE_DOWNLOAD_LATENCY_MS", "200"))
+ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0"))
+IMAGE_SIZE = int(os.getenv("FAKE_IMAGE_SIZE", "512"))  # 生成する画像の一辺（ピクセル）
+
+app = FastAPI(title="fake-providers")
+
+
+async def simulate(latency_ms: float):
+    """指定した時間（±50%のばらつき）待ち、エラー率に従って失敗する（失敗しない場合はNone）"""
+    await asyncio.sleep(latency_ms * random.uniform(0.5, 1.5) / 1000)
+    if random.random() < ERROR_RATE:
+        status_code = random.choice([429, 500, 503])
+        return JSONResponse({"error": {"message": "fake provider error", "code": status_code}}, status_code=status_code)
+    return None
+
+
+@lru_cache(maxsize=64)
+def create_png(seed: str) -> bytes:
+    """シードから決まるノイズ画像（圧縮が効きにくく、実際の生成画像に近いサイズになる）"""
+    generator = np.random.default_rng(int(hashlib.sha256(seed.encode()).hexdigest()[:16], 16))
+    pixels = generator.integers(0, 256, size=(IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def create_chat_completion(model: str) -> dict:
+    """採点プロンプトへの応答（0〜100の整数だけを返す）"""
+    return {
+        "id": f"chatcmpl-{random.getrandbits(64):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": str(random.randint(0, 100))}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 200, "completion_tokens": 1, "total_tokens": 201},
+    }
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def azure_chat_completions(deployment: str):
+    """Azure OpenAIのチャット"""
+    return await simulate(CHAT_LATENCY_MS) or create_chat_completion(deployment)
+
+
+@app.post("/openai/v1/chat/completions")
+async def groq_chat_completions(request: Request):
+    """Groqのチャット"""
+    body = await request.json()
+    return await simulate(CHAT_LATENCY_MS) or create_chat_completion(body.get("model", ""))
+
+
+@app.post("/openai/deployments/{deployment}/images/generations")
+async def azure_image_generations(deployment: str, request: Request):
+    """DALL-E3の画像生成（画像はURLで返す）"""
+    body = await request.json()
+    error = await simulate(IMAGE_LATENCY_MS)
+    if error is not None:
+        return error
+    seed = hashlib.sha256(f"{deployment}\0{body.get('prompt', '')}\0{random.random()}".encode()).hexdigest()
+    return {"created": int(time.time()), "data": [{"url": f"{str(request.base_url).rstrip('/')}/files/{seed[:32]}.png"}]}
+
+
+@app.get("/files/{name}.png")
+async def download_image(name: str):
+    """DALL-E3が生成した画像のダウンロード"""
+    return await simulate(DOWNLOAD_LATENCY_MS) or Response(create_png(name), media_type="image/png")
+
+
+@app.post("/v1/{model}")
+async def segmind_create_image(model: str, request: Request):
+    """Segmindの画像生成（シードが固定のため、同じプロンプトには同じ画像を返す）"""
+    body = await request.json()
+    error = await simulate(IMAGE_LATENCY_MS)
+    if error is not None:
+        return error
+    return Response(create_png(f"{model}\0{body.get('prompt', '')}\0{body.get('seed', '')}"), media_type="image/png")
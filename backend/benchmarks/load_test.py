@@ -0,0 +1,362 @@
+"""
+バックエンドに大会当日を想定した負荷をかけ、ルートごとのスループットとレイテンシ（p50/p95/p99）をJSONで出力する負荷試験ツール
+
+既定では benchmarks/fake_providers.py とバックエンド（main:app）を子プロセスで起動し、
+外部AI APIの代わりにローカルの代替サーバーへ接続させる（MongoDBは MONGO_USER / MONGO_PASSWORD / MONGO_URL の接続先を使う）
+--base-url を指定した場合は、起動済みのバックエンドに負荷をかける（ログインできるユーザーは --user-prefix / --password で指定する）
+
+使用例：
+    cd backend
+    ./venv/Scripts/activate
+    python -m benchmarks.load_test --users 50 --duration 60 --chat-latency-ms 800 --error-rate 0.05 --output result.json
+    python -m benchmarks.load_test --users 50 --duration 60 --baseline result.json --max-regression 0.2
+"""
+
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import AsyncIterator, Optional
+
+import bcrypt
+import httpx
+
+ROUTES = ("login", "get-all", "start-challenge", "submit", "submit-for-trial", "img")
+DEFAULT_MIX = "get-all=30,img=30,submit-for-trial=20,submit=10,start-challenge=5,login=5"
+SUBMISSION_WORDS = ("a", "the", "cat", "dog", "sits", "runs", "on", "near", "red", "blue", "mat", "bench", "gate", "tree", "under", "big", "small", "park", "river", "bridge")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """ルートごとの重み（例："get-all=30,img=30,submit=10"）を読み込む"""
+    mix = {}
+    for item in value.split(","):
+        route, weight = item.split("=", 1)
+        if route.strip() not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown route: {route}")
+        mix[route.strip()] = float(weight)
+    return mix
+
+
+def percentile(sorted_values: list[float], ratio: float) -> float:
+    """昇順に並んだ値のパーセンタイル（nearest-rank法）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(-(-ratio * len(sorted_values) // 1)), 1)
+    return sorted_values[rank - 1]
+
+
+def create_submission() -> str:
+    """バリデーションを通る、ランダムな提出テキスト"""
+    return " ".join(random.choices(SUBMISSION_WORDS, k=random.randint(4, 12))) + "."
+
+
+class Recorder:
+    """ルートごとにレイテンシとエラーを記録する"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {route: [] for route in ROUTES}
+        self.errors: dict[str, int] = {route: 0 for route in ROUTES}
+        self.recording = False
+
+    @asynccontextmanager
+    async def measure(self, route: str) -> AsyncIterator[None]:
+        """ブロック内のリクエストのレイテンシを記録する（HTTPのエラーは例外を投げずにエラーとして数える）"""
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except httpx.HTTPError:
+            failed = True
+        finally:
+            if self.recording:
+                self.latencies[route].append((time.perf_counter() - start) * 1000)
+                self.errors[route] += int(failed)
+
+    def report(self, duration: float) -> dict:
+        """ルートごとと全体の、件数・エラー率・スループット・パーセンタイルを集計する"""
+        routes = {}
+        for route in ROUTES:
+            latencies = sorted(self.latencies[route])
+            if not latencies:
+                continue
+            routes[route] = {
+                "count": len(latencies),
+                "errors": self.errors[route],
+                "error_rate": round(self.errors[route] / len(latencies), 4),
+                "throughput_rps": round(len(latencies) / duration, 2),
+                "p50_ms": round(percentile(latencies, 0.50), 2),
+                "p95_ms": round(percentile(latencies, 0.95), 2),
+                "p99_ms": round(percentile(latencies, 0.99), 2),
+                "max_ms": round(latencies[-1], 2),
+            }
+        all_latencies = sorted(latency for latencies in self.latencies.values() for latency in latencies)
+        total_errors = sum(self.errors.values())
+        total = {
+            "count": len(all_latencies),
+            "errors": total_errors,
+            "error_rate": round(total_errors / len(all_latencies), 4) if all_latencies else 0.0,
+            "throughput_rps": round(len(all_latencies) / duration, 2),
+            "p50_ms": round(percentile(all_latencies, 0.50), 2),
+            "p95_ms": round(percentile(all_latencies, 0.95), 2),
+            "p99_ms": round(percentile(all_latencies, 0.99), 2),
+        }
+        return {"routes": routes, "total": total}
+
+
+class VirtualUser:
+    """1人の参加者の操作（ログイン → 一覧 → チャレンジ開始 → 重みに従ってランダムに操作）"""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, user_id: str, password: str):
+        self.client = client
+        self.recorder = recorder
+        self.user_id = user_id
+        self.password = password
+        self.headers: dict[str, str] = {}
+        self.challenges: list[dict] = []
+        self.challenge_id = ""
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """リクエストを送って計測する（失敗はエラーとして記録し、Noneを返す）"""
+        response: Optional[httpx.Response] = None
+        async with self.recorder.measure(route):
+            received = await self.client.request(method, url, **kwargs)
+            # 画像はバイト列まで読み切った時間を計測する
+            await received.aread()
+            received.raise_for_status()
+            response = received
+        return response
+
+    async def login(self):
+        """ログインしてアクセストークンを受け取る"""
+        response = await self.request("login", "POST", "/api/auth/login", json={"id": self.user_id, "password": self.password})
+        if response is not None:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def get_all(self):
+        """チャレンジの一覧を取得する"""
+        response = await self.request("get-all", "GET", "/api/challenges-list/get-all")
+        if response is not None:
+            self.challenges = response.json()["problems"] or self.challenges
+
+    async def start_challenge(self):
+        """一覧からランダムに選んだチャレンジを始める"""
+        if not self.challenges:
+            return
+        self.challenge_id = random.choice(self.challenges)["id"]
+        # 別のチャレンジに切り替えるため、進行中のチャレンジはリセットする
+        try:
+            await self.client.get("/api/challenges-func/give-up-challenge", headers=self.headers)
+        except httpx.HTTPError:
+            # 計測の対象ではないので、失敗してもチャレンジの開始を試す
+            pass
+        await self.request("start-challenge", "POST", "/api/challenges-func/start-challenge", json={"challenge_id": self.challenge_id}, headers=self.headers)
+
+    async def submit(self):
+        """取り組んでいるチャレンジに提出する"""
+        if self.challenge_id:
+            await self.request("submit", "POST", "/api/challenges-func/submit", json={"challenge_id": self.challenge_id, "submission": create_submission()}, headers=self.headers)
+
+    async def submit_for_trial(self):
+        """ランダムに選んだチャレンジに体験版として提出する"""
+        if self.challenges:
+            await self.request("submit-for-trial", "POST", "/api/challenges-func/submit-for-trial", json={"challenge_id": random.choice(self.challenges)["id"], "submission": create_submission()})
+
+    async def get_image(self):
+        """ランダムに選んだチャレンジの画像（半分は縮小版）を取得する"""
+        if self.challenges:
+            image_url = random.choice(self.challenges)["imgUrl"]
+            params = {"w": 512} if random.random() < 0.5 else {}
+            await self.request("img", "GET", image_url, params=params)
+
+    async def run(self, mix: dict[str, float], deadline: float):
+        """期限まで、重みに従ってランダムに選んだ操作を繰り返す"""
+        actions = {
+            "login": self.login,
+            "get-all": self.get_all,
+            "start-challenge": self.start_challenge,
+            "submit": self.submit,
+            "submit-for-trial": self.submit_for_trial,
+            "img": self.get_image,
+        }
+        await self.login()
+        await self.get_all()
+        await self.start_challenge()
+        routes, weights = list(mix), list(mix.values())
+        while time.monotonic() < deadline:
+            await actions[random.choices(routes, weights)[0]]()
+            # 参加者の操作の間隔（考えている時間）
+            await asyncio.sleep(random.uniform(0, 0.2))
+
+
+def start_process(module: str, port: int, env: dict[str, str]) -> subprocess.Popen:
+    """uvicornでアプリケーションを子プロセスとして起動する"""
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+    )
+
+
+async def wait_until_ready(url: str, timeout: float = 60):
+    """起動したサーバーが応答するまで待つ"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} did not become ready in {timeout} seconds")
+
+
+def compare_with_baseline(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    """基準の結果と比べて、p95/p99 が許容範囲を超えて悪化したルートを返す"""
+    regressions = []
+    for route, result in report["routes"].items():
+        baseline_result = baseline.get("routes", {}).get(route)
+        if baseline_result is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if baseline_result[key] > 0 and result[key] > baseline_result[key] * (1 + max_regression):
+                regressions.append(f"{route} {key}: {baseline_result[key]} -> {result[key]}")
+    return regressions
+
+
+async def run_load_test(args: argparse.Namespace) -> dict:
+    """負荷試験を実行して結果を返す"""
+    processes: list[subprocess.Popen] = []
+    base_url: Optional[str] = args.base_url
+    user_ids = [f"{args.user_prefix}{i}" for i in range(args.users)]
+    try:
+        if base_url is None:
+            fake_url = f"http://127.0.0.1:{args.fake_port}"
+            processes.append(
+                start_process(
+                    "benchmarks.fake_providers:app",
+                    args.fake_port,
+                    {
+                        "FAKE_CHAT_LATENCY_MS": str(args.chat_latency_ms),
+                        "FAKE_IMAGE_LATENCY_MS": str(args.image_latency_ms),
+                        "FAKE_ERROR_RATE": str(args.error_rate),
+                    },
+                )
+            )
+            await wait_until_ready(f"{fake_url}/docs")
+
+            password_hash = bcrypt.hashpw(args.password.encode(), bcrypt.gensalt(rounds=args.bcrypt_rounds)).decode()
+            processes.append(
+                start_process(
+                    "main:app",
+                    args.backend_port,
+                    {
+                        "PASS_INITIALIZE_MONGO_SETUP": "False",
+                        "MOCK_USER_ID": ",".join(user_ids),
+                        "MOCK_USER_PW": ",".join([password_hash] * len(user_ids)),
+                        "SUBMIT_INTERVAL_FOR_LOGGED_IN": "0",
+                        "LOG_LEVEL": "WARNING",
+                        "OPEN_AI_CHATGPT_BASE_URL": fake_url,
+                        "OPEN_AI_CHATGPT_API_KEY": "fake",
+                        "OPEN_AI_CHATGPT_API_VERSION": "2024-02-01",
+                        "OPEN_AI_CHATGPT_DEPLOYMENT_NAME": "gpt-fake",
+                        "OPEN_AI_DALLE3_BASE_URL": fake_url,
+                        "OPEN_AI_DALLE3_API_KEY": "fake",
+                        "OPEN_AI_DALLE3_API_VERSION": "2024-02-01",
+                        "OPEN_AI_DALLE3_DEPLOYMENT_NAME": "dalle3-fake",
+                        "GROQ_BASE_URL": fake_url,
+                        "GROQ_API_KEY": "fake",
+                        "SEGMIND_BASE_URL": f"{fake_url}/v1",
+                        "SEGMIND_KEY": "fake",
+                    },
+                )
+            )
+            base_url = f"http://127.0.0.1:{args.backend_port}"
+            await wait_until_ready(f"{base_url}/health-check")
+
+        recorder = Recorder()
+        limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            users = [VirtualUser(client, recorder, user_id, args.password) for user_id in user_ids]
+            started_at = time.monotonic()
+            deadline = started_at + args.warmup + args.duration
+            tasks = [asyncio.create_task(user.run(args.mix, deadline)) for user in users]
+
+            # ウォームアップ中（ログインや接続の確立が集中する時間）は記録しない
+            await asyncio.sleep(args.warmup)
+            recorder.recording = True
+            recording_started_at = time.monotonic()
+            await asyncio.gather(*tasks)
+            duration = time.monotonic() - recording_started_at
+
+        report = recorder.report(duration)
+        report["config"] = {
+            "base_url": base_url,
+            "users": args.users,
+            "duration_seconds": round(duration, 2),
+            "warmup_seconds": args.warmup,
+            "mix": args.mix,
+        }
+        if args.base_url is None:
+            report["config"]["fake_providers"] = {
+                "chat_latency_ms": args.chat_latency_ms,
+                "image_latency_ms": args.image_latency_ms,
+                "error_rate": args.error_rate,
+            }
+        report["started_at"] = datetime.now(timezone.utc).isoformat()
+        return report
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    """コマンドライン引数を読み込んで負荷試験を実行し、結果を出力する"""
+    parser = argparse.ArgumentParser(description="Run a load test against the backend and report latency per route as JSON")
+    parser.add_argument("--base-url", default=None, help="既に起動しているバックエンドのURL（省略時は代替サーバーとバックエンドを起動する）")
+    parser.add_argument("--users", type=int, default=20, help="同時に操作する参加者の数")
+    parser.add_argument("--duration", type=float, default=60, help="計測する時間（秒）")
+    parser.add_argument("--warmup", type=float, default=5, help="計測を始めるまでの時間（秒）")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"ルートごとの重み（既定：{DEFAULT_MIX}）")
+    parser.add_argument("--timeout", type=float, default=60, help="1リクエストのタイムアウト（秒）")
+    parser.add_argument("--user-prefix", default="bench_user_", help="参加者のユーザーIDの接頭辞")
+    parser.add_argument("--password", default="bench_password", help="参加者のパスワード")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="起動するバックエンドに設定するパスワードハッシュのラウンド数")
+    parser.add_argument("--fake-port", type=int, default=9100)
+    parser.add_argument("--backend-port", type=int, default=5100)
+    parser.add_argument("--chat-latency-ms", type=float, default=500, help="代替サーバーの採点の応答時間")
+    parser.add_argument("--image-latency-ms", type=float, default=5000, help="代替サーバーの画像生成の応答時間")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="代替サーバーがエラーを返す割合")
+    parser.add_argument("--output", default=None, help="結果のJSONの出力先（省略時は標準出力）")
+    parser.add_argument("--baseline", default=None, help="比較する基準の結果のJSON")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="基準に対して許容する p95/p99 の悪化の割合")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args))
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare_with_baseline(report, json.load(f), args.max_regression)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,33 @@
 """FastAPIアプリケーションのメインファイル"""
 
+import asyncio
 from datetime import datetime
 import os
+import time
 
 import dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from app.api.v1.endpoints import (
+    admin as admin_v1,
+    batch_scoring as batch_scoring_v1,
     challenges_list as challenges_list_v1,
     challenges_func as challenges_func_v1,
     users as users_v1,
     image as image_v1,
     auth as auth_v1,
 )
+from app.core.challenge_catalog import challenge_catalog
+from app.core.image_index import image_index
+from app.core.metrics import ACTIVE_SESSIONS, QUEUED_IMAGE_JOBS, REQUEST_LATENCY, get_router_label, render_metrics
 from app.core.mongodb_core import db
+from app.core.score_cache import score_cache
+from app.core.session_store import session_store
+from app.services.image_job_services import image_job_queue, image_provider_registry
+from app.services.image_variant_services import image_variant_store
+from app.services.scoring_services import scoring_provider_registry
 from app.utils.log_utils import logging
 
 logging("Starting FastAPI server...")
@@ -39,23 +51,73 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    """ルーターごとのレイテンシを計測"""
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        REQUEST_LATENCY.labels(get_router_label(request.url.path), request.method, str(status_code)).observe(time.perf_counter() - start)
+
+
 @app.on_event("startup")
 async def startup_db_client():
     """アプリケーション起動時の処理"""
     if os.getenv("PASS_INITIALIZE_MONGO_SETUP", "True") == "False":
         logging("Initializing MongoDB setup...")
         await db.connect()
+        await db.ensure_indexes()
         await db.init_challenges()
+        await challenge_catalog.start()
     else:
         logging("Skip initializing MongoDB setup.")
 
 
+@app.on_event("startup")
+async def startup_image_index():
+    """画像ファイルのインデックスを作成し、チャレンジ画像の縮小版をバックグラウンドで用意する"""
+    image_index.build()
+    if os.getenv("PREGENERATE_IMAGE_VARIANTS", "True") == "True":
+        asyncio.create_task(image_variant_store.create_missing_challenge_variants())
+
+
+@app.on_event("startup")
+async def startup_llm_clients():
+    """採点に使うLLMクライアントを起動時に1度だけ初期化する"""
+    await scoring_provider_registry.connect()
+
+
+@app.on_event("startup")
+async def startup_image_job_workers():
+    """画像生成クライアントを初期化し、画像生成ジョブのワーカーを起動する"""
+    await image_provider_registry.connect()
+    await image_job_queue.start()
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """アプリケーション終了時の処理"""
+    await challenge_catalog.stop()
     await db.close()
 
 
+@app.on_event("shutdown")
+async def shutdown_llm_clients():
+    """LLMクライアントのコネクションプールを閉じる"""
+    await scoring_provider_registry.close()
+
+
+@app.on_event("shutdown")
+async def shutdown_image_job_workers():
+    """画像生成ジョブのワーカーを停止し、画像生成クライアントのコネクションプールを閉じる"""
+    await image_job_queue.stop()
+    await image_provider_registry.close()
+
+
 # ルーターの登録
 app.include_router(
     challenges_list_v1.api_router,
@@ -67,6 +129,11 @@ app.include_router(
     prefix="/api/challenges-func",
     tags=["challenges"],
 )
+app.include_router(
+    batch_scoring_v1.api_router,
+    prefix="/api/batch-scoring",
+    tags=["challenges"],
+)
 app.include_router(
     users_v1.api_router,
     prefix="/api/users",
@@ -82,6 +149,11 @@ app.include_router(
     prefix="/api/auth",
     tags=["auth"],
 )
+app.include_router(
+    admin_v1.api_router,
+    prefix="/api/admin",
+    tags=["admin"],
+)
 
 
 @app.get("/", tags=["others"])
@@ -91,6 +163,7 @@ app.include_router(
 async def health_check():
     """ヘルスチェック用のエンドポイント"""
     response = {"message": "Server is running."}
+    response["score_cache"] = score_cache.stats()
 
     if os.getenv("DEBUG", "False") == "True":
         response["server_internal_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -101,6 +174,19 @@ async def health_check():
     return response
 
 
+@app.get("/metrics", tags=["others"], include_in_schema=False)
+async def metrics():
+    """Prometheusのスクレイピング用のエンドポイント"""
+    try:
+        ACTIVE_SESSIONS.set(await session_store.count())
+    except Exception as e:
+        logging("metrics: ", e)
+    QUEUED_IMAGE_JOBS.set(image_job_queue.queue.qsize() if image_job_queue.queue is not None else 0)
+
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
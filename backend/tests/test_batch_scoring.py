@@ -0,0 +1,65 @@
+"""Tests for /backend/app/services/batch_scoring_services.py"""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from main import app
+from app.core.challenge_catalog import challenge_catalog
+from app.core.exceptions import ServiceUnavailableError
+from app.core.security import create_access_token
+from app.services.batch_scoring_services import BatchScoringService, TrialScoringMatrix
+from app.utils.challenge_utils import calculate_trial_score, tokenize_for_trial
+
+RESULT_SAMPLES = {
+    "ch001": "A deer rests next to a blue bench near the red gate",
+    "ch002": "Cars and a bicycle cross a wet street between tall buildings",
+    "ch003": "",
+}
+SUBMISSIONS = [
+    "a deer near the gate",
+    "Cars cross a WET street",
+    "nothing in common",
+    "a",
+]
+
+
+class TestTrialScoringMatrix(unittest.TestCase):
+    """/backend/app/services/batch_scoring_services.py tests"""
+
+    def test_score_matches_trial_score(self):
+        """TrialScoringMatrix.score gives the same scores as calculate_trial_score"""
+        challenge_ids = list(RESULT_SAMPLES)
+        result_tokens = [tokenize_for_trial(RESULT_SAMPLES[challenge_id]) for challenge_id in challenge_ids]
+        scores = TrialScoringMatrix(challenge_ids, result_tokens).score(SUBMISSIONS)
+
+        for row, submission in enumerate(SUBMISSIONS):
+            for column, tokens in enumerate(result_tokens):
+                self.assertEqual(scores[row, column], calculate_trial_score(tokenize_for_trial(submission), tokens))
+
+    def test_matrix_rebuilt_on_reload(self):
+        """BatchScoringService rebuilds the matrix when the catalog is reloaded, even with the same version"""
+        service = BatchScoringService()
+        first_tokens = {"ch001": tokenize_for_trial(RESULT_SAMPLES["ch001"])}
+        reloaded_tokens = {"ch002": tokenize_for_trial(RESULT_SAMPLES["ch002"])}
+        with mock.patch.object(challenge_catalog, "version", 1), mock.patch.object(challenge_catalog, "result_tokens", first_tokens):
+            first = asyncio.run(service.get_matrix())
+            self.assertIs(asyncio.run(service.get_matrix()), first)
+            challenge_catalog.result_tokens = reloaded_tokens
+            self.assertEqual(asyncio.run(service.get_matrix()).challenge_ids, ["ch002"])
+
+
+class TestBatchScoringEndpoint(unittest.TestCase):
+    """/backend/app/api/v1/endpoints/batch_scoring.py tests"""
+
+    def test_catalog_unavailable(self):
+        """/batch-scoring/trial returns 503 before streaming when the challenge catalog cannot be loaded"""
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': 'test_batch_admin', 'roles': ['admin']})}"}
+        with mock.patch.object(challenge_catalog, "ensure_loaded", mock.AsyncMock(side_effect=ServiceUnavailableError("Could not connect to the service"))):
+            response = TestClient(app).post("/api/batch-scoring/trial", json={"submissions": SUBMISSIONS}, headers=headers)
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+"""Tests for /backend/app/utils/challenge_utils.py"""
+
+import unittest
+
+from app.utils.challenge_utils import calculate_trial_score, normalize_submission, submission_validation, tokenize_for_trial
+
+
+class TestChallengeUtils(unittest.TestCase):
+    """/backend/app/utils/challenge_utils.py tests"""
+
+    def test_normalize_submission(self):
+        """normalize_submission absorbs case and whitespace differences"""
+        self.assertEqual(normalize_submission("  A cat  sits　on a MAT. "), "a cat sits on a mat.")
+
+    def test_submission_validation(self):
+        """submission_validation rejects invalid characters"""
+        self.assertTrue(submission_validation("A cat sits on a mat."))
+        self.assertFalse(submission_validation("A cat sits on a mat!"))
+
+    def test_calculate_trial_score(self):
+        """calculate_trial_score scales the share of result words and caps it at 100"""
+        result_tokens = tokenize_for_trial("A deer rests next to a blue bench near the red gate")
+        self.assertEqual(calculate_trial_score(tokenize_for_trial("a DEER"), result_tokens), 54)
+        self.assertEqual(calculate_trial_score(tokenize_for_trial("a deer next to the gate"), result_tokens), 100)
+        self.assertEqual(calculate_trial_score(tokenize_for_trial("a deer"), frozenset()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
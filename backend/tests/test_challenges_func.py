@@ -0,0 +1,43 @@
+"""Tests for /backend/app/api/v1/endpoints/challenges_func.py"""
+
+import asyncio
+import unittest
+
+from fastapi.testclient import TestClient
+from main import app
+from app.core.security import create_access_token
+from app.core.session_store import session_store
+from app.models.pydantic_models import UserChallenges
+
+client = TestClient(app)
+
+
+class TestChallengesFunc(unittest.TestCase):
+    """/backend/app/api/v1/endpoints/challenges_func.py tests"""
+
+    def test_get_challenge_progress_not_modified(self):
+        """/get-challenge-progress returns 304 until the progress changes"""
+        user_id = "test_progress_etag_user"
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': user_id})}"}
+        asyncio.run(session_store.create(user_id, UserChallenges(now_challenge_id="challenge", now_challenge={})))
+        try:
+            response = client.get("/api/challenges-func/get-challenge-progress", headers=headers)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers["etag"]
+            self.assertIn("no-cache", response.headers["cache-control"])
+
+            response = client.get("/api/challenges-func/get-challenge-progress", headers={**headers, "If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+
+            asyncio.run(session_store.record_submission(user_id, {"content": "a cat", "score": 50}, "a cat", 50))
+            response = client.get("/api/challenges-func/get-challenge-progress", headers={**headers, "If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers["etag"], etag)
+            self.assertEqual(response.json()["in_progress"][0]["submissions"][0]["score"], 50)
+        finally:
+            asyncio.run(session_store.delete(user_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Tests for /backend/app/api/v1/endpoints/image.py"""
+
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from main import app
+from app.core.image_index import image_index
+from app.services.image_variant_services import image_variant_store
+
+client = TestClient(app)
+IMAGE_ID = "ch_f011aa5b7e209c2566cfcc49143b1ab713016351f0727938cbf93f7e155f5126"
+
+
+class TestImage(unittest.TestCase):
+    """/backend/app/api/v1/endpoints/image.py tests"""
+
+    def test_get_image(self):
+        """/api/img/{image_id} returns an immutable image with a strong ETag"""
+        response = client.get(f"/api/img/{IMAGE_ID}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["etag"], f'"{IMAGE_ID[3:]}"')
+        self.assertIn("immutable", response.headers["cache-control"])
+
+    def test_get_image_not_modified(self):
+        """/api/img/{image_id} returns 304 for a matching If-None-Match"""
+        response = client.get(f"/api/img/{IMAGE_ID}", headers={"If-None-Match": f'"{IMAGE_ID[3:]}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_get_image_variant(self):
+        """/api/img/{image_id}?w= returns a resized WebP variant"""
+        # 縮小版は元画像の隣に保存されるため、元画像を一時ディレクトリにコピーして作業ツリーを汚さない
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_entry = image_index.get(IMAGE_ID)
+            temp_image_path = Path(temp_dir) / image_entry.path.name
+            shutil.copyfile(image_entry.path, temp_image_path)
+            with mock.patch.dict(image_index.entries, {IMAGE_ID: image_entry._replace(path=temp_image_path)}), mock.patch.dict(image_variant_store.variants, clear=True):
+                response = client.get(f"/api/img/{IMAGE_ID}?w=200")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.headers["content-type"], "image/webp")
+                self.assertEqual(response.headers["etag"], f'"{IMAGE_ID[3:]}-w256"')
+                self.assertTrue((Path(temp_dir) / f"{IMAGE_ID}_w256.webp").is_file())
+
+    def test_get_image_mutable_id(self):
+        """/api/img/{image_id} asks clients to revalidate images whose ID is not a content hash"""
+        image_entry = image_index.get(IMAGE_ID)
+        with mock.patch.dict(image_index.entries, {"legacy_image": image_entry}):
+            response = client.get("/api/img/legacy_image")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("immutable", response.headers["cache-control"])
+        self.assertIn("no-cache", response.headers["cache-control"])
+
+    def test_get_image_not_found(self):
+        """/api/img/{image_id} returns 404 for an unknown image"""
+        response = client.get("/api/img/ch_" + "0" * 64)
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
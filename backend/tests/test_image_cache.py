@@ -0,0 +1,47 @@
+"""Tests for /backend/app/services/image_cache_services.py"""
+
+import asyncio
+import os
+from pathlib import Path
+import tempfile
+import unittest
+from unittest import mock
+
+from app.core.image_index import ImageEntry, image_index
+from app.services.image_cache_services import ImageGenerationCache
+
+
+class TestImageGenerationCache(unittest.TestCase):
+    """/backend/app/services/image_cache_services.py tests"""
+
+    def test_create_key(self):
+        """create_key ignores prompt formatting but not the provider, model or parameters"""
+        key = ImageGenerationCache.create_key("segmind", "sdxl", "A cat  sits", {"seed": 1, "samples": 1})
+        self.assertEqual(key, ImageGenerationCache.create_key("segmind", "sdxl", "a cat sits", {"samples": 1, "seed": 1}))
+        self.assertNotEqual(key, ImageGenerationCache.create_key("dalle3", "sdxl", "a cat sits", {"seed": 1, "samples": 1}))
+        self.assertNotEqual(key, ImageGenerationCache.create_key("segmind", "sdxl", "a cat sits", {"seed": 2, "samples": 1}))
+
+    def test_get_drops_missing_file(self):
+        """get treats a cached image whose file was deleted as a miss and drops the index entry and the cache row"""
+        cache = ImageGenerationCache()
+        image_id = "gen_test_get_drops_missing_file"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_path = Path(temp_dir) / f"{image_id}.png"
+            image_path.write_bytes(b"png")
+            entry = ImageEntry(path=image_path, etag='"test"', stat_result=image_path.stat())
+            # ハンドラーが無いと get がインデックスを作り直し、差し替えたエントリーが消えてしまう
+            with mock.patch.object(image_index, "handler", mock.Mock()), mock.patch.dict(image_index.entries, {image_id: entry}), \
+                    mock.patch("app.services.image_cache_services.db") as db_mock:
+                db_mock.get_generated_image_id = mock.AsyncMock(return_value=image_id)
+                db_mock.delete_generated_image_id = mock.AsyncMock()
+                self.assertEqual(asyncio.run(cache.get("segmind", "sdxl", "a cat", {})), image_id)
+                db_mock.delete_generated_image_id.assert_not_awaited()
+
+                os.remove(image_path)
+                self.assertIsNone(asyncio.run(cache.get("segmind", "sdxl", "a cat", {})))
+                self.assertNotIn(image_id, image_index.entries)
+                db_mock.delete_generated_image_id.assert_awaited_once_with(cache.create_key("segmind", "sdxl", "a cat", {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
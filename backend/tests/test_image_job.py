@@ -0,0 +1,150 @@
+"""Tests for /backend/app/services/image_job_services.py"""
+
+import asyncio
+from datetime import timedelta
+import unittest
+from unittest import mock
+
+from app.core.exceptions import ServiceUnavailableError
+from app.services import image_job_services
+from app.services.image_job_services import JOB_STATUS_DEFERRED, JOB_STATUS_DONE, JOB_STATUS_QUEUED, JOB_STATUS_RUNNING, ImageJobQueue
+from app.utils.time_utils import get_jst_now
+
+
+class FakeImageJobDB:
+    """image_jobs コレクションの代わりに、ジョブを辞書に保持する"""
+
+    def __init__(self, jobs: list[dict]):
+        self.jobs = {job["job_id"]: dict(job) for job in jobs}
+
+    async def insert_image_job(self, job: dict):
+        self.jobs[job["job_id"]] = dict(job)
+
+    async def update_image_job(self, job_id: str, fields: dict):
+        self.jobs[job_id].update(fields)
+
+    async def claim_image_job(self, from_status: str, to_status: str):
+        candidates = sorted((job for job in self.jobs.values() if job["status"] == from_status), key=lambda job: job["created_at"])
+        if not candidates:
+            return None
+        candidates[0].update({"status": to_status, "updated_at": get_jst_now()})
+        return dict(candidates[0])
+
+    async def requeue_stale_image_jobs(self, statuses, updated_before, to_status):
+        stale_jobs = [job for job in self.jobs.values() if job["status"] in statuses and job["updated_at"] < updated_before]
+        for job in stale_jobs:
+            job.update({"status": to_status, "updated_at": get_jst_now()})
+        return len(stale_jobs)
+
+    async def count_image_jobs(self, status: str, limit: int):
+        return min(sum(1 for job in self.jobs.values() if job["status"] == status), limit)
+
+    async def get_image_job(self, job_id: str):
+        return dict(self.jobs[job_id])
+
+
+def create_job(job_id: str, status: str, age_seconds: float) -> dict:
+    updated_at = get_jst_now() - timedelta(seconds=age_seconds)
+    return {"job_id": job_id, "user_id": "user", "challenge_id": "challenge", "session_id": "session", "prompt": "a cat", "status": status, "created_at": updated_at, "updated_at": updated_at}
+
+
+class TestImageJobQueue(unittest.TestCase):
+    """/backend/app/services/image_job_services.py tests"""
+
+    def setUp(self):
+        patchers = [
+            mock.patch.dict("os.environ", {"IMAGE_JOB_WORKERS": "1", "IMAGE_JOB_MAX_QUEUED": "5"}),
+            mock.patch.object(image_job_services, "IMAGE_JOB_POLL_INTERVAL", 0.01),
+            mock.patch.object(image_job_services, "IMAGE_JOB_SHUTDOWN_TIMEOUT", 0.05),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_restart_requeues_stale_jobs(self):
+        """start runs jobs left queued or running by a crashed worker once their lease has expired"""
+        lease = image_job_services.IMAGE_JOB_LEASE_SECONDS
+        fake_db = FakeImageJobDB([create_job("stale", JOB_STATUS_RUNNING, lease + 60), create_job("active", JOB_STATUS_RUNNING, 10)])
+
+        async def run_job(job: dict):
+            await fake_db.update_image_job(job["job_id"], {"status": JOB_STATUS_DONE})
+
+        async def run():
+            queue = ImageJobQueue()
+            with mock.patch.object(queue, "_run_job", run_job):
+                await queue.start()
+                job = await queue.wait("stale", timeout=1)
+                await queue.stop()
+            return job
+
+        with mock.patch.object(image_job_services, "db", fake_db):
+            self.assertEqual(asyncio.run(run())["status"], JOB_STATUS_DONE)
+        self.assertEqual(fake_db.jobs["active"]["status"], JOB_STATUS_RUNNING)
+
+    def test_stop_returns_running_job_to_deferred(self):
+        """stop returns a job that did not finish in time to deferred, and the restarted queue runs it"""
+        fake_db = FakeImageJobDB([])
+        started = asyncio.Event()
+
+        async def hang(job: dict):
+            await fake_db.update_image_job(job["job_id"], {"status": JOB_STATUS_RUNNING})
+            started.set()
+            await asyncio.sleep(60)
+
+        async def run_job(job: dict):
+            await fake_db.update_image_job(job["job_id"], {"status": JOB_STATUS_DONE})
+
+        async def run():
+            queue = ImageJobQueue()
+            with mock.patch.object(queue, "_run_job", hang):
+                job_id, status = await queue.enqueue("user", "challenge", "session", "a cat")
+                await started.wait()
+                await queue.stop()
+            stopped_status = fake_db.jobs[job_id]["status"]
+
+            restarted_queue = ImageJobQueue()
+            with mock.patch.object(restarted_queue, "_run_job", run_job):
+                await restarted_queue.start()
+                job = await restarted_queue.wait(job_id, timeout=1)
+                await restarted_queue.stop()
+            return status, stopped_status, job["status"]
+
+        with mock.patch.object(image_job_services, "db", fake_db):
+            self.assertEqual(asyncio.run(run()), (JOB_STATUS_QUEUED, JOB_STATUS_DEFERRED, JOB_STATUS_DONE))
+
+    def test_deferred_jobs_run_oldest_first(self):
+        """enqueue defers new jobs while older jobs are deferred, and the queue takes the oldest deferred job first"""
+        fake_db = FakeImageJobDB([])
+
+        async def run():
+            queue = ImageJobQueue()
+            await queue.start()
+            _, first_status = await queue.enqueue("user", "challenge", "session", "first")
+            second_id, second_status = await queue.enqueue("user", "challenge", "session", "second")
+            # キューが空いた後の新しいジョブは、先に保留されたジョブを追い越さない
+            queue.queue.get_nowait()
+            queue.queue.task_done()
+            third_id, third_status = await queue.enqueue("user", "challenge", "session", "third")
+            queued_job_id = queue.queue.get_nowait()["job_id"]
+            queue.queue.task_done()
+            result = (first_status, second_status, third_status), queued_job_id == second_id, fake_db.jobs[third_id]["status"]
+            await queue.stop()
+            return result
+
+        with mock.patch.dict("os.environ", {"IMAGE_JOB_WORKERS": "0", "IMAGE_JOB_MAX_QUEUED": "1"}), mock.patch.object(image_job_services, "db", fake_db):
+            self.assertEqual(asyncio.run(run()), ((JOB_STATUS_QUEUED, JOB_STATUS_DEFERRED, JOB_STATUS_DEFERRED), True, JOB_STATUS_DEFERRED))
+
+    def test_ensure_capacity(self):
+        """ensure_capacity rejects with 503 and Retry-After once the deferred backlog reaches the cap"""
+        fake_db = FakeImageJobDB([create_job("deferred", JOB_STATUS_DEFERRED, 0)])
+        with mock.patch.object(image_job_services, "db", fake_db), mock.patch.object(image_job_services, "IMAGE_JOB_MAX_DEFERRED", 2):
+            asyncio.run(ImageJobQueue().ensure_capacity())
+            fake_db.jobs["another"] = create_job("another", JOB_STATUS_DEFERRED, 0)
+            with self.assertRaises(ServiceUnavailableError) as context:
+                asyncio.run(ImageJobQueue().ensure_capacity())
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertIn("Retry-After", context.exception.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""Tests for /backend/app/utils/image_utils.py"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from app.utils.image_utils import image_bytes_to_sha256, save_stream_content_addressed
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+async def broken_chunks():
+    yield b"partial"
+    raise ConnectionError("connection lost")
+
+
+class TestImageUtils(unittest.TestCase):
+    """/backend/app/utils/image_utils.py tests"""
+
+    def test_image_bytes_to_sha256(self):
+        """image_bytes_to_sha256 gives the same hash for bytes and for chunks of them"""
+        self.assertEqual(image_bytes_to_sha256(b"\x89PNGbody"), image_bytes_to_sha256([b"\x89PNG", b"body"]))
+
+    def test_save_stream_content_addressed(self):
+        """save_stream_content_addressed names the file by its content and stores duplicates once"""
+        with tempfile.TemporaryDirectory() as image_dir:
+            image_id = asyncio.run(save_stream_content_addressed(chunks(b"\x89PNG", b"body"), image_dir))
+            self.assertEqual(image_id, "gen_" + image_bytes_to_sha256(b"\x89PNGbody"))
+            with open(os.path.join(image_dir, f"{image_id}.png"), "rb") as image_file:
+                self.assertEqual(image_file.read(), b"\x89PNGbody")
+
+            self.assertEqual(asyncio.run(save_stream_content_addressed(chunks(b"\x89PNGbody"), image_dir)), image_id)
+            self.assertEqual(os.listdir(image_dir), [f"{image_id}.png"])
+
+    def test_save_stream_content_addressed_failure(self):
+        """save_stream_content_addressed never leaves a partial file behind"""
+        with tempfile.TemporaryDirectory() as image_dir:
+            with self.assertRaises(ConnectionError):
+                asyncio.run(save_stream_content_addressed(broken_chunks(), image_dir))
+            self.assertEqual(os.listdir(image_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
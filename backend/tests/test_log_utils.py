@@ -0,0 +1,51 @@
+"""Tests for /backend/app/utils/log_utils.py"""
+
+import json
+import logging as std_logging
+import unittest
+
+from app.utils.log_utils import LOG_MAX_ARG_LENGTH, JsonFormatter, LazyMessage, SamplingFilter, parse_sample_rates
+
+
+def create_record(name: str, level: int, message) -> std_logging.LogRecord:
+    return std_logging.LogRecord(name, level, __file__, 1, message, None, None)
+
+
+class TestLogUtils(unittest.TestCase):
+    """/backend/app/utils/log_utils.py tests"""
+
+    def test_lazy_message(self):
+        """LazyMessage joins the arguments like print and truncates large ones"""
+        self.assertEqual(str(LazyMessage(("Challenge started: ", "ch001"))), "Challenge started:  ch001")
+        message = str(LazyMessage(("x" * (LOG_MAX_ARG_LENGTH + 10),)))
+        self.assertTrue(message.startswith("x" * LOG_MAX_ARG_LENGTH))
+        self.assertTrue(message.endswith("(truncated 10 chars)"))
+
+    def test_lazy_message_snapshot(self):
+        """LazyMessage keeps the state of mutable arguments at the time it was created"""
+        submissions = [{"score": 50}]
+        progress = {"revision": 1}
+        message = LazyMessage(("Progress: ", submissions, progress))
+        submissions.append({"score": 90})
+        progress["revision"] = 2
+        self.assertEqual(str(message), "Progress:  [{'score': 50}] {'revision': 1}")
+
+    def test_sampling_filter(self):
+        """SamplingFilter uses the longest matching logger name and never drops warnings"""
+        sampling_filter = SamplingFilter(parse_sample_rates("app=1, app.api=0 ,invalid"))
+        self.assertEqual(sampling_filter.get_rate("app.api.v1.endpoints.challenges_func"), 0.0)
+        self.assertEqual(sampling_filter.get_rate("app.apis"), 1.0)
+        self.assertFalse(sampling_filter.filter(create_record("app.api.v1", std_logging.INFO, "dropped")))
+        self.assertTrue(sampling_filter.filter(create_record("app.api.v1", std_logging.WARNING, "kept")))
+
+    def test_json_formatter(self):
+        """JsonFormatter writes the fields promtail extracts"""
+        entry = json.loads(JsonFormatter().format(create_record("app.main", std_logging.INFO, LazyMessage(("Starting",)))))
+        self.assertEqual(entry["level"], "info")
+        self.assertEqual(entry["logger"], "app.main")
+        self.assertEqual(entry["message"], "Starting")
+        self.assertIn("+09:00", entry["timestamp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
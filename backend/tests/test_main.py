@@ -18,6 +18,13 @@ class TestMain(unittest.TestCase):
         data = response.json()
         self.assertEqual(data["message"], "Server is running.")
 
+    def test_metrics(self):
+        """/metrics endpoint test"""
+        client.get("/health-check")
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("http_request_duration_seconds", response.text)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,81 @@
+"""Tests for /backend/app/core/provider_registry.py"""
+
+import asyncio
+import unittest
+
+from app.core.provider_registry import PROVIDER_MIN_SAMPLES, NoProviderAvailableError, Provider, ProviderError, ProviderRegistry, RollingStats
+
+
+class FakeProvider(Provider[str]):
+    def __init__(self, name: str, fails: bool = False):
+        self.name = name
+        super().__init__()
+        self.fails = fails
+        self.calls = 0
+
+    async def invoke(self, prompt: str) -> str:
+        self.calls += 1
+        if self.fails:
+            raise ProviderError(f"{self.name} failed")
+        return f"{self.name}:{prompt}"
+
+
+class TestProviderRegistry(unittest.TestCase):
+    """/backend/app/core/provider_registry.py tests"""
+
+    def test_configure(self):
+        """ProviderRegistry enables the configured providers in order and ignores unknown names"""
+        first, second = FakeProvider("test_configure_first"), FakeProvider("test_configure_second")
+        registry = ProviderRegistry("test", [first, second], "test_configure_second, unknown")
+        self.assertEqual(registry.enabled, [second])
+        registry.configure("")
+        self.assertEqual(registry.enabled, [first, second])
+
+    def test_ranked_by_expected_latency(self):
+        """ProviderRegistry prefers providers without enough samples, then the lowest latency adjusted by error rate"""
+        slow, fast, unknown = FakeProvider("test_ranked_slow"), FakeProvider("test_ranked_fast"), FakeProvider("test_ranked_unknown")
+        registry = ProviderRegistry("test", [slow, fast, unknown])
+        for _ in range(PROVIDER_MIN_SAMPLES):
+            slow.stats.record(2.0, True)
+            fast.stats.record(0.5, True)
+        self.assertEqual(registry.ranked(), [unknown, fast, slow])
+
+        # 速くても、半分失敗するプロバイダーは見込みの時間が2倍になる
+        for _ in range(PROVIDER_MIN_SAMPLES):
+            fast.stats.record(0.5, False)
+            unknown.stats.record(1.5, True)
+        self.assertEqual(registry.ranked(), [fast, unknown, slow])
+        for _ in range(6):
+            fast.stats.record(0.5, False)
+        self.assertEqual(registry.ranked(), [unknown, fast, slow])
+
+    def test_call_falls_back(self):
+        """ProviderRegistry.call records failures and falls back to the next provider"""
+        broken, working = FakeProvider("test_call_broken", fails=True), FakeProvider("test_call_working")
+        registry = ProviderRegistry("test", [broken, working])
+        self.assertEqual(asyncio.run(registry.call("prompt", deadline=5, max_retries=0)), ("test_call_working:prompt", "test_call_working"))
+        self.assertEqual(broken.stats.summary()[0::2], (1, 1.0))
+        self.assertEqual(working.stats.summary()[0::2], (1, 0.0))
+
+    def test_call_skips_open_circuit(self):
+        """ProviderRegistry.call skips providers whose circuit breaker is open and raises when none is left"""
+        provider = FakeProvider("test_open_circuit")
+        registry = ProviderRegistry("test", [provider])
+        for _ in range(provider.breaker.failure_threshold):
+            provider.breaker.record_failure()
+        with self.assertRaises(NoProviderAvailableError):
+            asyncio.run(registry.call("prompt", deadline=5, max_retries=0))
+        self.assertEqual(provider.calls, 0)
+        self.assertEqual(provider.stats.summary()[0], 0)
+
+    def test_rolling_window(self):
+        """RollingStats forgets samples older than the window"""
+        stats = RollingStats(window_seconds=60)
+        stats.record(1.0, False)
+        self.assertEqual(stats.summary(), (1, 1.0, 1.0))
+        stats.samples[0] = (stats.samples[0][0] - 61, 1.0, False)
+        self.assertEqual(stats.summary(), (0, 0.0, 0.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Tests for /backend/app/core/resilience.py"""
+
+import asyncio
+import unittest
+
+import httpx
+
+from app.core.resilience import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, CircuitBreaker, CircuitOpenError, call_with_resilience, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+class TestResilience(unittest.TestCase):
+    """/backend/app/core/resilience.py tests"""
+
+    def test_retries_until_success(self):
+        """call_with_resilience retries transient errors within the deadline"""
+        breaker = CircuitBreaker("test_retry", failure_threshold=1, reset_timeout=60)
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise StatusError(503)
+            return 42
+
+        self.assertEqual(asyncio.run(call_with_resilience(breaker, flaky, deadline=5, max_retries=2, base_delay=0.001)), 42)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(breaker.state, CIRCUIT_CLOSED)
+
+    def test_does_not_retry_client_errors(self):
+        """call_with_resilience gives up immediately on non-retryable status codes"""
+        breaker = CircuitBreaker("test_client_error", failure_threshold=5, reset_timeout=60)
+        calls = []
+
+        async def unauthorized():
+            calls.append(1)
+            raise StatusError(401)
+
+        with self.assertRaises(StatusError):
+            asyncio.run(call_with_resilience(breaker, unauthorized, deadline=5, max_retries=2, base_delay=0.001))
+        self.assertEqual(len(calls), 1)
+
+    def test_is_retryable(self):
+        """is_retryable only retries transport errors, timeouts, 429 and 5xx, not malformed responses"""
+        request = httpx.Request("POST", "https://example.com")
+        self.assertTrue(is_retryable(httpx.ConnectError("refused", request=request)))
+        self.assertTrue(is_retryable(asyncio.TimeoutError()))
+        self.assertTrue(is_retryable(StatusError(429)))
+        self.assertTrue(is_retryable(StatusError(503)))
+        self.assertTrue(is_retryable(httpx.HTTPStatusError("bad gateway", request=request, response=httpx.Response(502, request=request))))
+        self.assertFalse(is_retryable(StatusError(400)))
+        self.assertFalse(is_retryable(ValueError("invalid literal for int()")))
+
+    def test_deadline(self):
+        """call_with_resilience stops a slow call at the deadline"""
+        breaker = CircuitBreaker("test_deadline", failure_threshold=5, reset_timeout=60)
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(call_with_resilience(breaker, slow, deadline=0.05, max_retries=2, base_delay=0.001))
+
+    def test_circuit_breaker(self):
+        """CircuitBreaker opens after consecutive failures and lets one trial call through after the timeout"""
+        breaker = CircuitBreaker("test_breaker", failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CIRCUIT_OPEN)
+        self.assertFalse(breaker.allow())
+
+        async def unused():
+            return 0
+
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(call_with_resilience(breaker, unused, deadline=5))
+
+        breaker.opened_at -= 60
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CIRCUIT_HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CIRCUIT_CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,20 @@
+"""Tests for /backend/app/core/score_cache.py"""
+
+import unittest
+
+from app.core.score_cache import ScoreCache
+
+
+class TestScoreCache(unittest.TestCase):
+    """/backend/app/core/score_cache.py tests"""
+
+    def test_create_key(self):
+        """create_key ignores submission formatting but changes when the challenge's result sample changes"""
+        key = ScoreCache.create_key("challenge", "A cat sits on the mat.", "A cat  sits")
+        self.assertEqual(key, ScoreCache.create_key("challenge", "A cat sits on the mat.", "a cat sits"))
+        self.assertNotEqual(key, ScoreCache.create_key("challenge", "A dog runs in the park.", "a cat sits"))
+        self.assertNotEqual(key, ScoreCache.create_key("other", "A cat sits on the mat.", "a cat sits"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""Tests for /backend/app/core/security.py"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+import hashlib
+import unittest
+
+import bcrypt
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+import jwt
+
+from app.core import security
+from app.core.exceptions import ServiceUnavailableError
+
+
+class TestSecurity(unittest.TestCase):
+    """/backend/app/core/security.py tests"""
+
+    def test_verify_password_async(self):
+        """verify_password_async checks the password off the event loop"""
+        hashed_password = bcrypt.hashpw(b"pwd1234", bcrypt.gensalt(rounds=4)).decode()
+        self.assertTrue(asyncio.run(security.verify_password_async("pwd1234", hashed_password)))
+        self.assertFalse(asyncio.run(security.verify_password_async("wrong", hashed_password)))
+        self.assertEqual(security.pending_password_verifications, 0)
+
+    def test_verify_password_async_rejects_when_full(self):
+        """verify_password_async returns 503 when too many verifications are pending"""
+        security.pending_password_verifications = security.PASSWORD_VERIFY_MAX_PENDING
+        try:
+            with self.assertRaises(ServiceUnavailableError):
+                asyncio.run(security.verify_password_async("pwd1234", "unused"))
+        finally:
+            security.pending_password_verifications = 0
+
+    def test_decode_token_cache(self):
+        """decode_token reuses cached claims and still rejects them after exp"""
+        token = security.create_access_token({"sub": "test_user"})
+        self.assertEqual(security.decode_token(token)["sub"], "test_user")
+        self.assertIn(hashlib.sha256(token.encode()).digest(), security.decoded_token_cache)
+        self.assertEqual(security.decode_token(token)["sub"], "test_user")
+
+        token_digest = hashlib.sha256(token.encode()).digest()
+        security.decoded_token_cache[token_digest]["exp"] = (datetime.now(timezone.utc) - timedelta(minutes=1)).timestamp()
+        with self.assertRaises(HTTPException):
+            security.decode_token(token)
+        self.assertNotIn(token_digest, security.decoded_token_cache)
+
+    def test_decode_token_invalid(self):
+        """decode_token does not cache tokens signed with another key"""
+        token = jwt.encode({"sub": "test_user", "exp": datetime.now(timezone.utc) + timedelta(minutes=1)}, "another-key", algorithm=security.ALGORITHM)
+        with self.assertRaises(HTTPException):
+            security.decode_token(token)
+        self.assertNotIn(hashlib.sha256(token.encode()).digest(), security.decoded_token_cache)
+
+    def test_require_auth_roles_without_current_user(self):
+        """require_auth checks roles even when the endpoint does not declare a current_user parameter"""
+        app = FastAPI()
+
+        @app.get("/admin-only")
+        @security.require_auth(roles=["admin"])
+        async def admin_only(name: str = "admin"):
+            return {"name": name}
+
+        client = TestClient(app)
+        admin_headers = {"Authorization": f"Bearer {security.create_access_token({'sub': 'admin_user', 'roles': ['admin']})}"}
+        user_headers = {"Authorization": f"Bearer {security.create_access_token({'sub': 'user', 'roles': []})}"}
+        self.assertEqual(client.get("/admin-only", params={"name": "x"}, headers=admin_headers).json(), {"name": "x"})
+        self.assertEqual(client.get("/admin-only", headers=user_headers).status_code, 403)
+        self.assertIn(client.get("/admin-only").status_code, (401, 403))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests for /backend/app/core/session_store.py"""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from app.core.session_store import InMemorySessionStore, MongoSessionStore
+from app.models.pydantic_models import UserChallenges
+
+
+class TestInMemorySessionStore(unittest.TestCase):
+    """/backend/app/core/session_store.py tests"""
+
+    def test_submission_interval(self):
+        """try_mark_submitted only accepts a submission once per interval"""
+
+        async def run():
+            store = InMemorySessionStore()
+            await store.create("user", UserChallenges(now_challenge_id="challenge", now_challenge={}))
+            first = await store.try_mark_submitted("user", 100.0, 60)
+            second = await store.try_mark_submitted("user", 130.0, 60)
+            third = await store.try_mark_submitted("user", 160.0, 60)
+            return first, second, third
+
+        self.assertEqual(asyncio.run(run()), (True, False, True))
+
+    def test_append_generated_image(self):
+        """append_generated_image ignores images requested by an abandoned session of the same challenge"""
+
+        async def run():
+            store = InMemorySessionStore()
+            abandoned = await store.create("user", UserChallenges(now_challenge_id="challenge", now_challenge={}))
+            await store.delete("user")
+            restarted = await store.create("user", UserChallenges(now_challenge_id="challenge", now_challenge={}))
+            await store.append_generated_image("user", abandoned.session_id, "gen_abandoned")
+            await store.append_generated_image("user", restarted.session_id, "gen_image")
+            return (await store.get("user")).generated_image
+
+        self.assertEqual(asyncio.run(run()), ["gen_image"])
+
+    def test_revision(self):
+        """record_submission and append_generated_image advance the revision used for ETags"""
+
+        async def run():
+            store = InMemorySessionStore()
+            user_challenge = await store.create("user", UserChallenges(now_challenge_id="challenge", now_challenge={}))
+            revisions = [user_challenge.revision]
+            await store.try_mark_submitted("user", 100.0, 60)
+            revisions.append((await store.get("user")).revision)
+            await store.record_submission("user", {"content": "a cat", "score": 50}, "a cat", 50)
+            revisions.append((await store.get("user")).revision)
+            await store.append_generated_image("user", user_challenge.session_id, "gen_image")
+            revisions.append((await store.get("user")).revision)
+            return revisions, UserChallenges.from_dict(user_challenge.to_dict()).session_id == user_challenge.session_id
+
+        self.assertEqual(asyncio.run(run()), ([0, 0, 1, 2], True))
+
+
+class TestMongoSessionStore(unittest.TestCase):
+    """/backend/app/core/session_store.py MongoDB store tests"""
+
+    def test_append_generated_image_matches_session(self):
+        """append_generated_image only updates the document of the session that requested the image"""
+        with mock.patch("app.core.session_store.db") as db_mock:
+            db_mock.update_user_challenge = mock.AsyncMock(return_value=None)
+            self.assertIsNone(asyncio.run(MongoSessionStore().append_generated_image("user", "abandoned", "gen_image")))
+        db_mock.update_user_challenge.assert_awaited_once_with(
+            "user",
+            {"$push": {"generated_image": "gen_image"}, "$inc": {"revision": 1}},
+            condition={"session_id": "abandoned"},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
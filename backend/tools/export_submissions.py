@@ -0,0 +1,49 @@
+"""
+提出物を分析用にNDJSONまたはCSVでエクスポートするスクリプト
+MongoDBのカーソルで少しずつ読み込むため、提出物の件数によらずメモリ使用量は一定
+
+使用例：
+    cd backend
+    ./venv/Scripts/activate
+    python -m tools.export_submissions --format csv --from 2024-12-01 --to 2024-12-08 --output submissions.csv
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+import sys
+from typing import TextIO
+
+from app.core.mongodb_core import db
+from app.utils.export_utils import EXPORT_FORMATS, create_submission_query, stream_submissions
+
+
+async def write_submissions(args: argparse.Namespace, output: TextIO):
+    """条件に合う提出物を出力先に書き出す"""
+    query = create_submission_query(args.created_from, args.created_to, args.challenge_id)
+    async for chunk in stream_submissions(db.iter_submissions(query, batch_size=args.batch_size), args.format):
+        output.write(chunk)
+
+
+async def export(args: argparse.Namespace):
+    """条件に合う提出物を、指定したファイル（省略時は標準出力）に書き出す"""
+    await db.connect()
+    try:
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as output:
+                await write_submissions(args, output)
+        else:
+            await write_submissions(args, sys.stdout)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="提出物をNDJSONまたはCSVでエクスポートする")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson", help="出力形式")
+    parser.add_argument("--from", dest="created_from", type=datetime.fromisoformat, help="この日時以降に作成された提出物（ISO 8601）")
+    parser.add_argument("--to", dest="created_to", type=datetime.fromisoformat, help="この日時より前に作成された提出物（ISO 8601）")
+    parser.add_argument("--challenge-id", help="チャレンジIDで絞り込む")
+    parser.add_argument("--output", help="出力先のファイル（省略時は標準出力）")
+    parser.add_argument("--batch-size", type=int, default=500, help="MongoDBから1度に読み込む件数")
+    asyncio.run(export(parser.parse_args()))
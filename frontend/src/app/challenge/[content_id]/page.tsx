@@ -103,6 +103,28 @@ export default function ContentPage({ params }: PageProps) {
         if (data.generated_img_url) {
           setGeneratedImageUrl(urlCreator(data.generated_img_url));
         }
+        if (data.image_job_id) {
+          pollImageJob(data.image_job_id);
+        }
+      })
+      .catch((error) => console.error("Error:", error));
+  }
+
+  // 画像生成ジョブが完了するまで状態を確認する
+  function pollImageJob(jobId: string) {
+    fetch(urlCreator("/api/challenges-func/image-job/" + jobId), {
+      method: "GET",
+      headers: {
+        Authorization: `Bearer ${localStorage.getItem("token")}`,
+      },
+    })
+      .then((response) => response.json())
+      .then((data) => {
+        if (data.generated_img_url) {
+          setGeneratedImageUrl(urlCreator(data.generated_img_url));
+        } else if (data.status === "deferred" || data.status === "queued" || data.status === "running") {
+          setTimeout(() => pollImageJob(jobId), 2000);
+        }
       })
       .catch((error) => console.error("Error:", error));
   }
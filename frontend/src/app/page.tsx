@@ -130,7 +130,7 @@ function ChallengeCard({ id, title, description, imgUrl, inProgressChallengeIds
     <div className="group relative block h-48 overflow-hidden rounded-md shadow-lg shadow-gray-500/50">
       {/* 背景画像コンテナ */}
       <div className="absolute inset-0">
-        <div className="absolute inset-0 bg-cover bg-center" style={{ backgroundImage: `url(${urlCreator(imgUrl)})` }} />
+        <div className="absolute inset-0 bg-cover bg-center" style={{ backgroundImage: `url(${urlCreator(imgUrl + "?w=512")})` }} />
         {/* ぼかし効果のオーバーレイ */}
         <div className="absolute inset-0 backdrop-blur-sm bg-white/80" />
       </div>
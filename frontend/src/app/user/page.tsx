@@ -4,22 +4,25 @@ import urlCreator from "@/lib/UrlCreator";
 import React, { useEffect, useState } from "react";
 import Link from "next/link";
 
-type SubmissionDisplayItems = {
+// /api/challenges-func/get-all-submission が返す提出物の概要
+type SubmissionSummary = {
   submission_id: string;
   challenge_id: string;
   created_at: string;
-  images: string[];
-  submissions: Submission[];
+  thumbnail_image?: string; // 最後に生成された画像（画像が無い場合は含まれない）
+  best_score: number | null;
+  submission_count: number;
 };
 
-type Submission = {
-  timestamp: string;
-  score: number;
-  content: string;
+type SubmissionSummaryPage = {
+  submissions: SubmissionSummary[];
+  next_cursor: string | null; // 続きが無い場合はnull
 };
 export default function UserPage() {
   const [username, setUsername] = useState("");
-  const [submissionDataList, setSubmissionDataList] = useState<SubmissionDisplayItems[]>([]);
+  const [submissionDataList, setSubmissionDataList] = useState<SubmissionSummary[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingSubmissions, setIsLoadingSubmissions] = useState(false);
 
   useEffect(() => {
     const fetchUserData = async () => {
@@ -41,8 +44,11 @@ export default function UserPage() {
     fetchUserData();
   }, []);
 
-  useEffect(() => {
-    fetch(urlCreator("/api/challenges-func/get-all-submission"), {
+  // 提出履歴は新しい順に1ページずつ取得し、「もっと見る」で next_cursor の続きを追加する
+  const fetchSubmissions = (cursor: string | null) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+    setIsLoadingSubmissions(true);
+    fetch(urlCreator(`/api/challenges-func/get-all-submission${query}`), {
       method: "GET",
       headers: {
         "Content-Type": "application/json",
@@ -50,10 +56,18 @@ export default function UserPage() {
       },
     })
       .then((response) => response.json())
-      .then((data) => {
-        if (data.submissions) { setSubmissionDataList(data.submissions); }
+      .then((data: SubmissionSummaryPage) => {
+        if (data.submissions) {
+          setSubmissionDataList((previous) => (cursor ? [...previous, ...data.submissions] : data.submissions));
+          setNextCursor(data.next_cursor ?? null);
+        }
       })
-      .catch((error) => console.error("Error:", error));
+      .catch((error) => console.error("Error:", error))
+      .finally(() => setIsLoadingSubmissions(false));
+  };
+
+  useEffect(() => {
+    fetchSubmissions(null);
   }
     , []);
 
@@ -111,6 +125,15 @@ export default function UserPage() {
             </tbody>
           </table>
         }
+        {nextCursor !== null &&
+          <button
+            className="mt-4 py-1 px-4 border rounded bg-gray-100 hover:bg-gray-200 disabled:opacity-50"
+            onClick={() => fetchSubmissions(nextCursor)}
+            disabled={isLoadingSubmissions}
+          >
+            {isLoadingSubmissions ? "読み込み中..." : "もっと見る"}
+          </button>
+        }
         <h2 className={h2style}>英語力測定</h2>
         <p>（未対応です）</p>
       </div>